@@ -2,16 +2,21 @@ import asyncio
 import json
 import logging
 import os
+import time
+import uuid
+from collections import Counter, OrderedDict
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Header, status
 from fastapi.responses import RedirectResponse
 from redis import asyncio as aioredis
-from sqlalchemy import (Boolean, Column, DateTime, Integer, String, select,
-                        update)
+from sqlalchemy import (Boolean, Column, DateTime, Integer, String, case,
+                        delete, func, select, update)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import (AsyncConnection, AsyncSession,
                                     async_sessionmaker, create_async_engine)
 from sqlalchemy_serializer import SerializerMixin
@@ -36,24 +41,81 @@ redis = aioredis.from_url("redis://localhost", encoding="utf-8", decode_response
 _notify_conn = None
 _postgres_listener = None
 
+# Redis keyspace: url:{version}:{key} เก็บข้อมูลของ URL ที่ active
+# แต่ละ warm-up สร้าง version ใหม่ทั้งชุด แล้วสลับ CACHE_VERSION_KEY ไปที่ version นั้นทีเดียว
+CACHE_VERSION_KEY = "urlcache:version"
+INITIAL_CACHE_VERSION = "0"  # version ที่ใช้ก่อน warm-up ครั้งแรกเสร็จ (ยังไม่มี urlcache:version)
+WARMUP_LOCK_KEY = "urlcache:warmup_lock"
+WARMUP_CHUNK_SIZE = int(os.getenv("WARMUP_CHUNK_SIZE", "5000"))  # จำนวนแถวต่อ chunk (server-side cursor + pipeline)
+WARMUP_LOCK_TTL = int(os.getenv("WARMUP_LOCK_TTL", "300"))  # วินาที ต่ออายุทุก chunk
+CACHE_VERSION_REFRESH = float(os.getenv("CACHE_VERSION_REFRESH", "1"))  # worker อ่าน version ที่ active ใหม่ทุกกี่วินาที
+OLD_VERSION_GRACE = float(os.getenv("OLD_VERSION_GRACE", "30"))  # ลบ keyspace ของ version เก่าหลังสลับแล้วกี่วินาที
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))  # วินาที รอก่อนลอง warm-up ใหม่หลังล้มเหลว (เพิ่มเท่าตัวทุกครั้ง)
+WARMUP_RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY", "300"))  # วินาที
+# จำนวนคลิกที่ยังไม่ได้เขียนลง PostgreSQL (hash: key -> จำนวน) แยกจาก record ของ URL
+PENDING_CLICKS_KEY = "clicks:pending"
+# Write-behind ของจำนวนคลิก: clicks:pending ถูก RENAME เป็น clicks:flushing:{batch_id} แล้วเขียนลง PostgreSQL ทีละ batch
+FLUSHING_CLICKS_PREFIX = "clicks:flushing:"
+FLUSH_BATCHES_KEY = "clicks:flush_batches"  # set ของ batch ที่ claim แล้วแต่ยังเขียนไม่เสร็จ
+LAST_FLUSH_KEY = "clicks:last_flush"  # เวลา (unix) ที่ flush สำเร็จล่าสุด
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", "5"))  # flush ทุกกี่วินาที
+CLICK_FLUSH_CHUNK_SIZE = int(os.getenv("CLICK_FLUSH_CHUNK_SIZE", "1000"))  # จำนวน URL ต่อ UPDATE
+CLICK_FLUSH_STALE = float(os.getenv("CLICK_FLUSH_STALE", "60"))  # batch ที่ค้างนานกว่านี้ (วินาที) ให้ worker ใดก็ได้เขียนต่อ
+CLICK_FLUSH_LOG_DAYS = int(os.getenv("CLICK_FLUSH_LOG_DAYS", "7"))  # เก็บประวัติ batch ใน click_flush_batches กี่วัน
+# key ที่ไม่มีหรือไม่ active จำไว้ใน urlmiss:{key} เพื่อไม่ให้ทุก request ไปถึง PostgreSQL
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "30"))  # วินาที
+MISS_LOCK_ENABLED = os.getenv("MISS_LOCK_ENABLED", "false").lower() in ("1", "true", "yes")  # lock ข้าม worker ต่อ key (urllock:{key})
+MISS_LOCK_TTL = float(os.getenv("MISS_LOCK_TTL", "2"))  # วินาที อายุของ lock และเวลาที่ worker อื่นรอ
+# ข้อมูลเต็มของ URL สำหรับ GET /url/{key} เก็บเป็น JSON ใน urlinfo:{key} (ClickFlusher ลบเมื่อ flush คลิกของ key)
+URL_INFO_TTL = int(os.getenv("URL_INFO_TTL", "60"))  # วินาที
+# L1: cache ใน process หน้า Redis สำหรับ key ที่ถูกเรียกบ่อย
+L1_CACHE_SIZE = int(os.getenv("L1_CACHE_SIZE", "10000"))  # จำนวน key สูงสุดต่อ worker (0 = ปิด)
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "10"))  # วินาที ข้อมูลเก่าได้ไม่เกินนี้แม้พลาด invalidation
+LOCAL_CLICK_FLUSH_INTERVAL = float(os.getenv("LOCAL_CLICK_FLUSH_INTERVAL", "1"))  # คลิกที่ L1 ส่งเข้า clicks:pending ทุกกี่วินาที
+INVALIDATION_CHANNEL = "urlcache:invalidate"  # Redis pub/sub: key ที่เปลี่ยน ให้ทุก worker ลบออกจาก L1
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown lifespan."""
 
-    # Run the startup sync to load data into Redis from PostgreSQL
-    await startup_sync()
-
     # Get the Postgres listener and start listening
+    # (ก่อน warm-up เพื่อไม่ให้พลาดการเปลี่ยนแปลงที่เกิดระหว่างโหลด)
     postgres_listener = await get_postgres_listener()
-    
+
     # Start processing notifications for each queue
     processing_tasks = []
     for queue in postgres_listener.listeners:
         task = asyncio.create_task(process_notification(queue))
         processing_tasks.append(task)
 
+    # Drop changed keys from this worker's L1 cache
+    invalidation_task = asyncio.create_task(listen_invalidations())
+
+    # Load data into Redis from PostgreSQL in the background;
+    # the previous version of the cache keeps serving until it is done
+    warmup_task = asyncio.create_task(startup_sync())
+
+    # Write click counts from L1 to Redis and from Redis to PostgreSQL periodically
+    local_clicks.start()
+    await click_flusher.start()
+
     yield  # Run the application
 
+    warmup_task.cancel()
+    try:
+        await warmup_task
+    except asyncio.CancelledError:
+        logging.info("Cache warm-up was cancelled.")
+    await cache_warmer.stop()
+    await local_clicks.stop()
+    await click_flusher.stop()
+
+    invalidation_task.cancel()
+    try:
+        await invalidation_task
+    except asyncio.CancelledError:
+        logging.info("Invalidation listener was cancelled.")
+
     # Stop the listener on application shutdown
     if _postgres_listener and _postgres_listener.listen_task:
         _postgres_listener.listen_task.cancel()
@@ -108,6 +170,18 @@ class URL(Base, SerializerMixin):
     title = Column(String(255))
     favicon_url = Column(String(255))
 
+class ClickFlushBatch(Base):
+    """
+    Click batches already added to urls.clicks, so that a batch left in
+    Redis by a crash is never applied twice (see ClickFlusher).
+    """
+    __tablename__ = "click_flush_batches"
+
+    batch_id = Column(String(64), primary_key=True)
+    urls = Column(Integer)
+    clicks = Column(Integer)
+    applied_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+
 class PostgresListener:
     """
     https://github.com/TCatshoek/fastapi-postgres-sse
@@ -209,36 +283,302 @@ async def process_notification(queue: asyncio.Queue):
 
                 # Sync the URL data to Redis
                 await sync_to_redis(db_url)
+                await publish_invalidation(db_url.key)
                 logging.info(f"Synced URL {db_url.key} to Redis.")
             except Exception as e:
                 logging.error(f"Error processing notification payload: {e}")
 
 
+def record_key(version: str, key: str) -> str:
+    """Redis key of a URL record in the given cache version."""
+    return f"url:{version}:{key}"
+
+
+def negative_key(key: str) -> str:
+    """Redis key marking a key that is not found or inactive (any version)."""
+    return f"urlmiss:{key}"
+
+
+def info_key(key: str) -> str:
+    """Redis key of the full URL data served by GET /url/{key} (any version)."""
+    return f"urlinfo:{key}"
+
+
+class CacheVersion:
+    """
+    The active version of the Redis keyspace, as switched by the last
+    completed warm-up, or INITIAL_CACHE_VERSION until one has completed.
+    Kept in process and re-read from Redis at most every
+    `refresh_interval` seconds, so lookups do not pay an extra round-trip.
+    """
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.value = None
+        self._checked_at = float("-inf")
+
+    async def get(self, refresh: bool = False) -> str:
+        now = time.monotonic()
+        if refresh or now - self._checked_at >= self.refresh_interval:
+            self._switch(await redis.get(CACHE_VERSION_KEY))
+            self._checked_at = now
+        return self.value
+
+    def set(self, value: str):
+        self._switch(value)
+        self._checked_at = time.monotonic()
+
+    def _switch(self, value: Optional[str]):
+        value = value or INITIAL_CACHE_VERSION
+        # version ใหม่มาจาก warm-up ที่อ่าน PostgreSQL ทั้งหมดใหม่ L1 เดิมจึงไม่ใช้ต่อ
+        if self.value is not None and value != self.value:
+            local_cache.clear()
+        self.value = value
+
+
+cache_version = CacheVersion(CACHE_VERSION_REFRESH)
+
+
+NOT_CACHED = object()
+
+
+class LocalCache:
+    """
+    L1 cache in front of Redis: a bounded LRU of key -> target URL (None for
+    keys known to be missing) in this worker. Entries live at most `ttl`
+    seconds; changed keys are dropped sooner through INVALIDATION_CHANNEL
+    (see listen_invalidations), and everything is dropped when the cache
+    version switches.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (target หรือ None, เวลาหมดอายุ)
+        self.evictions = 0
+        self.invalidations = 0
+        self.clears = 0
+
+    def get(self, key: str):
+        """The cached target, None for a missing key, or NOT_CACHED."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return NOT_CACHED
+        target, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return NOT_CACHED
+        self._entries.move_to_end(key)
+        return target
+
+    def set(self, key: str, target: Optional[str]):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (target, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.clears += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "clears": self.clears,
+        }
+
+
+local_cache = LocalCache(L1_CACHE_SIZE, L1_CACHE_TTL)
+
+
+class TierStats:
+    """Hits and misses of each cache tier on the redirect path."""
+    def __init__(self, *tiers: str):
+        self.hits = dict.fromkeys(tiers, 0)
+        self.misses = dict.fromkeys(tiers, 0)
+
+    def hit(self, tier: str):
+        self.hits[tier] += 1
+
+    def miss(self, tier: str):
+        self.misses[tier] += 1
+
+    def stats(self) -> dict:
+        result = {}
+        for tier, hits in self.hits.items():
+            total = hits + self.misses[tier]
+            result[tier] = {
+                "hits": hits,
+                "misses": self.misses[tier],
+                "hit_ratio": round(hits / total, 4) if total else None,
+            }
+        return result
+
+
+tier_stats = TierStats("l1", "redis", "url_info")
+
+
+class LocalClickBuffer:
+    """
+    Clicks served from L1, counted in this worker and added to
+    PENDING_CLICKS_KEY every `interval` seconds with one pipelined HINCRBY
+    per key, so an L1 hit needs no Redis call.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._clicks = Counter()
+        self._task = None
+        self.flushed = 0
+
+    def add(self, key: str):
+        self._clicks[key] += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Final local click flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Local click flush failed: {e}")
+
+    async def flush(self):
+        clicks, self._clicks = self._clicks, Counter()
+        if not clicks:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for key, count in clicks.items():
+                pipe.hincrby(PENDING_CLICKS_KEY, key, count)
+            await pipe.execute()
+        except BaseException:
+            # เก็บไว้ส่งรอบหน้า
+            self._clicks.update(clicks)
+            raise
+        self.flushed += sum(clicks.values())
+
+    def stats(self) -> dict:
+        return {"buffered": sum(self._clicks.values()), "flushed": self.flushed}
+
+
+local_clicks = LocalClickBuffer(LOCAL_CLICK_FLUSH_INTERVAL)
+
+
+async def publish_invalidation(key: str):
+    """Tell every worker to drop `key` from its L1 cache."""
+    await redis.publish(INVALIDATION_CHANNEL, key)
+
+
+async def listen_invalidations():
+    """
+    Drops the keys published on INVALIDATION_CHANNEL from the L1 cache.
+    Messages sent while not subscribed are lost, so L1 is cleared whenever
+    the subscription is (re)established.
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            local_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    local_cache.invalidate(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Invalidation listener failed: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def redirect_record(url) -> dict:
+    """
+    The cached form of a URL: only what the redirect needs, stored as a
+    Redis hash. `url` is a URL object, a result row or any object with the
+    URL columns as attributes. Clicks are counted in PENDING_CLICKS_KEY.
+    """
+    return {"target_url": url.target_url}
+
+
+def info_record(url: URL) -> str:
+    """The full data of a URL as cached for GET /url/{key} (JSON)."""
+    return json.dumps(url.to_dict(), default=str)
+
+
+def queue_record(pipe, name: str, record: Optional[dict]):
+    """Replace (or remove, if `record` is None) a redirect record in a pipeline."""
+    pipe.delete(name)
+    if record is not None:
+        pipe.hset(name, mapping=record)
+
+
+# Redirect ในรอบเดียว: อ่าน target และนับคลิก
+# (KEYS[1] = record, KEYS[2] = PENDING_CLICKS_KEY, KEYS[3] = negative_key, ARGV[1] = key)
+# คืน target, 0 ถ้ารู้แล้วว่าไม่มี key นี้ หรือ nil ถ้าไม่อยู่ใน Redis
+REDIRECT_SCRIPT = redis.register_script("""
+local target = redis.call('HGET', KEYS[1], 'target_url')
+if not target then
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        return 0
+    end
+    return false
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+return target
+""")
+
+
 # Async function to sync data from PostgreSQL to Redis
 async def sync_to_redis(url: URL):
     """
     Syncs the given URL data to Redis.
 
+    Active URLs are written as a redirect record, inactive ones are removed.
+    Writes to the active cache version; while a warm-up is building a new
+    version the change is also kept and replayed into it before the switch.
+    The full data for GET /url/{key} is refreshed the same way, and a
+    negative cache entry for the key is removed.
+
     Args:
         url (URL): The URL object containing the data to sync.
     """
-    url_data = {
-        "id": url.id,
-        "key": url.key,
-        "secret_key": url.secret_key,
-        "target_url": url.target_url,
-        "is_active": url.is_active,
-        "clicks": url.clicks,
-        # Handle both datetime objects and strings
-        "created_at": url.created_at if isinstance(url.created_at, str) else url.created_at.isoformat() if url.created_at else None,
-        "updated_at": url.updated_at if isinstance(url.updated_at, str) else url.updated_at.isoformat() if url.updated_at else None,
-        "api_key": url.api_key,
-        "is_checked": url.is_checked,
-        "status": url.status,
-        "title": url.title,
-        "favicon_url": url.favicon_url
-    }
-    await redis.set(f"url:{url.key}", json.dumps(url_data))
+    record = redirect_record(url) if url.is_active else None
+    version = await cache_version.get()
+    pipe = redis.pipeline(transaction=True)
+    queue_record(pipe, record_key(version, url.key), record)
+    if record is not None:
+        pipe.set(info_key(url.key), info_record(url), ex=URL_INFO_TTL)
+    else:
+        pipe.delete(info_key(url.key))
+    pipe.delete(negative_key(url.key))
+    await pipe.execute()
+    cache_warmer.track_change(url.key, record)
 
 # FastAPI app with lifespan
 app = FastAPI(lifespan=lifespan)
@@ -256,23 +596,6 @@ async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
-# Background task to update PostgreSQL
-async def update_db(key: str):
-    """
-    Background task to update the updated_at timestamp 
-    and increment the click count for a given URL in PostgreSQL.
-
-    Args:
-        key (str): The key of the URL to update.
-    """
-    async with AsyncSessionLocal() as session:
-        stmt = update(URL).where(URL.key == key).values(
-            clicks=URL.clicks + 1,  # Increment the click count
-            updated_at=datetime.now(timezone.utc)
-        )
-        await session.execute(stmt)
-        await session.commit()
-
 async def verify_api_key(x_api_key: str = Header(...)):
     if x_api_key != API_KEY:
         raise HTTPException(
@@ -283,13 +606,16 @@ async def verify_api_key(x_api_key: str = Header(...)):
 
 # Route to redirect to the target URL by key
 @app.get("/{key}")
-async def root_redirect(key: str, background_tasks: BackgroundTasks):
+async def root_redirect(key: str):
     """
-    Redirect to the target URL by key using the get_url function to retrieve the URL data.
+    Redirect to the target URL by key.
+
+    Looks in the L1 cache, then Redis, then PostgreSQL. The click is counted
+    in Redis (through LocalClickBuffer on an L1 hit); ClickFlusher writes it
+    to PostgreSQL.
 
     Args:
         key (str): The key of the URL to redirect.
-        background_tasks (BackgroundTasks): FastAPI background tasks to run asynchronously.
 
     Returns:
         RedirectResponse: Redirects to the target URL if found and active.
@@ -298,37 +624,197 @@ async def root_redirect(key: str, background_tasks: BackgroundTasks):
         HTTPException: If the URL is not found or inactive.
     """
     try:
-        # Retrieve the URL data
-        url_data = await get_url(key)
-        
-        # Update the clicks and updated_at timestamp in Redis
-        url_data["clicks"] += 1
-        url_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-        await redis.set(f"url:{key}", json.dumps(url_data))
+        # L1: no network round-trip
+        target_url = local_cache.get(key)
+        if target_url is not NOT_CACHED:
+            tier_stats.hit("l1")
+            if target_url is None:
+                raise HTTPException(status_code=404, detail="URL not found")
+            local_clicks.add(key)
+            return RedirectResponse(url=target_url)
+        tier_stats.miss("l1")
+
+        # Get the target and count the click in one round-trip
+        version = await cache_version.get()
+        target_url = await REDIRECT_SCRIPT(
+            keys=[record_key(version, key), PENDING_CLICKS_KEY, negative_key(key)], args=[key]
+        )
 
-        # Update PostgreSQL in the background
-        background_tasks.add_task(update_db, key)
+        if target_url == 0:
+            # Known to be missing or inactive
+            tier_stats.hit("redis")
+            url_resolver.negative_hits += 1
+            local_cache.set(key, None)
+            raise HTTPException(status_code=404, detail="URL not found")
+
+        if target_url is None:
+            # Not in Redis: load from PostgreSQL (raises 404), then count the click
+            tier_stats.miss("redis")
+            try:
+                target_url = (await url_resolver.resolve(key))["target_url"]
+            except HTTPException:
+                local_cache.set(key, None)
+                raise
+            await redis.hincrby(PENDING_CLICKS_KEY, key, 1)
+        else:
+            tier_stats.hit("redis")
+        local_cache.set(key, target_url)
 
         # Perform the redirect to the target URL
-        return RedirectResponse(url=url_data["target_url"])
+        return RedirectResponse(url=target_url)
     except HTTPException as e:
         # If the URL is not found, return the exception
         raise e
 
 
+class UrlResolver:
+    """
+    Loads keys that are not in Redis from PostgreSQL, one read per key.
+
+    Concurrent misses for the same key in this process wait for a single
+    load (single-flight), for redirects (resolve) and for GET /url/{key}
+    (resolve_info) alike. With `use_lock` the workers also take a short
+    Redis lock per key on the redirect path: the holder reads PostgreSQL and
+    the others wait for the record it writes, up to `lock_ttl` seconds. Keys
+    that are not found or inactive are remembered in negative_key(key) for
+    `negative_ttl` seconds; sync_to_redis removes that entry when the URL
+    changes.
+    """
+    def __init__(self, negative_ttl: int, use_lock: bool, lock_ttl: float):
+        self.negative_ttl = negative_ttl
+        self.use_lock = use_lock
+        self.lock_ttl = lock_ttl
+        self._loading = {}  # (ชนิด, key) -> task ที่กำลังโหลด
+        self.misses = 0
+        self.coalesced = 0
+        self.db_reads = 0
+        self.negatives_stored = 0
+        self.negative_hits = 0
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+
+    async def resolve(self, key: str) -> dict:
+        """
+        Redirect record of an active URL, for keys that are not in Redis.
+
+        Args:
+            key (str): The key of the URL to retrieve.
+
+        Returns:
+            dict: The redirect record (see redirect_record).
+
+        Raises:
+            HTTPException: If the URL is not found or inactive.
+        """
+        return await self._coalesce(("redirect", key), self._load(key))
+
+    async def resolve_info(self, key: str) -> str:
+        """
+        Full data of an active URL (see info_record), for keys whose copy
+        is not in Redis.
+
+        Raises:
+            HTTPException: If the URL is not found or inactive.
+        """
+        return await self._coalesce(("info", key), self._read_info(key))
+
+    async def _coalesce(self, slot: tuple, load):
+        self.misses += 1
+        task = self._loading.get(slot)
+        if task is None:
+            task = asyncio.create_task(load)
+            self._loading[slot] = task
+            task.add_done_callback(lambda done: self._forget(slot, done))
+        else:
+            load.close()  # ไม่ได้ใช้ coroutine นี้
+            self.coalesced += 1
+        # shield: request ที่ถูกยกเลิกไม่ยกเลิกการโหลดของ request อื่น
+        return await asyncio.shield(task)
+
+    def _forget(self, slot: tuple, task: asyncio.Task):
+        if self._loading.get(slot) is task:
+            del self._loading[slot]
+
+    async def _load(self, key: str) -> dict:
+        if not self.use_lock:
+            return await self._read_db(key)
+
+        lock_key = f"urllock:{key}"
+        token = uuid.uuid4().hex
+        if await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+            try:
+                return await self._read_db(key)
+            finally:
+                await RELEASE_LOCK_SCRIPT(keys=[lock_key], args=[token])
+
+        # worker อื่นกำลังอ่าน key นี้ รอผลที่เขียนลง Redis
+        self.lock_waits += 1
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+            version = await cache_version.get()
+            pipe = redis.pipeline(transaction=False)
+            pipe.exists(negative_key(key))
+            pipe.hgetall(record_key(version, key))
+            missing, record = await pipe.execute()
+            if missing:
+                raise HTTPException(status_code=404, detail="URL not found")
+            if record:
+                return record
+        self.lock_timeouts += 1
+        return await self._read_db(key)
+
+    async def _read_db(self, key: str) -> dict:
+        return redirect_record(await self._fetch(key))
+
+    async def _read_info(self, key: str) -> str:
+        return info_record(await self._fetch(key))
+
+    async def _fetch(self, key: str) -> URL:
+        # อ่าน version ใหม่ เผื่อ version ที่จำไว้ถูกสลับและลบไปแล้ว
+        await cache_version.get(refresh=True)
+        self.db_reads += 1
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(URL).filter(URL.key == key, URL.is_active == True))
+            db_url = result.scalars().first()
+        if db_url is None:
+            await redis.set(negative_key(key), "1", ex=self.negative_ttl)
+            self.negatives_stored += 1
+            raise HTTPException(status_code=404, detail="URL not found")
+        # เขียนทั้ง redirect record และ urlinfo:{key}
+        await sync_to_redis(db_url)
+        return db_url
+
+    def stats(self) -> dict:
+        return {
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "db_reads": self.db_reads,
+            "negative_hits": self.negative_hits,
+            "negatives_stored": self.negatives_stored,
+            "lock_waits": self.lock_waits,
+            "lock_timeouts": self.lock_timeouts,
+            "loading": len(self._loading),
+        }
+
+
+url_resolver = UrlResolver(NEGATIVE_CACHE_TTL, MISS_LOCK_ENABLED, MISS_LOCK_TTL)
+
+
 # Route to get URL by key
 @app.get("/url/{key}")
 async def get_url(key: str):
     """
     Retrieve URL data by key.
 
-    This function checks Redis for the URL data. If found, it updates the click 
-    count and updated_at timestamp in Redis and PostgreSQL asynchronously.
-    If not found in Redis, it retrieves the data from PostgreSQL and syncs it to Redis.
+    Served from the cached copy in info_key(key) when there is one, from
+    PostgreSQL otherwise through url_resolver (one read per key at a time,
+    then cached for URL_INFO_TTL seconds; a missing key is remembered in
+    negative_key(key)). `clicks` includes the clicks waiting for the next
+    flush.
 
     Args:
         key (str): The key of the URL to retrieve.
-        background_tasks (BackgroundTasks): FastAPI background tasks to run asynchronously.
 
     Returns:
         dict: A dictionary containing the URL data.
@@ -336,38 +822,24 @@ async def get_url(key: str):
     Raises:
         HTTPException: If the URL is not found.
     """
-    # Try to get data from Redis
-    url_data = await redis.get(f"url:{key}")
-    if url_data:
-        url_dict = json.loads(url_data)
-        return url_dict
+    pipe = redis.pipeline(transaction=False)
+    pipe.exists(negative_key(key))
+    pipe.get(info_key(key))
+    pipe.hget(PENDING_CLICKS_KEY, key)
+    missing, info, pending = await pipe.execute()
+    if missing:
+        url_resolver.negative_hits += 1
+        raise HTTPException(status_code=404, detail="URL not found")
+
+    if info is not None:
+        tier_stats.hit("url_info")
     else:
-        # If not in Redis, get from PostgreSQL and sync to Redis
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(URL).filter(URL.key == key, URL.is_active == True))
-            db_url = result.scalars().first()
-            if db_url:
-                # Sync to Redis
-                await sync_to_redis(db_url)
-                # Convert db_url to a dictionary
-                return db_url.to_dict()  # Using SerializerMixin's to_dict method
-                # return {
-                #    "id": db_url.id,
-                #    "key": db_url.key,
-                #    "secret_key": db_url.secret_key,
-                #    "target_url": db_url.target_url,
-                #    "is_active": db_url.is_active,
-                #    "clicks": db_url.clicks,
-                #    # Handle both datetime objects and strings
-                #    "created_at": db_url.created_at if isinstance(db_url.created_at, str) else db_url.created_at.isoformat() if db_url.created_at else None,
-                #    "updated_at": db_url.updated_at if isinstance(db_url.updated_at, str) else db_url.updated_at.isoformat() if db_url.updated_at else None,
-                #    "api_key": db_url.api_key,
-                #    "is_checked": db_url.is_checked,
-                #    "status": db_url.status,
-                #    "title": db_url.title,
-                #    "favicon_url": db_url.favicon_url
-                #}
-    raise HTTPException(status_code=404, detail="URL not found")
+        tier_stats.miss("url_info")
+        info = await url_resolver.resolve_info(key)
+
+    url_dict = json.loads(info)
+    url_dict["clicks"] = (url_dict.get("clicks") or 0) + int(pending or 0)
+    return url_dict
 
 # Route to create new URL
 @app.post("/url")
@@ -400,6 +872,7 @@ async def create_url(
     # Sync to Redis in the background if the URL is active
     if db_url.is_active:
         background_tasks.add_task(sync_to_redis, db_url)
+        background_tasks.add_task(publish_invalidation, db_url.key)
     
     return {"message": "URL created successfully", "key": db_url.key}
 
@@ -415,21 +888,357 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+# Compare-and-delete: ปล่อย lock เฉพาะเมื่อยังเป็นของเรา
+RELEASE_LOCK_SCRIPT = redis.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+class CacheWarmer:
+    """
+    Loads every active URL into a fresh version of the Redis keyspace.
+
+    Rows are streamed from PostgreSQL with a server-side cursor, `chunk_size`
+    at a time, and each chunk is written with one pipeline of HSETs. Readers
+    keep using the previous version until CACHE_VERSION_KEY is switched to
+    the new one at the end; changes notified while the new version is being
+    built are replayed into it before and right after the switch. The old
+    version is removed with SCAN + UNLINK once workers have picked up the
+    new one. Only one worker warms up at a time (WARMUP_LOCK_KEY).
+    """
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.building = None  # version ที่กำลังสร้าง
+        self._changes = {}  # key -> record ที่เปลี่ยนระหว่างสร้าง (None = ลบ)
+        self._cleanup_task = None
+        self.state = "idle"
+        self.version = None
+        self.rows = 0
+        self.chunks = 0
+        self.replayed = 0
+        self.started_at = None
+        self.finished_at = None
+        self.elapsed = 0.0
+        self.old_keys_removed = 0
+        self.failures = 0
+
+    def track_change(self, key: str, record: Optional[dict]):
+        if self.building is not None:
+            self._changes[key] = record
+
+    async def _replay_changes(self, version: str):
+        changes, self._changes = self._changes, {}
+        if changes:
+            pipe = redis.pipeline(transaction=False)
+            for key, record in changes.items():
+                queue_record(pipe, record_key(version, key), record)
+            await pipe.execute()
+            self.replayed += len(changes)
+
+    async def run(self):
+        token = uuid.uuid4().hex
+        if not await redis.set(WARMUP_LOCK_KEY, token, nx=True, ex=WARMUP_LOCK_TTL):
+            self.state = "skipped"
+            logging.info("Cache warm-up is already running in another worker.")
+            return
+
+        version = str(time.time_ns())
+        previous = await cache_version.get(refresh=True)
+        self.building = version
+        self._changes = {}
+        self.state = "running"
+        self.version = version
+        self.rows = self.chunks = self.replayed = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        started = time.monotonic()
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.stream(
+                    select(URL.key, URL.target_url)
+                    .where(URL.is_active == True)
+                    .execution_options(yield_per=self.chunk_size)
+                )
+                async for rows in result.partitions():
+                    pipe = redis.pipeline(transaction=False)
+                    for row in rows:
+                        pipe.hset(record_key(version, row.key), mapping=redirect_record(row))
+                    pipe.expire(WARMUP_LOCK_KEY, WARMUP_LOCK_TTL)
+                    await pipe.execute()
+                    self.rows += len(rows)
+                    self.chunks += 1
+                    self.elapsed = time.monotonic() - started
+                    if self.chunks % 10 == 0:
+                        logging.info(f"Cache warm-up {version}: {self.rows} rows ({self.rows / self.elapsed:.0f} rows/s)")
+
+            await self._replay_changes(version)
+            await redis.set(CACHE_VERSION_KEY, version)
+            cache_version.set(version)
+            self.building = None
+            # การเปลี่ยนแปลงที่เขียนไปที่ version เก่าระหว่าง replay กับการสลับ
+            await self._replay_changes(version)
+        except BaseException:
+            self.state = "failed"
+            self.failures += 1
+            raise
+        finally:
+            self.building = None
+            self._changes = {}
+            self.elapsed = time.monotonic() - started
+            await RELEASE_LOCK_SCRIPT(keys=[WARMUP_LOCK_KEY], args=[token])
+
+        self.state = "done"
+        self.finished_at = time.time()
+        logging.info(f"Cache warm-up {version}: {self.rows} rows in {self.elapsed:.1f}s, now active.")
+        self._cleanup_task = asyncio.create_task(self._remove_version(previous))
+
+    async def _remove_version(self, version: str):
+        """
+        Unlink the keys of a replaced version; when that is the initial
+        version, also the unversioned url:{key} keys of older deploys.
+        """
+        await asyncio.sleep(OLD_VERSION_GRACE)
+        patterns = [f"url:{version}:*"]
+        if version == INITIAL_CACHE_VERSION:
+            patterns.append("url:*")
+        batch = []
+        for pattern in patterns:
+            async for name in redis.scan_iter(match=pattern, count=1000):
+                if pattern == "url:*" and name.count(":") != 1:
+                    continue
+                batch.append(name)
+                if len(batch) >= 1000:
+                    self.old_keys_removed += await redis.unlink(*batch)
+                    batch = []
+        if batch:
+            self.old_keys_removed += await redis.unlink(*batch)
+        logging.info(f"Removed cache version {version}: {self.old_keys_removed} keys.")
+
+    async def stop(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "version": self.version,
+            "active_version": cache_version.value,
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "replayed_changes": self.replayed,
+            "rows_per_second": round(self.rows / self.elapsed) if self.elapsed else 0,
+            "elapsed_seconds": round(self.elapsed, 1),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "old_keys_removed": self.old_keys_removed,
+            "failures": self.failures,
+        }
+
+
+cache_warmer = CacheWarmer(WARMUP_CHUNK_SIZE)
+
+
+# Claim คลิกที่ค้างทั้งหมดเป็น batch ใหม่ (KEYS[1] = PENDING_CLICKS_KEY, KEYS[2] = key ของ batch,
+# KEYS[3] = FLUSH_BATCHES_KEY, ARGV[1] = batch_id) redirect ที่ตามมาจะเริ่ม clicks:pending ใหม่
+CLAIM_CLICKS_SCRIPT = redis.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+""")
+
+
+class ClickFlusher:
+    """
+    Write-behind of the click counters in PENDING_CLICKS_KEY to PostgreSQL.
+
+    Every `interval` seconds the pending hash is claimed as a batch by
+    renaming it (CLAIM_CLICKS_SCRIPT), so redirects keep counting into a new
+    hash meanwhile. The batch is applied in one transaction: its id goes into
+    click_flush_batches and the clicks go out as one UPDATE ... CASE per
+    `chunk_size` URLs, together with updated_at. Only then is the batch
+    removed from Redis, together with the cached GET /url/{key} data of its
+    URLs. A batch left behind by a crash stays in
+    FLUSH_BATCHES_KEY and is retried once it is CLICK_FLUSH_STALE seconds
+    old; if its id is already in click_flush_batches it was applied and is
+    only removed. Each batch is added to urls.clicks exactly once.
+    """
+    def __init__(self, interval: float, chunk_size: int):
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._task = None
+        self._pruned_at = 0.0
+        self.batches = 0
+        self.urls = 0
+        self.clicks = 0
+        self.duplicates = 0
+        self.recovered = 0
+        self.errors = 0
+        self.last_flush_at = None
+        self.last_flush_seconds = 0.0
+
+    async def start(self):
+        async with engine.begin() as conn:
+            await conn.run_sync(ClickFlushBatch.__table__.create, checkfirst=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # คลิกที่ยังค้างอยู่เขียนให้หมดก่อนปิด
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Final click flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Click flush failed: {e}")
+
+    async def flush(self):
+        """Retry stale batches, then claim and apply the pending clicks."""
+        started = time.monotonic()
+        for batch_id in await redis.smembers(FLUSH_BATCHES_KEY):
+            if time.time() - int(batch_id.split("-")[0]) / 1e9 >= CLICK_FLUSH_STALE:
+                self.recovered += 1
+                await self._apply(batch_id)
+
+        batch_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        if await CLAIM_CLICKS_SCRIPT(
+            keys=[PENDING_CLICKS_KEY, FLUSHING_CLICKS_PREFIX + batch_id, FLUSH_BATCHES_KEY], args=[batch_id]
+        ):
+            await self._apply(batch_id)
+
+        now = time.time()
+        self.last_flush_at = now
+        self.last_flush_seconds = time.monotonic() - started
+        await redis.set(LAST_FLUSH_KEY, now)
+        if now - self._pruned_at >= 3600:
+            await self._prune_log()
+            self._pruned_at = now
+
+    async def _apply(self, batch_id: str):
+        name = FLUSHING_CLICKS_PREFIX + batch_id
+        counts = {key: int(value) for key, value in (await redis.hgetall(name)).items() if int(value) > 0}
+        if counts:
+            try:
+                async with AsyncSessionLocal() as session, session.begin():
+                    session.add(ClickFlushBatch(batch_id=batch_id, urls=len(counts), clicks=sum(counts.values())))
+                    await session.flush()
+                    now = datetime.now(timezone.utc)
+                    keys = list(counts)
+                    for i in range(0, len(keys), self.chunk_size):
+                        chunk = {key: counts[key] for key in keys[i:i + self.chunk_size]}
+                        await session.execute(
+                            update(URL)
+                            .where(URL.key.in_(chunk))
+                            .values(
+                                clicks=func.coalesce(URL.clicks, 0) + case(chunk, value=URL.key, else_=0),
+                                updated_at=now,
+                            )
+                            .execution_options(synchronize_session=False)
+                        )
+                self.batches += 1
+                self.urls += len(counts)
+                self.clicks += sum(counts.values())
+            except IntegrityError:
+                # batch นี้เขียนลง PostgreSQL ไปแล้วก่อนที่จะลบออกจาก Redis
+                self.duplicates += 1
+                logging.info(f"Click batch {batch_id} was already applied.")
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.delete(name)
+        pipe.srem(FLUSH_BATCHES_KEY, batch_id)
+        if counts:
+            # clicks ใน urlinfo:{key} เก่าแล้ว ให้ GET /url/{key} อ่านใหม่
+            pipe.unlink(*(info_key(key) for key in counts))
+        await pipe.execute()
+
+    async def _prune_log(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(days=CLICK_FLUSH_LOG_DAYS)
+        async with AsyncSessionLocal() as session, session.begin():
+            await session.execute(delete(ClickFlushBatch).where(ClickFlushBatch.applied_at < cutoff))
+
+    async def stats(self) -> dict:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hlen(PENDING_CLICKS_KEY)
+        pipe.scard(FLUSH_BATCHES_KEY)
+        pipe.get(LAST_FLUSH_KEY)
+        pending_urls, unfinished_batches, last_flush = await pipe.execute()
+        return {
+            "pending_urls": pending_urls,
+            "unfinished_batches": unfinished_batches,
+            # คลิกที่รออยู่นานที่สุดรอมาแล้วไม่เกินเท่านี้ (ทุก worker)
+            "lag_seconds": round(time.time() - float(last_flush), 1) if last_flush else None,
+            "batches": self.batches,
+            "urls": self.urls,
+            "clicks": self.clicks,
+            "duplicate_batches": self.duplicates,
+            "recovered_batches": self.recovered,
+            "errors": self.errors,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_seconds": round(self.last_flush_seconds, 3),
+        }
+
+
+click_flusher = ClickFlusher(CLICK_FLUSH_INTERVAL, CLICK_FLUSH_CHUNK_SIZE)
+
+
 # Startup sync function
 async def startup_sync():
     """
     Syncs all active URL data from PostgreSQL to Redis during application startup.
+
+    A failed warm-up is retried after WARMUP_RETRY_DELAY seconds, doubling
+    up to WARMUP_RETRY_MAX_DELAY; meanwhile the current version (possibly
+    INITIAL_CACHE_VERSION) keeps serving and filling on misses.
     """
-    # Delete only keys that start with "url:"
-    keys = await redis.keys("url:*")
-    if keys:
-        await redis.delete(*keys)
-    
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(URL).filter(URL.is_active == True))
-        urls = result.scalars().all()
-        for url in urls:
-            await sync_to_redis(url)
+    delay = WARMUP_RETRY_DELAY
+    while True:
+        try:
+            await cache_warmer.run()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Cache warm-up failed: {e}; retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_DELAY)
+
+
+@app.get("/api/metrics")
+async def get_metrics(_: str = Depends(verify_api_key)):
+    """
+    Cache warm-up progress and other runtime counters.
+    """
+    return {
+        "warmup": cache_warmer.stats(),
+        "click_flush": await click_flusher.stats(),
+        "resolver": url_resolver.stats(),
+        "tiers": tier_stats.stats(),
+        "l1": local_cache.stats(),
+        "local_clicks": local_clicks.stats(),
+    }
 
 async def main():
     """ main """
@@ -0,0 +1,63 @@
+# shortener_app/alembic/env.py
+# Migrations of the short-URL database (DB_URL). Run from shortener_app/:
+#
+#   alembic upgrade head
+#
+# A database created from scratch by create_all() at startup already has the
+# current schema; mark it as migrated with `alembic stamp head` instead.
+
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(APP_DIR)
+sys.path.append(os.path.dirname(APP_DIR))
+
+from config import get_settings  # noqa: E402
+from database import Base  # noqa: E402
+from shortener_app import models  # noqa: E402,F401  (ลงทะเบียนตารางกับ Base.metadata)
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# ใช้ฐานข้อมูลเดียวกับแอป แทนค่า sqlalchemy.url ใน alembic.ini
+config.set_main_option("sqlalchemy.url", get_settings().db_url)
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,34 @@
+"""urls: expires_at column for per-link expiry
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0000'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('urls')}
+    indexes = {index['name'] for index in inspector.get_indexes('urls')}
+
+    if 'expires_at' not in columns:
+        with op.batch_alter_table('urls') as batch_op:
+            batch_op.add_column(sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True))
+    if 'ix_urls_expires_at' not in indexes:
+        op.create_index('ix_urls_expires_at', 'urls', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_urls_expires_at', table_name='urls')
+    with op.batch_alter_table('urls') as batch_op:
+        batch_op.drop_column('expires_at')
@@ -0,0 +1,26 @@
+"""urls: index for /user/urls
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = '0000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('urls')}
+    if 'ix_urls_api_key_id' not in indexes:
+        op.create_index('ix_urls_api_key_id', 'urls', ['api_key', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_urls_api_key_id', table_name='urls')
@@ -0,0 +1,40 @@
+"""scan_records: composite indexes for the latest scan per url
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_scan_records_url_timestamp': ['url', 'timestamp'],
+    'ix_scan_records_url_scan_type_timestamp': ['url', 'scan_type', 'timestamp'],
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {index['name'] for index in sa.inspect(bind).get_indexes('scan_records')}
+    for name, columns in INDEXES.items():
+        if name in existing:
+            continue
+        if bind.dialect.name == 'postgresql':
+            # scan_records ใหญ่ สร้าง index โดยไม่ lock การเขียน
+            with op.get_context().autocommit_block():
+                op.create_index(name, 'scan_records', columns, postgresql_concurrently=True)
+        else:
+            op.create_index(name, 'scan_records', columns)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='scan_records')
@@ -0,0 +1,80 @@
+"""urls: canonical_hash column and (api_key, canonical_hash) index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from canonical import canonical_hash
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_urls_api_key_canonical_hash'
+BACKFILL_CHUNK_SIZE = 1000
+
+urls = sa.table(
+    'urls',
+    sa.column('id', sa.Integer),
+    sa.column('target_url', sa.String),
+    sa.column('canonical_hash', sa.String),
+)
+
+
+def _backfill(bind):
+    # คำนวณ hash ใน python ทีละช่วงของ id (canonical form ทำใน SQL ไม่ได้)
+    # คำนวณใหม่ทุกแถว แถวที่มี hash จาก canonical form แบบเดิม (lowercase ทั้ง URL) จะถูกแก้ด้วย
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(urls.c.id, urls.c.target_url, urls.c.canonical_hash)
+            .where(urls.c.id > last_id)
+            .order_by(urls.c.id)
+            .limit(BACKFILL_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        params = []
+        for row in rows:
+            digest = canonical_hash(row.target_url) if row.target_url else None
+            if digest != row.canonical_hash:
+                params.append({'row_id': row.id, 'hash': digest})
+        if params:
+            bind.execute(
+                urls.update().where(urls.c.id == sa.bindparam('row_id')).values(canonical_hash=sa.bindparam('hash')),
+                params,
+            )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('urls')}
+    indexes = {index['name'] for index in inspector.get_indexes('urls')}
+
+    if 'canonical_hash' not in columns:
+        with op.batch_alter_table('urls') as batch_op:
+            batch_op.add_column(sa.Column('canonical_hash', sa.String(64), nullable=True))
+    _backfill(bind)
+
+    if INDEX in indexes:
+        return
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, 'urls', ['api_key', 'canonical_hash'], postgresql_concurrently=True)
+    else:
+        op.create_index(INDEX, 'urls', ['api_key', 'canonical_hash'])
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name='urls')
+    with op.batch_alter_table('urls') as batch_op:
+        batch_op.drop_column('canonical_hash')
@@ -0,0 +1,31 @@
+"""job_leases: last_run_at column
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # ตารางถูกสร้างโดย create_all ตอนเริ่มแอป ถ้ายังไม่มีจะถูกสร้างพร้อมคอลัมน์นี้
+    if 'job_leases' not in inspector.get_table_names():
+        return
+    if 'last_run_at' not in {column['name'] for column in inspector.get_columns('job_leases')}:
+        with op.batch_alter_table('job_leases') as batch_op:
+            batch_op.add_column(sa.Column('last_run_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job_leases') as batch_op:
+        batch_op.drop_column('last_run_at')
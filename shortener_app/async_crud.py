@@ -0,0 +1,622 @@
+# shortener_app/async_crud.py
+# async versions of the crud.py functions used by the FastAPI routes.
+# crud.py (sync) is still used by scripts and startup tasks.
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, func, or_, select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from canonical import canonical_hash
+
+from . import keygen, models, schemas
+from .crud import (READ_QUERY_RETRY_ATTEMPTS, READ_QUERY_RETRY_DELAY_SECONDS,
+                   logger)
+from .url_cache import CachedURL, url_cache
+
+CREATE_URL_ATTEMPTS = 5
+QUOTA_CLAIM_ATTEMPTS = 5
+
+
+async def _run_critical_read_with_retry(db: AsyncSession, query_name: str, operation):
+    last_error = None
+
+    for attempt in range(1, READ_QUERY_RETRY_ATTEMPTS + 1):
+        try:
+            return await operation()
+        except OperationalError as exc:
+            last_error = exc
+        except DBAPIError as exc:
+            if not getattr(exc, "connection_invalidated", False):
+                raise
+            last_error = exc
+
+        await db.rollback()
+
+        if attempt == READ_QUERY_RETRY_ATTEMPTS:
+            break
+
+        logger.warning(
+            "Retrying critical read query '%s' after database connection error (attempt %s/%s)",
+            query_name,
+            attempt + 1,
+            READ_QUERY_RETRY_ATTEMPTS,
+        )
+        await asyncio.sleep(READ_QUERY_RETRY_DELAY_SECONDS)
+
+    if last_error is not None:
+        raise last_error
+
+    raise RuntimeError(f"Critical read query '{query_name}' failed without an exception")
+
+async def _first(db: AsyncSession, stmt):
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+class URLQuotaExceeded(Exception):
+    """Raised when creating a URL would take an API key past its quota."""
+
+    def __init__(self, quota: int):
+        super().__init__(f"URL quota of {quota} reached")
+        self.quota = quota
+
+
+async def ensure_url_counter(db: AsyncSession, api_key: str) -> None:
+    """Create the url_counters row of ``api_key`` from the current number of
+    active URLs if it does not exist yet (keys created before the counters)."""
+    if await db.get(models.URLCounter, api_key) is not None:
+        return
+    result = await db.execute(
+        select(func.count(models.URL.id)).where(models.URL.api_key == api_key, models.URL.is_active == True)
+    )
+    db.add(models.URLCounter(api_key=api_key, active_urls=result.scalar_one()))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # request อื่นสร้างแถวไปพร้อมกัน
+        await db.rollback()
+
+async def _claim_url_quota(db: AsyncSession, api_key: str, count: int, quota: int | None) -> int:
+    """Add up to ``count`` URLs to the counter of ``api_key`` without passing
+    ``quota`` (None = unlimited), inside the caller's transaction, so the
+    increment commits or rolls back together with the inserted rows.
+    Returns how many were claimed."""
+    if quota is None:
+        await db.execute(
+            update(models.URLCounter)
+            .where(models.URLCounter.api_key == api_key)
+            .values(active_urls=models.URLCounter.active_urls + count)
+            .execution_options(synchronize_session=False)
+        )
+        return count
+
+    for _ in range(QUOTA_CLAIM_ATTEMPTS):
+        current = (await db.execute(
+            select(models.URLCounter.active_urls).where(models.URLCounter.api_key == api_key)
+        )).scalar_one()
+        claim = min(count, quota - current)
+        if claim <= 0:
+            return 0
+        # compare-and-set: ถ้ามีการสร้าง/ลบ URL พร้อมกันจะไม่ตรง ให้อ่านใหม่
+        result = await db.execute(
+            update(models.URLCounter)
+            .where(models.URLCounter.api_key == api_key, models.URLCounter.active_urls == current)
+            .values(active_urls=current + claim)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return claim
+    raise RuntimeError(f"URL counter of '{api_key}' kept changing while claiming quota")
+
+async def _release_url_quota(db: AsyncSession, api_key: str, count: int = 1) -> None:
+    await db.execute(
+        update(models.URLCounter)
+        .where(models.URLCounter.api_key == api_key, models.URLCounter.active_urls >= count)
+        .values(active_urls=models.URLCounter.active_urls - count)
+        .execution_options(synchronize_session=False)
+    )
+
+async def create_db_url(db: AsyncSession, url: schemas.URLBase, api_key: str, quota: int | None = None,
+                        expires_at: datetime | None = None) -> models.URL:
+    ''' create short url; raises URLQuotaExceeded if ``api_key`` already has ``quota`` active URLs '''
+    if api_key:
+        await ensure_url_counter(db, api_key)
+    for attempt in range(1, CREATE_URL_ATTEMPTS + 1):
+        key = url.custom_key if url.custom_key else await keygen.create_unique_key_async(db)
+        secret_key = f"{key}_{keygen.create_random_key(length=8)}"
+
+        # นับ quota ใน transaction เดียวกับการ insert (หลังจองช่วง key ซึ่ง commit แยก)
+        if api_key and await _claim_url_quota(db, api_key, 1, quota) == 0:
+            await db.rollback()
+            raise URLQuotaExceeded(quota)
+
+        db_url = models.URL(
+            target_url=url.target_url,
+            canonical_hash=canonical_hash(url.target_url),
+            key=key,
+            secret_key=secret_key,
+            api_key=api_key,  # Store API key associated with the URL
+            expires_at=expires_at,
+        )
+        db.add(db_url)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # key ที่แจกมาชนกับ key เดิมในตาราง (custom key หรือ key แบบสุ่มรุ่นเก่า) ใช้ค่าถัดไป
+            await db.rollback()
+            if url.custom_key or attempt == CREATE_URL_ATTEMPTS:
+                raise
+            logger.warning("Generated key '%s' is already in use, retrying (attempt %s/%s)",
+                           key, attempt + 1, CREATE_URL_ATTEMPTS)
+            continue
+        await db.refresh(db_url)
+        return db_url
+
+async def create_db_urls(db: AsyncSession, target_urls: list[str], api_key: str, quota: int | None = None) -> list[models.URL]:
+    """Create one short URL per target in a single transaction (no custom keys).
+    Only as many as the quota allows are created, in order; the caller treats
+    the rest as over quota. Falls back to create_db_url per item if a
+    generated key collides."""
+    if not target_urls:
+        return []
+    if api_key:
+        await ensure_url_counter(db, api_key)
+    keys = await keygen.create_unique_keys_async(db, len(target_urls))
+    if api_key:
+        claimed = await _claim_url_quota(db, api_key, len(target_urls), quota)
+        target_urls = target_urls[:claimed]
+        if not target_urls:
+            await db.rollback()
+            return []
+    db_urls = [
+        models.URL(
+            target_url=target_url,
+            canonical_hash=canonical_hash(target_url),
+            key=key,
+            secret_key=f"{key}_{keygen.create_random_key(length=8)}",
+            api_key=api_key,
+        )
+        for key, target_url in zip(keys, target_urls)
+    ]
+    db.add_all(db_urls)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.warning("Generated key collision in a batch of %s URLs, inserting one by one", len(target_urls))
+        created = []
+        for target_url in target_urls:
+            try:
+                created.append(await create_db_url(db, schemas.URLBase(target_url=target_url), api_key, quota))
+            except URLQuotaExceeded:
+                break
+        return created
+    return db_urls
+
+async def get_db_url_by_key(db: AsyncSession, url_key: str) -> models.URL | None:
+    return await _first(
+        db,
+        select(models.URL).where(models.URL.key == url_key, models.URL.is_active),
+    )
+
+async def get_cached_url_by_key(db: AsyncSession, url_key: str) -> CachedURL | None:
+    """Return the redirect data for an active short key, served from the
+    in-process cache when possible and loaded from the database on a miss."""
+    if entry := url_cache.get(url_key):
+        return entry
+
+    db_url = await get_db_url_by_key(db, url_key)
+    if db_url is None:
+        return None
+    return url_cache.put(CachedURL.from_db_url(db_url))
+
+async def get_db_url_by_customkey(db: AsyncSession, url_key: str) -> models.URL | None:
+    return await _first(db, select(models.URL).where(models.URL.key == url_key))
+
+async def get_db_url_by_secret_key(db: AsyncSession, secret_key: str, api_key: str) -> models.URL | None:
+    return await _first(
+        db,
+        select(models.URL).where(
+            models.URL.secret_key == secret_key,
+            models.URL.api_key == api_key,
+            models.URL.is_active,
+        ),
+    )
+
+async def add_db_clicks(db: AsyncSession, clicks: dict[str, int]) -> int:
+    """Add buffered click counts for many keys in a single UPDATE statement."""
+    if not clicks:
+        return 0
+    stmt = (
+        update(models.URL)
+        .where(models.URL.key.in_(list(clicks)))
+        .values(clicks=func.coalesce(models.URL.clicks, 0) + case(clicks, value=models.URL.key, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
+
+async def update_page_info(db: AsyncSession, pages: dict[str, tuple[str, str | None]]) -> int:
+    """Write fetched title/favicon for many keys in a single UPDATE statement."""
+    if not pages:
+        return 0
+    stmt = (
+        update(models.URL)
+        .where(models.URL.key.in_(list(pages)))
+        .values(
+            title=case({key: title for key, (title, _) in pages.items()}, value=models.URL.key),
+            favicon_url=case({key: favicon for key, (_, favicon) in pages.items()}, value=models.URL.key),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
+
+async def deactivate_db_url_by_secret_key(db: AsyncSession, secret_key: str, api_key: str) -> models.URL | None:
+    await ensure_url_counter(db, api_key)
+    db_url = await get_db_url_by_secret_key(db, secret_key, api_key=api_key)
+    if db_url is None:
+        return None
+
+    db_url.is_active = False
+    url_key = db_url.key
+    await _release_url_quota(db, api_key)
+    await db.commit()
+    url_cache.invalidate(key=url_key, secret_key=secret_key)
+    await db.refresh(db_url)
+    return db_url
+
+async def claim_key_block(db: AsyncSession, name: str, block_size: int, min_length: int) -> tuple[int, int]:
+    """Reserve ``block_size`` counter values in one atomic UPDATE ... RETURNING.
+    Returns (key_length, end of the block); the block is [end - block_size, end)."""
+    stmt = (
+        update(models.KeyAllocator)
+        .where(models.KeyAllocator.name == name)
+        .values(next_value=models.KeyAllocator.next_value + block_size)
+        .returning(models.KeyAllocator.key_length, models.KeyAllocator.next_value)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        # ยังไม่มีแถวของตัวนับ สร้างใหม่ (worker อื่นอาจสร้างพร้อมกัน)
+        await db.rollback()
+        db.add(models.KeyAllocator(name=name, key_length=min_length, next_value=0))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+        row = (await db.execute(stmt)).first()
+    await db.commit()
+    return int(row[0]), int(row[1])
+
+async def grow_key_length(db: AsyncSession, name: str, key_length: int) -> bool:
+    """Move the counter to ``key_length + 1`` unless another worker already did
+    (compare-and-set on key_length). Returns True if this call grew it."""
+    result = await db.execute(
+        update(models.KeyAllocator)
+        .where(models.KeyAllocator.name == name, models.KeyAllocator.key_length == key_length)
+        .values(key_length=key_length + 1, next_value=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+async def get_api_key(db: AsyncSession, api_key: str) -> models.APIKey | None:
+    return await _run_critical_read_with_retry(
+        db,
+        "get_api_key",
+        lambda: _first(db, select(models.APIKey).where(models.APIKey.api_key == api_key)),
+    )
+
+async def get_principal(db: AsyncSession, api_key: str) -> tuple[str, int | None, str | None] | None:
+    """(api_key, role_id, role_name) in one query, or None for an unknown key."""
+    stmt = (
+        select(models.APIKey.api_key, models.APIKey.role_id, models.Role.name)
+        .outerjoin(models.Role, models.Role.id == models.APIKey.role_id)
+        .where(models.APIKey.api_key == api_key)
+        .limit(1)
+    )
+
+    async def operation():
+        row = (await db.execute(stmt)).first()
+        return tuple(row) if row else None
+
+    return await _run_critical_read_with_retry(db, "get_principal", operation)
+
+async def get_role_id(db: AsyncSession, api_key: str) -> int | None:
+    api_key_data = await _run_critical_read_with_retry(
+        db,
+        "get_role_id",
+        lambda: _first(db, select(models.APIKey).where(models.APIKey.api_key == api_key)),
+    )
+    if api_key_data:
+        return api_key_data.role_id
+    return None
+
+async def get_role_name(api_db: AsyncSession, role_id: int) -> str | None:
+    role = await _run_critical_read_with_retry(
+        api_db,
+        "get_role_name",
+        lambda: _first(api_db, select(models.Role).where(models.Role.id == role_id)),
+    )
+    if role:
+        return role.name
+    return None
+
+async def is_url_existing_for_key(db: AsyncSession, target_url: str, api_key: str) -> models.URL | None:
+    """Checks if a URL exists for a given target_url and api_key.
+    Matches on the canonical hash, so other encodings of the same URL count.
+    Returns the URL object if found, or None if not found."""
+    return await _first(
+        db,
+        select(models.URL).where(
+            models.URL.api_key == api_key,
+            models.URL.canonical_hash == canonical_hash(target_url),
+            models.URL.is_active,
+        ),
+    )
+
+async def get_existing_urls_for_key(db: AsyncSession, target_urls: list[str], api_key: str) -> dict[str, models.URL]:
+    """Set-based version of is_url_existing_for_key: target_url -> URL for
+    the active URLs of ``api_key`` among ``target_urls``."""
+    if not target_urls:
+        return {}
+    hashes = {}
+    for target_url in target_urls:
+        hashes.setdefault(canonical_hash(target_url), []).append(target_url)
+    result = await db.execute(
+        select(models.URL).where(
+            models.URL.api_key == api_key,
+            models.URL.canonical_hash.in_(hashes),
+            models.URL.is_active,
+        )
+    )
+    existing = {}
+    for db_url in result.scalars():
+        for target_url in hashes[db_url.canonical_hash]:
+            existing.setdefault(target_url, db_url)
+    return existing
+
+async def get_blacklisted_urls(db: AsyncSession, urls: list[str]) -> set[str]:
+    """Set-based version of is_url_in_blacklist."""
+    if not urls:
+        return set()
+
+    async def operation():
+        result = await db.execute(
+            select(models.Blacklist.url).where(models.Blacklist.url.in_(urls), models.Blacklist.status.isnot(False))
+        )
+        return set(result.scalars())
+
+    return await _run_critical_read_with_retry(db, "get_blacklisted_urls", operation)
+
+async def is_url_in_blacklist(db: AsyncSession, url: str) -> bool:
+    """Checks if a URL is in the blacklist."""
+    async def operation():
+        return await _first(
+            db,
+            select(models.Blacklist.id).where(models.Blacklist.url == url, models.Blacklist.status.isnot(False)),
+        ) is not None
+
+    return await _run_critical_read_with_retry(db, "is_url_in_blacklist", operation)
+
+async def get_blacklist_fingerprint(db: AsyncSession) -> tuple[int, int, int, int]:
+    """(max id, row count, active row count, sum of active ids) of the blacklist.
+    Cheap to compute and changes on every insert, delete or status toggle."""
+    result = await db.execute(
+        select(
+            func.coalesce(func.max(models.Blacklist.id), 0),
+            func.count(models.Blacklist.id),
+            func.coalesce(func.sum(case((models.Blacklist.status.isnot(False), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((models.Blacklist.status.isnot(False), models.Blacklist.id), else_=0)), 0),
+        )
+    )
+    return tuple(int(value) for value in result.one())
+
+async def get_blacklist_rows(db: AsyncSession, after_id: int = 0) -> list[tuple[int, str, bool]]:
+    """(id, url, status) of blacklist rows with an id greater than ``after_id``."""
+    result = await db.execute(
+        select(models.Blacklist.id, models.Blacklist.url, models.Blacklist.status)
+        .where(models.Blacklist.id > after_id)
+        .order_by(models.Blacklist.id)
+    )
+    # status ที่เป็น NULL ถือว่า active (ค่า default ของคอลัมน์คือ True)
+    return [(row_id, url, row_status is not False) for row_id, url, row_status in result.all()]
+
+USER_URL_COLUMNS = (
+    models.URL.id, models.URL.key, models.URL.secret_key, models.URL.target_url, models.URL.is_active,
+    models.URL.clicks, models.URL.created_at, models.URL.updated_at, models.URL.is_checked,
+    models.URL.status, models.URL.title, models.URL.favicon_url, models.URL.expires_at,
+)
+
+async def get_user_urls_page(
+    db: AsyncSession,
+    api_key: str,
+    after: int | None = None,
+    limit: int | None = None,
+    status: str | None = None,
+    is_checked: bool | None = None,
+) -> list:
+    """Active URLs of ``api_key`` ordered by id (creation order), only the
+    columns of schemas.URLUser. ``after`` is the id of the last row already
+    returned (keyset pagination). The key is the id alone: created_at is
+    stored with a different precision per dialect (SQLite keeps whole
+    seconds), so comparing it against a decoded cursor is unreliable."""
+    stmt = select(*USER_URL_COLUMNS).where(models.URL.api_key == api_key, models.URL.is_active == True)
+    if after is not None:
+        stmt = stmt.where(models.URL.id > after)
+    if status is not None:
+        stmt = stmt.where(models.URL.status == status)
+    if is_checked is not None:
+        stmt = stmt.where(models.URL.is_checked == is_checked)
+    stmt = stmt.order_by(models.URL.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    result = await db.execute(stmt)
+    return list(result.all())
+
+async def get_latest_scan_records(
+    db: AsyncSession, api_key: str, urls: list[str], scan_type: str | None = None
+) -> list[models.scan_records]:
+    """Latest scan record per URL for those of ``urls`` that are active URLs of
+    ``api_key``, in one query (row_number over the url/timestamp index)."""
+    if not urls:
+        return []
+    owned = select(models.URL.target_url).where(
+        models.URL.api_key == api_key,
+        models.URL.is_active == True,
+        models.URL.target_url.in_(urls),
+    )
+    ranked = select(
+        models.scan_records.id,
+        func.row_number().over(
+            partition_by=models.scan_records.url,
+            order_by=(models.scan_records.timestamp.desc(), models.scan_records.id.desc()),
+        ).label("rank"),
+    ).where(models.scan_records.url.in_(owned))
+    if scan_type:
+        ranked = ranked.where(models.scan_records.scan_type == scan_type)
+    ranked = ranked.subquery()
+    result = await db.execute(
+        select(models.scan_records)
+        .join(ranked, models.scan_records.id == ranked.c.id)
+        .where(ranked.c.rank == 1)
+    )
+    return list(result.scalars().all())
+
+async def get_url_count(db: AsyncSession, api_key: str) -> int:
+    """Active URLs of ``api_key`` from url_counters (one primary-key read)."""
+    await ensure_url_counter(db, api_key)
+    result = await db.execute(
+        select(models.URLCounter.active_urls).where(models.URLCounter.api_key == api_key)
+    )
+    return result.scalar_one()
+
+async def acquire_job_lease(db: AsyncSession, name: str, holder: str, ttl: float) -> bool:
+    """Take or renew the lease of job ``name`` for ``ttl`` seconds. Succeeds
+    if ``holder`` already has it or the current lease has expired."""
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(models.JobLease)
+        .where(
+            models.JobLease.name == name,
+            or_(models.JobLease.holder == holder, models.JobLease.expires_at < now),
+        )
+        .values(holder=holder, expires_at=now + timedelta(seconds=ttl))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        await db.commit()
+        return True
+    if await db.get(models.JobLease, name) is not None:
+        await db.rollback()
+        return False
+    db.add(models.JobLease(name=name, holder=holder, expires_at=now + timedelta(seconds=ttl)))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # worker อื่นสร้างแถวไปพร้อมกัน
+        await db.rollback()
+        return False
+    return True
+
+async def get_job_last_run(db: AsyncSession, name: str) -> datetime | None:
+    result = await db.execute(select(models.JobLease.last_run_at).where(models.JobLease.name == name))
+    return result.scalar_one_or_none()
+
+async def record_job_run(db: AsyncSession, name: str, holder: str, started_at: datetime) -> None:
+    """Record the start of a run of job ``name`` while ``holder`` has the lease."""
+    await db.execute(
+        update(models.JobLease)
+        .where(models.JobLease.name == name, models.JobLease.holder == holder)
+        .values(last_run_at=started_at)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+async def release_job_lease(db: AsyncSession, name: str, holder: str) -> None:
+    await db.execute(
+        update(models.JobLease)
+        .where(models.JobLease.name == name, models.JobLease.holder == holder)
+        .values(expires_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+async def _url_chunks(db: AsyncSession, conditions, chunk_size: int, apply, release_quota: bool = False) -> int:
+    """Select up to ``chunk_size`` URLs matching ``conditions``, run
+    ``apply(ids)`` on them and commit; repeat until no rows are left. Each
+    chunk is its own short transaction. With ``release_quota`` the
+    url_counters of the owners are decremented in the same transaction."""
+    total = 0
+    while True:
+        rows = (await db.execute(
+            select(models.URL.id, models.URL.key, models.URL.api_key)
+            .where(*conditions).order_by(models.URL.id).limit(chunk_size)
+        )).all()
+        if not rows:
+            return total
+        await db.execute(apply([row.id for row in rows]).execution_options(synchronize_session=False))
+        if release_quota:
+            owners: dict[str, int] = {}
+            for row in rows:
+                if row.api_key:
+                    owners[row.api_key] = owners.get(row.api_key, 0) + 1
+            for api_key, count in owners.items():
+                await _release_url_quota(db, api_key, count)
+        await db.commit()
+        url_cache.invalidate_many([row.key for row in rows])
+        total += len(rows)
+        if len(rows) < chunk_size:
+            return total
+        await asyncio.sleep(0)
+
+async def expire_urls(db: AsyncSession, chunk_size: int) -> int:
+    """Deactivate active URLs whose expires_at has passed (range scan on the
+    expires_at index), ``chunk_size`` rows per UPDATE."""
+    now = datetime.now(timezone.utc)
+    return await _url_chunks(
+        db,
+        (
+            models.URL.expires_at <= now,
+            models.URL.is_active == True,
+        ),
+        chunk_size,
+        lambda ids: update(models.URL).where(models.URL.id.in_(ids)).values(is_active=False),
+        release_quota=True,
+    )
+
+async def deactivate_expired_urls(db: AsyncSession, expiry_timedelta: timedelta, chunk_size: int) -> int:
+    """Deactivate guest URLs without expires_at (created before the column)
+    older than ``expiry_timedelta``, ``chunk_size`` rows per UPDATE.
+    Returns the number of rows deactivated."""
+    current_time = datetime.now()  # ใช้ offset-naive datetime เพื่อให้สอดคล้องกับเวลาที่บันทึกในฐานข้อมูล
+    return await _url_chunks(
+        db,
+        (
+            models.URL.api_key == None,  # URLs created by guest
+            models.URL.expires_at == None,
+            models.URL.is_active == True,
+            models.URL.created_at < current_time - expiry_timedelta,
+        ),
+        chunk_size,
+        lambda ids: update(models.URL).where(models.URL.id.in_(ids)).values(is_active=False),
+    )
+
+async def remove_expired_urls(db: AsyncSession, expiry_timedelta: timedelta, chunk_size: int) -> int:
+    """Delete guest URLs older than ``expiry_timedelta``, ``chunk_size`` rows
+    per DELETE. Returns the number of rows deleted."""
+    current_time = datetime.now()  # ใช้ offset-naive datetime เพื่อให้สอดคล้องกับเวลาที่บันทึกในฐานข้อมูล
+    return await _url_chunks(
+        db,
+        (
+            models.URL.api_key == None,  # URLs created by guest
+            models.URL.created_at < current_time - expiry_timedelta,
+        ),
+        chunk_size,
+        lambda ids: delete(models.URL).where(models.URL.id.in_(ids)),
+    )
@@ -0,0 +1,82 @@
+# Benchmark: POST /url one by one vs POST /url/batch.
+#
+#   python shortener_app/benchmarks/bench_batch_create.py [count]
+#
+# Runs the app in-process (httpx ASGITransport) against throwaway SQLite
+# databases and reports links/sec for both paths. Target for /url/batch:
+# at least 2,000 links/sec on a laptop-class machine with SQLite.
+# Run from the repository root.
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# ฐานข้อมูลชั่วคราว ต้องกำหนดก่อน import config
+_tmp = tempfile.mkdtemp(prefix="bench_batch_")
+os.environ["DB_URL"] = f"sqlite:///{_tmp}/shortener.db"
+os.environ["DB_API"] = f"sqlite:///{_tmp}/apikey.db"
+os.environ["DB_BLACKLIST"] = f"sqlite:///{_tmp}/blacklist.db"
+# วัดความเร็วการสร้าง ไม่ให้ quota และ rate limit ของ role User ตัดจำนวน request
+os.environ["URL_QUOTA_USER"] = "0"
+os.environ["RATE_LIMIT_USER"] = ""
+
+# Add repo root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import httpx
+
+# main ต้อง import ก่อน เพราะเพิ่ม shortener_app/ เข้า sys.path ให้ crud และ models
+from shortener_app.main import SessionAPI, app
+from shortener_app import crud, models
+from phishing import phishing_data
+
+API_KEY = "bench-api-key"
+TARGET_LINKS_PER_SEC = 2000
+
+
+def setup_api_key():
+    with SessionAPI() as db:
+        crud.insert_roles(db)
+        db.add(models.APIKey(api_key=API_KEY, role_id=1))
+        db.commit()
+    # ไม่ให้ check_phishing ไปดึง feed จาก internet ระหว่าง benchmark
+    phishing_data.last_update_time = datetime.now()
+    # ASGITransport ไม่รัน lifespan จึงไม่มี enrichment worker ดึง title/favicon ระหว่างวัด
+
+
+async def run(count: int):
+    headers = {"X-API-KEY": API_KEY}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        urls = [f"https://example.com/single/{i}" for i in range(count)]
+        start = time.perf_counter()
+        for url in urls:
+            response = await client.post("/url", json={"target_url": url}, headers=headers)
+            assert response.status_code == 200, response.text
+        single = count / (time.perf_counter() - start)
+
+        body = "\n".join(json.dumps({"target_url": f"https://example.com/batch/{i}"}) for i in range(count))
+        start = time.perf_counter()
+        response = await client.post(
+            "/url/batch", content=body,
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+        )
+        batch = count / (time.perf_counter() - start)
+        lines = response.text.splitlines()
+        summary = json.loads(lines[-1])["summary"]
+        assert summary["created"] == count, summary
+
+    print(f"links:                  {count}")
+    print(f"POST /url one by one:   {single:,.0f} links/sec")
+    print(f"POST /url/batch NDJSON: {batch:,.0f} links/sec ({batch / single:.1f}x)")
+    print(f"target:                 {TARGET_LINKS_PER_SEC:,} links/sec -> "
+          f"{'OK' if batch >= TARGET_LINKS_PER_SEC else 'BELOW TARGET'}")
+
+
+if __name__ == "__main__":
+    setup_api_key()
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,86 @@
+# Benchmark: phishing feed lookup, old list scan vs PhishingMatcher.
+#
+#   python shortener_app/benchmarks/bench_phishing.py [entries]
+#
+# Builds a synthetic feed (half full URLs, half bare domains like the
+# OpenPhish / Phishing Army mix), then reports build time, memory and the
+# per-lookup cost for hits and misses.
+
+import random
+import string
+import sys
+import os
+import time
+import tracemalloc
+
+# Add shortener_app to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from phishing import PhishingMatcher
+
+
+def random_label(rng, length=10):
+    return "".join(rng.choices(string.ascii_lowercase + string.digits, k=length))
+
+
+def make_feed(n, rng):
+    feed = []
+    for i in range(n):
+        domain = f"{random_label(rng)}.{rng.choice(['com', 'net', 'xyz', 'co.th'])}"
+        if i % 2:
+            feed.append(domain)
+        else:
+            feed.append(f"https://{domain}/{random_label(rng, 6)}/login.php")
+    return feed
+
+
+def time_lookups(check, urls, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            check(url)
+    elapsed = time.perf_counter() - start
+    return elapsed / (len(urls) * repeat) * 1e6  # microseconds
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+    feed = make_feed(n, rng)
+
+    hits = [rng.choice(feed[0::2]) for _ in range(5000)]  # exact URLs
+    hits += [f"https://login.{rng.choice(feed[1::2])}/x" for _ in range(5000)]  # subdomains
+    misses = [f"https://{random_label(rng)}.com/{random_label(rng, 6)}" for _ in range(10000)]
+
+    start = time.perf_counter()
+    matcher = PhishingMatcher(feed)
+    build_seconds = time.perf_counter() - start
+
+    # วัดหน่วยความจำแยกอีกรอบ เพราะ tracemalloc ทำให้การสร้างช้าลงมาก
+    tracemalloc.start()
+    measured = PhishingMatcher(feed)
+    matcher_bytes = tracemalloc.get_traced_memory()[0]
+    del measured
+    tracemalloc.stop()
+
+    assert all(url in matcher for url in hits)
+    assert not any(url in matcher for url in misses)
+
+    print(f"entries:              {n:,}")
+    print(f"matcher build:        {build_seconds:.2f} s")
+    print(f"matcher memory:       {matcher_bytes / 1024 / 1024:.1f} MiB")
+    print(f"matcher hit lookup:   {time_lookups(matcher.match, hits, repeat=5):.2f} us")
+    print(f"matcher miss lookup:  {time_lookups(matcher.match, misses, repeat=5):.2f} us")
+
+    # รูปแบบเดิม: list ของสตริง + `url in list`
+    tracemalloc.start()
+    old_list = list(set(feed))
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sample = misses[:20]
+    print(f"list memory:          {(list_bytes + sum(sys.getsizeof(u) for u in feed)) / 1024 / 1024:.1f} MiB")
+    print(f"list miss lookup:     {time_lookups(lambda url: url in old_list, sample):.2f} us")
+
+
+if __name__ == "__main__":
+    main()
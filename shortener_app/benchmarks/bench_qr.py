@@ -0,0 +1,84 @@
+# Benchmark: QR code rendering, putpixel loop vs qr_render.
+#
+#   python shortener_app/benchmarks/bench_qr.py [iterations]
+#
+# Compares the old per-pixel renderer with qr_render on cold calls
+# (cache cleared, every URL new) and warm calls (same URL again), for the
+# plain QR of shortener_app and the logo QR of user_management.
+
+import base64
+import io
+import os
+import sys
+import time
+
+# Add repo root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from PIL import Image
+from qrcodegen import QrCode
+
+from shortener_app import qr_render
+
+LOGO_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'user_management', 'app', 'static', '01_NT-Logo.png'))
+
+
+def legacy_generate_qr_code(data, ecc=QrCode.Ecc.MEDIUM, scale=5):
+    # renderer เดิม (putpixel ทีละ pixel)
+    qr = QrCode.encode_text(data, ecc)
+    size = qr.get_size()
+    img_size = size * scale
+    img = Image.new('1', (img_size, img_size), 'white')
+
+    for y in range(size):
+        for x in range(size):
+            if qr.get_module(x, y):
+                for dy in range(scale):
+                    for dx in range(scale):
+                        img.putpixel((x * scale + dx, y * scale + dy), 0)
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def per_call_ms(func, urls):
+    start = time.perf_counter()
+    for url in urls:
+        func(url)
+    return (time.perf_counter() - start) / len(urls) * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    urls = [f"https://kaebmoo.com/{i:06d}Ab" for i in range(n)]
+
+    # ผลลัพธ์ต้องเป็นภาพเดียวกับ renderer เดิม
+    for url in urls[:20]:
+        old = Image.open(io.BytesIO(base64.b64decode(legacy_generate_qr_code(url))))
+        new = qr_render.render_qr_image(url, QrCode.Ecc.MEDIUM, 5)
+        assert old.tobytes() == new.tobytes(), url
+
+    print(f"urls: {n}")
+    print(f"legacy  scale=5:          {per_call_ms(legacy_generate_qr_code, urls):.2f} ms")
+    print(f"legacy  scale=8 QUARTILE: "
+          f"{per_call_ms(lambda u: legacy_generate_qr_code(u, QrCode.Ecc.QUARTILE, 8), urls):.2f} ms")
+
+    qr_render._render_png_base64.cache_clear()
+    print(f"new     scale=5 cold:     {per_call_ms(qr_render.qr_code_base64, urls):.2f} ms")
+    print(f"new     scale=5 warm:     {per_call_ms(qr_render.qr_code_base64, urls):.4f} ms")
+
+    if os.path.exists(LOGO_PATH):
+        def with_logo(url):
+            return qr_render.qr_code_base64(url, QrCode.Ecc.QUARTILE, 8, logo_path=LOGO_PATH)
+
+        qr_render._render_png_base64.cache_clear()
+        print(f"new     scale=8 logo cold: {per_call_ms(with_logo, urls):.2f} ms")
+        print(f"new     scale=8 logo warm: {per_call_ms(with_logo, urls):.4f} ms")
+
+    print(qr_render.qr_cache_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Benchmark and page-walk check for GET /user/urls.
+#
+#   python shortener_app/benchmarks/bench_user_urls.py [count] [limit]
+#
+# Creates `count` links in one second-wide burst (POST /url/batch) against
+# throwaway SQLite databases, then walks every page of GET /user/urls with
+# X-Next-Cursor and the NDJSON export, and checks that each link comes back
+# exactly once, in creation order. Reports rows/sec for both.
+# Run from the repository root.
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# ฐานข้อมูลชั่วคราว ต้องกำหนดก่อน import config
+_tmp = tempfile.mkdtemp(prefix="bench_user_urls_")
+os.environ["DB_URL"] = f"sqlite:///{_tmp}/shortener.db"
+os.environ["DB_API"] = f"sqlite:///{_tmp}/apikey.db"
+os.environ["DB_BLACKLIST"] = f"sqlite:///{_tmp}/blacklist.db"
+# ไม่ให้ quota และ rate limit ของ role User ตัดจำนวน request
+os.environ["URL_QUOTA_USER"] = "0"
+os.environ["RATE_LIMIT_USER"] = ""
+
+# Add repo root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import httpx
+
+# main ต้อง import ก่อน เพราะเพิ่ม shortener_app/ เข้า sys.path ให้ crud และ models
+from shortener_app.main import SessionAPI, app
+from shortener_app import crud, models
+from phishing import phishing_data
+
+API_KEY = "bench-api-key"
+
+
+def setup_api_key():
+    with SessionAPI() as db:
+        crud.insert_roles(db)
+        db.add(models.APIKey(api_key=API_KEY, role_id=1))
+        db.commit()
+    # ไม่ให้ไปดึง phishing feed จาก internet ระหว่าง benchmark
+    phishing_data.last_update_time = datetime.now()
+
+
+async def run(count: int, limit: int):
+    headers = {"X-API-KEY": API_KEY}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post(
+            "/url/batch", json=[f"https://example.com/page/{i}" for i in range(count)], headers=headers,
+        )
+        summary = json.loads(response.text.splitlines()[-1])["summary"]
+        assert summary["created"] == count, summary
+
+        # ทุกหน้าด้วย cursor
+        keys, pages, cursor = [], 0, None
+        start = time.perf_counter()
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/user/urls", params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            keys.extend(row["key"] for row in response.json())
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        paged = len(keys) / (time.perf_counter() - start)
+        assert len(keys) == count and len(set(keys)) == count, (len(keys), len(set(keys)))
+
+        # export NDJSON (หลาย chunk ของ USER_URLS_STREAM_CHUNK)
+        start = time.perf_counter()
+        response = await client.get("/user/urls", params={"format": "ndjson"}, headers=headers)
+        exported = [json.loads(line)["key"] for line in response.text.splitlines()]
+        streamed = len(exported) / (time.perf_counter() - start)
+        assert exported == keys, (len(exported), len(keys))
+
+    print(f"links:                  {count}")
+    print(f"pages (limit={limit}):  {pages}, {paged:,.0f} rows/sec")
+    print(f"NDJSON export:          {streamed:,.0f} rows/sec")
+    print("every link returned exactly once: OK")
+
+
+if __name__ == "__main__":
+    setup_api_key()
+    asyncio.run(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
@@ -0,0 +1,94 @@
+# shortener_app/blacklist_snapshot.py
+
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from canonical import canonical_hash
+from config import get_settings
+
+from . import async_crud
+
+
+class BlacklistSnapshot:
+    """In-memory copy of the active blacklist URLs.
+
+    The blacklist is edited rarely (admin pages in user_management), so
+    create_url checks a set instead of querying the blacklist database.
+    The set holds canonical hashes (canonical.py), so a blacklisted URL is
+    also caught under a different encoding.
+    ``refresh()`` compares a fingerprint of the table (max id, row count,
+    active count, sum of active ids) with the one the snapshot was built
+    from; new rows above the id watermark are loaded incrementally, any
+    other change (delete, status toggle) triggers a full reload.
+    """
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self._hashes: frozenset[str] = frozenset()
+        self._fingerprint = None
+        self.watermark = 0  # id สูงสุดที่โหลดแล้ว
+        self.loaded_at = None  # เวลาที่ snapshot ตรงกับฐานข้อมูลล่าสุด
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.failures = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._fingerprint is not None
+
+    def __contains__(self, url: str) -> bool:
+        return canonical_hash(url) in self._hashes
+
+    async def refresh(self, db: AsyncSession) -> None:
+        fingerprint = await async_crud.get_blacklist_fingerprint(db)
+        if fingerprint == self._fingerprint:
+            self.loaded_at = time.time()
+            return
+
+        if self._fingerprint is not None and await self._load_new_rows(db, fingerprint):
+            self.incremental_reloads += 1
+        else:
+            rows = await async_crud.get_blacklist_rows(db)
+            self._hashes = frozenset(canonical_hash(url) for _, url, active in rows if active)
+            self.watermark = fingerprint[0]
+            self.full_reloads += 1
+
+        # fingerprint ที่อ่านก่อนโหลดแถว ถ้ามีการเปลี่ยนระหว่างนั้นรอบถัดไปจะโหลดใหม่
+        self._fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+    async def _load_new_rows(self, db: AsyncSession, fingerprint) -> bool:
+        """Apply rows inserted since the last load. Returns False when the
+        change is not insert-only and a full reload is needed."""
+        max_id, count, active_count, active_id_sum = fingerprint
+        old_max_id, old_count, old_active_count, old_active_id_sum = self._fingerprint
+        if max_id < old_max_id:
+            return False
+
+        rows = [row for row in await async_crud.get_blacklist_rows(db, after_id=self.watermark) if row[0] <= max_id]
+        active = [(row_id, url) for row_id, url, is_active in rows if is_active]
+        if (old_count + len(rows) != count
+                or old_active_count + len(active) != active_count
+                or old_active_id_sum + sum(row_id for row_id, _ in active) != active_id_sum):
+            return False
+
+        if active:
+            self._hashes = self._hashes | {canonical_hash(url) for _, url in active}
+        self.watermark = max_id
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "size": len(self._hashes),
+            "watermark": self.watermark,
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "reload_interval_seconds": self.reload_interval,
+            "full_reloads": self.full_reloads,
+            "incremental_reloads": self.incremental_reloads,
+            "failures": self.failures,
+        }
+
+
+blacklist_snapshot = BlacklistSnapshot(reload_interval=get_settings().blacklist_reload_interval)
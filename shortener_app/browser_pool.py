@@ -0,0 +1,264 @@
+# shortener_app/browser_pool.py
+# Long-lived pool of headless browsers for screenshots/previews.
+#
+# The pool runs its own event loop in a daemon thread, so it can be shared by
+# FastAPI (shortener_app) and by the Flask apps (user_management, safe_view)
+# that call capture_screenshot() through asyncio.run() on every request.
+# This module must only depend on playwright and the standard library.
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from typing import NamedTuple, Optional
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolFull(Exception):
+    """Raised when the pool's wait queue is full."""
+
+
+class ScreenshotResult(NamedTuple):
+    path: str
+    url: str  # final URL after redirects
+    status: Optional[int]
+
+
+class _BrowserHandle:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.pages = 0
+        self.retired = False
+
+
+class BrowserPool:
+    """Fixed number of browsers, each serving a fixed number of contexts.
+
+    * at most ``browsers * contexts_per_browser`` pages render at once
+    * at most ``max_queue`` further jobs wait; more raise BrowserPoolFull
+    * each job (waiting for a slot + rendering) is bounded by ``job_timeout``
+    * a browser is recycled after ``recycle_after`` pages, or when it crashes
+    """
+
+    def __init__(self, browsers: int = 2, contexts_per_browser: int = 2, max_queue: int = 16,
+                 job_timeout: float = 45.0, recycle_after: int = 100, browser_type: str = "firefox"):
+        self.browsers = browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.recycle_after = recycle_after
+        self.browser_type = browser_type
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._in_flight = 0
+
+        # สร้างใน loop ของ pool เท่านั้น
+        self._playwright = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._handles: list[Optional[_BrowserHandle]] = []
+
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.jobs_timed_out = 0
+        self.jobs_rejected = 0
+        self.browsers_launched = 0
+        self.browsers_recycled = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.browsers * self.contexts_per_browser
+
+    def _ensure_thread(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+                atexit.register(self.close_sync)
+            return self._loop
+
+    # --- public API (callable from any thread / event loop) ---
+
+    async def screenshot(self, url: str, output_path: str, *, viewport: Optional[dict] = None,
+                         user_agent: Optional[str] = None, wait_until: str = "load",
+                         goto_timeout: float = 30000, full_page: bool = False) -> ScreenshotResult:
+        """Render ``url`` and save a PNG to ``output_path``."""
+        with self._count_lock:
+            if self._in_flight >= self.capacity + self.max_queue:
+                self.jobs_rejected += 1
+                raise BrowserPoolFull("Screenshot queue is full, try again later.")
+            self._in_flight += 1
+
+        try:
+            loop = self._ensure_thread()
+            job = self._run_job(url, output_path, viewport, user_agent, wait_until, goto_timeout, full_page)
+            future = asyncio.run_coroutine_threadsafe(job, loop)
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._count_lock:
+                self._in_flight -= 1
+
+    async def close(self) -> None:
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        await asyncio.wrap_future(future)
+
+    def close_sync(self) -> None:
+        if self._loop is None or not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Browser pool shutdown failed: {e}")
+
+    def stats(self) -> dict:
+        handles = [h for h in self._handles if h is not None]
+        return {
+            "browsers": self.browsers,
+            "contexts_per_browser": self.contexts_per_browser,
+            "in_flight": self._in_flight,
+            "max_queue": self.max_queue,
+            "live_browsers": sum(1 for h in handles if not h.retired),
+            "active_pages": sum(h.active for h in handles),
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "jobs_timed_out": self.jobs_timed_out,
+            "jobs_rejected": self.jobs_rejected,
+            "browsers_launched": self.browsers_launched,
+            "browsers_recycled": self.browsers_recycled,
+        }
+
+    # --- internals (run on the pool's event loop) ---
+
+    async def _run_job(self, url, output_path, viewport, user_agent, wait_until, goto_timeout, full_page):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.capacity)
+            self._launch_lock = asyncio.Lock()
+            self._handles = [None] * self.browsers
+
+        try:
+            result = await asyncio.wait_for(
+                self._render(url, output_path, viewport, user_agent, wait_until, goto_timeout, full_page),
+                timeout=self.job_timeout,
+            )
+        except asyncio.TimeoutError:
+            self.jobs_timed_out += 1
+            raise
+        except Exception:
+            self.jobs_failed += 1
+            raise
+        self.jobs_completed += 1
+        return result
+
+    async def _render(self, url, output_path, viewport, user_agent, wait_until, goto_timeout, full_page):
+        async with self._slots:
+            handle = await self._acquire_browser()
+            context = None
+            try:
+                context_options = {}
+                if viewport:
+                    context_options["viewport"] = viewport
+                if user_agent:
+                    context_options["user_agent"] = user_agent
+                context = await handle.browser.new_context(**context_options)
+                page = await context.new_page()
+                response = await page.goto(url, timeout=goto_timeout, wait_until=wait_until)
+                await page.screenshot(path=output_path, full_page=full_page)
+                return ScreenshotResult(
+                    path=output_path,
+                    url=response.url if response else page.url,
+                    status=response.status if response else None,
+                )
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass  # browser อาจ crash ไปแล้ว
+                await self._release_browser(handle)
+
+    async def _launch(self) -> _BrowserHandle:
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        browser = await getattr(self._playwright, self.browser_type).launch(headless=True)
+        handle = _BrowserHandle(browser)
+        browser.on("disconnected", lambda _: setattr(handle, "retired", True))
+        self.browsers_launched += 1
+        return handle
+
+    async def _acquire_browser(self) -> _BrowserHandle:
+        async with self._launch_lock:
+            for index, handle in enumerate(self._handles):
+                if handle is None or handle.retired or not handle.browser.is_connected():
+                    if handle is not None:
+                        await self._retire(handle)
+                    self._handles[index] = await self._launch()
+            handle = min(self._handles, key=lambda h: h.active)
+            handle.active += 1
+            return handle
+
+    async def _release_browser(self, handle: _BrowserHandle) -> None:
+        handle.active -= 1
+        handle.pages += 1
+        if not handle.browser.is_connected():
+            handle.retired = True  # crashed
+        elif handle.pages >= self.recycle_after:
+            handle.retired = True
+        if handle.retired and handle.active == 0:
+            await self._close_browser(handle)
+
+    async def _retire(self, handle: _BrowserHandle) -> None:
+        handle.retired = True
+        if handle.active == 0:
+            await self._close_browser(handle)
+
+    async def _close_browser(self, handle: _BrowserHandle) -> None:
+        if handle in self._handles:
+            self._handles[self._handles.index(handle)] = None
+        self.browsers_recycled += 1
+        try:
+            await handle.browser.close()
+        except Exception:
+            pass
+
+    async def _shutdown(self) -> None:
+        for handle in list(self._handles):
+            if handle is not None:
+                try:
+                    await handle.browser.close()
+                except Exception:
+                    pass
+        self._handles = [None] * self.browsers
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Process-wide pool, configured from BROWSER_POOL_* environment variables."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(
+                browsers=int(os.getenv("BROWSER_POOL_BROWSERS", "2")),
+                contexts_per_browser=int(os.getenv("BROWSER_POOL_CONTEXTS", "2")),
+                max_queue=int(os.getenv("BROWSER_POOL_QUEUE", "16")),
+                job_timeout=float(os.getenv("BROWSER_POOL_JOB_TIMEOUT", "45")),
+                recycle_after=int(os.getenv("BROWSER_POOL_RECYCLE_AFTER", "100")),
+            )
+        return _pool
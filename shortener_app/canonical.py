@@ -0,0 +1,69 @@
+# shortener_app/canonical.py
+#
+# Canonical form of a target URL and its fixed-width hash. urls.canonical_hash
+# (duplicate check per api key), the blacklist snapshot and the phishing feed
+# index all hash the same canonical form, so the different encodings of one
+# URL are treated as the same URL everywhere.
+
+import hashlib
+from urllib.parse import unquote, urlparse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def get_canonical_url(url: str) -> str:
+    """Get canonical form of URL for duplicate detection.
+
+    Unquotes the URL to normalize different encodings of the same URL and
+    lowercases the scheme and host (dropping a default port). Used only
+    for comparison, not for storage or validation.
+
+    Args:
+        url: The URL to canonicalize
+
+    Returns:
+        Canonical form of the URL (decoded and normalized)
+    """
+    # First normalize the URL structure (same as normalize_url(url, trailing_slash=False) in main.py)
+    parsed = urlparse(url.strip())
+    parsed = parsed._replace(path=parsed.path.rstrip("/"))
+
+    # Unquote path and query separately (this might create invalid URLs, but that's OK for comparison)
+    canonical_path = unquote(parsed.path)
+    canonical_query = unquote(parsed.query) if parsed.query else ""
+
+    # Reconstruct for comparison purposes; only scheme and host are
+    # case-insensitive, path and query keep their case (e.g. youtu.be/<id>)
+    canonical = parsed._replace(
+        scheme=parsed.scheme.lower(),
+        netloc=_canonical_netloc(parsed),
+        path=canonical_path,
+        query=canonical_query
+    )
+
+    return canonical.geturl()
+
+
+def _canonical_netloc(parsed) -> str:
+    """Lowercased host without the default port of the scheme; user info is kept."""
+    host = parsed.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    try:
+        port = parsed.port
+    except ValueError:  # port ที่ไม่ใช่ตัวเลข ใช้ netloc เดิม
+        return parsed.netloc.lower()
+    if port is not None and port != DEFAULT_PORTS.get(parsed.scheme.lower()):
+        host = f"{host}:{port}"
+    userinfo, _, _ = parsed.netloc.rpartition("@")
+    return f"{userinfo}@{host}" if userinfo else host
+
+
+def canonical_digest(url: str) -> bytes:
+    """sha256 of the canonical URL (32 bytes)."""
+    return hashlib.sha256(get_canonical_url(url).encode("utf-8")).digest()
+
+
+def canonical_hash(url: str) -> str:
+    """Hex form of canonical_digest, as stored in urls.canonical_hash (64 chars)."""
+    return canonical_digest(url).hex()
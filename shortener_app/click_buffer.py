@@ -0,0 +1,111 @@
+# shortener_app/click_buffer.py
+
+import asyncio
+import threading
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+
+from . import async_crud
+
+
+class ClickBuffer:
+    """Write-behind buffer for click counters.
+
+    Redirects only bump an in-memory counter per short key; a background task
+    flushes all pending counters in one batched UPDATE every
+    ``flush_interval`` seconds, or earlier once ``max_keys`` distinct keys are
+    waiting. Counters that fail to flush are put back and retried.
+    """
+
+    FLUSH_CHUNK_SIZE = 500  # keys per UPDATE statement
+
+    def __init__(self, flush_interval: float, max_keys: int):
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flush_requested = asyncio.Event()
+        self.flushes = 0
+        self.flushed_clicks = 0
+        self.failures = 0
+        self.last_flush_at = None
+
+    def add(self, url_key: str, clicks: int = 1) -> None:
+        with self._lock:
+            self._counts[url_key] = self._counts.get(url_key, 0) + clicks
+            is_full = len(self._counts) >= self.max_keys
+        if is_full:
+            self._flush_requested.set()
+
+    def pending(self, url_key: str) -> int:
+        """Clicks recorded for a key that are not in the database yet."""
+        with self._lock:
+            return self._counts.get(url_key, 0)
+
+    def _drain(self) -> dict[str, int]:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def _restore(self, counts: dict[str, int]) -> None:
+        with self._lock:
+            for url_key, clicks in counts.items():
+                self._counts[url_key] = self._counts.get(url_key, 0) + clicks
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write all pending counters to the database, returns clicks written."""
+        counts = self._drain()
+        if not counts:
+            return 0
+
+        items = list(counts.items())
+        written = 0
+        try:
+            for start in range(0, len(items), self.FLUSH_CHUNK_SIZE):
+                chunk = dict(items[start:start + self.FLUSH_CHUNK_SIZE])
+                await async_crud.add_db_clicks(db, chunk)
+                written += sum(chunk.values())
+                for url_key in chunk:
+                    del counts[url_key]
+        except Exception:
+            self.failures += 1
+            self._restore(counts)
+            raise
+        finally:
+            self.flushed_clicks += written
+
+        self.flushes += 1
+        self.last_flush_at = time.time()
+        return written
+
+    async def wait_for_flush(self) -> None:
+        """Sleep until the flush interval elapses or the buffer fills up."""
+        try:
+            await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._flush_requested.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_keys = len(self._counts)
+            pending_clicks = sum(self._counts.values())
+        return {
+            "pending_keys": pending_keys,
+            "pending_clicks": pending_clicks,
+            "max_keys": self.max_keys,
+            "flush_interval_seconds": self.flush_interval,
+            "flushes": self.flushes,
+            "flushed_clicks": self.flushed_clicks,
+            "failures": self.failures,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+click_buffer = ClickBuffer(
+    flush_interval=get_settings().click_flush_interval,
+    max_keys=get_settings().click_buffer_max_keys,
+)
@@ -21,6 +21,33 @@ class Settings(BaseSettings):
     port: int = os.getenv('PORT', '8000')
     use_api_db: bool = True  # กำหนดค่าเริ่มต้นให้ใช้ api_db ถ้าไม่ต้องการให้ตั้งเป็น False
     safe_host: str = os.getenv('SAFE_HOST', 'about:blank')
+    url_cache_size: int = int(os.getenv('URL_CACHE_SIZE', '10000'))  # จำนวน short URL สูงสุดใน cache (0 = ปิด)
+    url_cache_ttl: int = int(os.getenv('URL_CACHE_TTL', '60'))  # อายุของข้อมูลใน cache (วินาที)
+    click_flush_interval: float = float(os.getenv('CLICK_FLUSH_INTERVAL', '5'))  # เขียนจำนวนคลิกลงฐานข้อมูลทุกกี่วินาที
+    click_buffer_max_keys: int = int(os.getenv('CLICK_BUFFER_MAX_KEYS', '1000'))  # flush ทันทีเมื่อมี key ค้างครบจำนวนนี้
+    redis_url: str = os.getenv('REDIS_URL', '')  # ถ้ากำหนด จะใช้ Redis เป็น cache ที่ใช้ร่วมกันทุก worker
+    principal_cache_ttl: int = int(os.getenv('PRINCIPAL_CACHE_TTL', '60'))  # อายุของ api key/role ใน cache (วินาที)
+    keygen_min_length: int = int(os.getenv('KEYGEN_MIN_LENGTH', '5'))  # ความยาวเริ่มต้นของ short key ที่ระบบสร้าง
+    keygen_block_size: int = int(os.getenv('KEYGEN_BLOCK_SIZE', '100'))  # จำนวน key ที่แต่ละ worker จองจากฐานข้อมูลต่อครั้ง
+    keygen_growth_threshold: float = float(os.getenv('KEYGEN_GROWTH_THRESHOLD', '0.9'))  # ใช้ keyspace ถึงสัดส่วนนี้แล้วเพิ่มความยาว key อีก 1 ตัว
+    keygen_secret: str = os.getenv('KEYGEN_SECRET', '')  # ใช้สลับลำดับ key (ว่าง = ใช้ SECRET_KEY)
+    blacklist_reload_interval: float = float(os.getenv('BLACKLIST_RELOAD_INTERVAL', '30'))  # ตรวจการเปลี่ยนแปลงของ blacklist ทุกกี่วินาที
+    url_quota_user: int = int(os.getenv('URL_QUOTA_USER', '50'))  # จำนวน URL ที่ active ได้สูงสุดของ role User (0 = ไม่จำกัด, VIP/Administrator ไม่จำกัด)
+    rate_limit_guest: str = os.getenv('RATE_LIMIT_GUEST', '30/minute')  # จำนวน request ของ /url/guest ต่อ IP (ว่าง = ไม่จำกัด)
+    rate_limit_user: str = os.getenv('RATE_LIMIT_USER', '60/minute')  # จำนวน request ต่อ API key ของ role User (plan free)
+    rate_limit_vip: str = os.getenv('RATE_LIMIT_VIP', '1000/minute')  # role VIP (plan pro)
+    rate_limit_admin: str = os.getenv('RATE_LIMIT_ADMIN', '')  # role Administrator (plan enterprise, ว่าง = ไม่จำกัด)
+    guest_url_ttl_days: int = int(os.getenv('GUEST_URL_TTL_DAYS', '7'))  # URL ของ guest หมดอายุหลังสร้างกี่วัน
+    expiry_sweep_interval: float = float(os.getenv('EXPIRY_SWEEP_INTERVAL', '60'))  # ปิด URL ที่ถึง expires_at แล้วทุกกี่วินาที
+    expiry_chunk_size: int = int(os.getenv('EXPIRY_CHUNK_SIZE', '1000'))  # จำนวนแถวต่อ UPDATE/DELETE ของงานลบ URL หมดอายุ
+    job_lease_poll_interval: float = float(os.getenv('JOB_LEASE_POLL_INTERVAL', '60'))  # worker ที่ไม่ได้ถือ lease ตรวจว่าต้องรับงานต่อหรือไม่ทุกกี่วินาที
+    enrichment_workers: int = int(os.getenv('ENRICHMENT_WORKERS', '8'))  # จำนวนหน้าเว็บที่ดึง title/favicon พร้อมกันได้
+    enrichment_per_host: int = int(os.getenv('ENRICHMENT_PER_HOST', '2'))  # จำนวน connection สูงสุดต่อ host เดียวกัน
+    enrichment_max_queue: int = int(os.getenv('ENRICHMENT_MAX_QUEUE', '5000'))  # งานที่รอได้สูงสุด เกินนี้จะข้าม (ไม่ดึง title/favicon)
+    enrichment_max_bytes: int = int(os.getenv('ENRICHMENT_MAX_BYTES', '262144'))  # อ่านหน้าเว็บไม่เกินกี่ byte (หยุดเมื่อจบ <head>)
+    enrichment_timeout: float = float(os.getenv('ENRICHMENT_TIMEOUT', '10'))  # timeout ต่อหน้าเว็บ (วินาที)
+    enrichment_batch_size: int = int(os.getenv('ENRICHMENT_BATCH_SIZE', '100'))  # เขียนผลลงฐานข้อมูลเมื่อครบจำนวนนี้
+    enrichment_flush_interval: float = float(os.getenv('ENRICHMENT_FLUSH_INTERVAL', '2'))  # หรือเขียนทุกกี่วินาที
 
 
 @lru_cache
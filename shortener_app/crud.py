@@ -2,7 +2,6 @@
 
 import logging
 import time
-from datetime import datetime, timedelta, timezone
 from itsdangerous.url_safe import URLSafeTimedSerializer as Serializer
 from itsdangerous import BadSignature, SignatureExpired
 
@@ -10,7 +9,10 @@ from sqlalchemy.exc import DBAPIError, OperationalError
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
+from canonical import canonical_hash
+
 from . import keygen, models, schemas
+from .url_cache import url_cache
 
 # สร้าง logger
 logger = logging.getLogger("uvicorn.error")
@@ -89,6 +91,7 @@ def create_db_url(db: Session, url: schemas.URLBase, api_key: str) -> models.URL
     
     db_url = models.URL(
         target_url=url.target_url, 
+        canonical_hash=canonical_hash(url.target_url),
         key=key, 
         secret_key=secret_key,
         api_key=api_key  # Store API key associated with the URL
@@ -138,7 +141,9 @@ def deactivate_db_url_by_secret_key(db: Session, secret_key: str, api_key: str)
     db_url = get_db_url_by_secret_key(db, secret_key, api_key=api_key)
     if db_url:
         db_url.is_active = False
+        url_key = db_url.key
         db.commit()
+        url_cache.invalidate(key=url_key, secret_key=secret_key)
         db.refresh(db_url)
         return db_url
     else:
@@ -179,8 +184,8 @@ def is_url_existing_for_key(db: Session, target_url: str, api_key: str) -> model
     Returns the URL object if found, or None if not found."""
 
     return db.query(models.URL).filter(
-        models.URL.target_url == target_url, 
         models.URL.api_key == api_key, 
+        models.URL.canonical_hash == canonical_hash(target_url), 
         models.URL.is_active
     ).first()  # This will return the URL object itself or None
 
@@ -280,45 +285,3 @@ def verify_secret_and_api_key(db: Session, secret_key: str, api_key: str, api_db
 
     # Return True if a matching record is found in both databases, otherwise False
     return bool(db_url)
-
-def is_url_expired(db_url, expiration_delta):
-    """Check if a URL has expired based on the created_at field."""
-    if db_url.api_key is None:  # Checking for guest URLs (without API key)
-        expiration_date = db_url.created_at + expiration_delta
-        # Make datetime.now() timezone-aware
-        if datetime.now(timezone.utc) > expiration_date:
-            return True
-        return False
-    else:
-        # URLs with an API key are not considered expired based on time limits
-        return False  # or some other logic based on your requirement
-
-def remove_expired_urls(db: Session, expiry_timedelta: timedelta):
-    """ Remove expired URLs based on custom expiry timedelta """
-    current_time = datetime.now()  # ใช้ offset-naive datetime เพื่อให้สอดคล้องกับเวลาที่บันทึกในฐานข้อมูล
-    expired_time = current_time - expiry_timedelta
-    
-    expired_urls = db.query(models.URL).filter(
-        models.URL.api_key == None,  # URLs created by guest
-        models.URL.created_at < expired_time
-    ).all()
-
-    for url in expired_urls:
-        db.delete(url)
-        logger.warning(f"deleting: {url.key}, {url.target_url}")
-    db.commit()
-
-def deactivate_expired_urls(db: Session, expiry_timedelta: timedelta):
-    """Deactivate URLs that have expired by setting is_active to False."""
-    current_time = datetime.now()  # ใช้ offset-naive datetime เพื่อให้สอดคล้องกับเวลาที่บันทึกในฐานข้อมูล
-    expired_urls = db.query(models.URL).filter(
-        models.URL.api_key == None,  # URLs created by guest
-        models.URL.is_active == True,  # Only consider active URLs
-        models.URL.created_at < (current_time - expiry_timedelta)
-    ).all()
-
-    for db_url in expired_urls:
-        db_url.is_active = False
-        db.add(db_url)
-        logger.warning(f"deactivating: {db_url.key}, {db_url.target_url}")
-    db.commit()
\ No newline at end of file
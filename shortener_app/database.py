@@ -1,6 +1,7 @@
 # shortener_app/database.py
 
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -18,6 +19,31 @@ def create_configured_engine(database_url: str):
         pool_use_lifo=True,
     )
 
+def to_async_database_url(database_url: str) -> str:
+    ''' แปลง URL ของฐานข้อมูลให้ใช้ driver แบบ async (aiosqlite สำหรับ SQLite, asyncpg สำหรับ PostgreSQL) '''
+    scheme, separator, rest = database_url.partition("://")
+    if not separator:
+        return database_url
+
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return database_url
+
+def create_configured_async_engine(database_url: str):
+    async_url = to_async_database_url(database_url)
+    if async_url.startswith("sqlite"):
+        return create_async_engine(async_url)
+
+    return create_async_engine(
+        async_url,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_use_lifo=True,
+    )
+
 # เลือกฐานข้อมูลตามการตั้งค่าจาก config
 db_url = get_settings().db_url
 
@@ -37,6 +63,17 @@ engine_blacklist = create_configured_engine(db_blacklist)
 SessionBlacklist = sessionmaker(autocommit=False, autoflush=False, bind=engine_blacklist)
 BaseBlacklist = declarative_base()
 
+# Async engines/sessions สำหรับ route ของ FastAPI ไม่ให้ query ไป block event loop
+# (ฝั่ง sync ด้านบนยังใช้กับ script เช่น update_url_info.py และงานตอน startup)
+async_engine = create_configured_async_engine(db_url)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async_engine_api = create_configured_async_engine(db_api)
+AsyncSessionAPI = async_sessionmaker(async_engine_api, autoflush=False, expire_on_commit=False)
+
+async_engine_blacklist = create_configured_async_engine(db_blacklist)
+AsyncSessionBlacklist = async_sessionmaker(async_engine_blacklist, autoflush=False, expire_on_commit=False)
+
 
 # ฟังก์ชันสร้างตารางสำหรับ URL shortener
 # def init_db():
@@ -0,0 +1,263 @@
+# shortener_app/enrichment.py
+
+import asyncio
+import codecs
+import logging
+import time
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+from urllib.parse import urljoin
+
+import aiohttp
+
+from config import get_settings
+from database import AsyncSessionLocal
+
+from . import async_crud
+from .url_events import url_events
+
+logger = logging.getLogger(__name__)
+
+PAGE_INFO_MAX_LENGTH = 255  # ขนาดของคอลัมน์ urls.title และ urls.favicon_url
+
+
+class PageInfo(NamedTuple):
+    title: str
+    favicon_url: Optional[str]
+
+
+class HeadParser(HTMLParser):
+    """Collects <title> and the first icon <link> and reports ``done`` once
+    the head is over (</head> or <body>), so the rest of the page is never
+    downloaded."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.favicon = None
+        self.done = False
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "link" and self.favicon is None:
+            attrs = dict(attrs)
+            rel = (attrs.get("rel") or "").lower().split()
+            if "icon" in rel and attrs.get("href"):
+                self.favicon = attrs["href"]
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+
+class EnrichmentWorker:
+    """Fetches title and favicon of new short URLs in the background.
+
+    * ``enqueue()`` never blocks: at most ``max_queue`` jobs wait, the rest
+      are dropped (and counted) so a burst of creations cannot pile up work
+    * ``workers`` fetches run at once over one pooled aiohttp session, with
+      at most ``per_host`` connections to the same host
+    * each response is read only up to ``max_bytes`` or the end of <head>
+    * results are written with one UPDATE per ``batch_size`` jobs or every
+      ``flush_interval`` seconds; a failed write is retried with the next
+      batch, up to ``WRITE_ATTEMPTS`` times per result
+    """
+
+    CHUNK_SIZE = 8192
+    WRITE_ATTEMPTS = 3
+
+    def __init__(self, workers: int, per_host: int, max_queue: int, max_bytes: int,
+                 timeout: float, batch_size: int, flush_interval: float):
+        self.workers = workers
+        self.per_host = per_host
+        self.max_queue = max_queue
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._results: dict[str, PageInfo] = {}
+        self._write_attempts: dict[str, int] = {}  # url_key -> จำนวนครั้งที่เขียนไม่สำเร็จ
+        self._result_ready = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: list[asyncio.Task] = []
+
+        self.in_flight = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.fetched = 0
+        self.failed = 0
+        self.written = 0
+        self.write_batches = 0
+        self.write_failures = 0
+        self.write_dropped = 0  # ผลที่ทิ้งไปหลังเขียนไม่สำเร็จครบ WRITE_ATTEMPTS ครั้ง
+        self.latency_total = 0.0  # เวลาตั้งแต่ enqueue จนได้ผล (วินาที)
+        self.latency_max = 0.0
+
+    # --- lifecycle ---
+
+    async def start(self) -> None:
+        connector = aiohttp.TCPConnector(limit=self.workers, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; url-shortener-preview)"},
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._writer()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._write_results()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # --- producer ---
+
+    def enqueue(self, url_key: str, target_url: str) -> bool:
+        """Queue a URL for enrichment. Returns False if the backlog is full."""
+        try:
+            self._queue.put_nowait((url_key, target_url, time.monotonic()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    # --- fetching ---
+
+    async def fetch_page_info(self, url: str) -> PageInfo:
+        parser = HeadParser()
+        async with self._session.get(url) as response:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+            received = 0
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or received >= self.max_bytes:
+                    break
+
+        favicon_url = parser.favicon
+        if favicon_url and not favicon_url.startswith('http'):
+            favicon_url = urljoin(url, favicon_url)
+        # urls.title และ urls.favicon_url เป็น String(255) ค่าที่ยาวเกินทำให้ UPDATE ทั้ง batch ล้มบน PostgreSQL
+        return PageInfo(
+            (parser.title or 'No title found')[:PAGE_INFO_MAX_LENGTH],
+            favicon_url[:PAGE_INFO_MAX_LENGTH] if favicon_url else None,
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            url_key, target_url, enqueued_at = await self._queue.get()
+            self.in_flight += 1
+            try:
+                info = await self.fetch_page_info(target_url)
+            except (aiohttp.ClientError, asyncio.TimeoutError, LookupError, ValueError) as e:
+                self.failed += 1
+                logger.info(f"Page info fetch failed for {target_url}: {e}")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Unexpected error occurred while fetching page info: {e}")
+            else:
+                self.fetched += 1
+                self._results[url_key] = info
+                if len(self._results) >= self.batch_size:
+                    self._result_ready.set()
+            finally:
+                self.in_flight -= 1
+                latency = time.monotonic() - enqueued_at
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                self._queue.task_done()
+
+    # --- writing ---
+
+    async def _writer(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._result_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._result_ready.clear()
+            await self._write_results()
+
+    async def _write_results(self) -> None:
+        if not self._results:
+            return
+        results, self._results = self._results, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                await async_crud.update_page_info(db, results)
+        except Exception:
+            self.write_failures += 1
+            logger.exception(f"Failed to write page info for {len(results)} URLs")
+            self._requeue(results)
+            return
+        for url_key in results:
+            self._write_attempts.pop(url_key, None)
+        self.written += len(results)
+        self.write_batches += 1
+        # ปลุก client ที่รออยู่ที่ /ws/url_update และ /sse/url_update
+        await url_events.publish(results)
+
+    def _requeue(self, results: dict[str, PageInfo]) -> None:
+        """Put the results of a failed write back for the next batch, unless
+        they already failed ``WRITE_ATTEMPTS`` times."""
+        for url_key, info in results.items():
+            attempts = self._write_attempts.get(url_key, 0) + 1
+            if attempts >= self.WRITE_ATTEMPTS:
+                self._write_attempts.pop(url_key, None)
+                self.write_dropped += 1
+                continue
+            self._write_attempts[url_key] = attempts
+            # ผลที่ fetch ใหม่ระหว่างนี้ใช้แทนของเดิม
+            self._results.setdefault(url_key, info)
+
+    def stats(self) -> dict:
+        done = self.fetched + self.failed
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "fetched": self.fetched,
+            "failed": self.failed,
+            "pending_writes": len(self._results),
+            "written": self.written,
+            "write_batches": self.write_batches,
+            "write_failures": self.write_failures,
+            "write_dropped": self.write_dropped,
+            "latency_avg_seconds": round(self.latency_total / done, 3) if done else 0.0,
+            "latency_max_seconds": round(self.latency_max, 3),
+        }
+
+
+enrichment_worker = EnrichmentWorker(
+    workers=get_settings().enrichment_workers,
+    per_host=get_settings().enrichment_per_host,
+    max_queue=get_settings().enrichment_max_queue,
+    max_bytes=get_settings().enrichment_max_bytes,
+    timeout=get_settings().enrichment_timeout,
+    batch_size=get_settings().enrichment_batch_size,
+    flush_interval=get_settings().enrichment_flush_interval,
+)
@@ -0,0 +1,180 @@
+# shortener_app/job_scheduler.py
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from database import AsyncSessionLocal
+
+from . import async_crud
+from .url_cache import as_utc
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[AsyncSession], Awaitable[int]]
+
+
+class LeaderJob:
+    """Periodic job that runs in one uvicorn worker at a time.
+
+    The worker holding the job's row in ``job_leases`` is the leader. The
+    lease is short (``LEASE_TTL``) and the leader renews it every
+    ``LEASE_TTL / 3`` seconds, also from a heartbeat while the job runs; the
+    other workers check every ``poll_interval`` seconds and take over once
+    it expires (a crashed leader) or is released on shutdown. When the job
+    runs is decided by ``last_run_at`` in the same row, so a new leader
+    keeps the schedule. ``run`` returns the number of rows it affected.
+    """
+
+    LEASE_TTL = 60.0
+
+    def __init__(self, name: str, interval: float, run: JobFunc, holder: str, poll_interval: float):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.holder = holder
+        self.poll_interval = min(poll_interval, interval)
+        self.renew_interval = self.LEASE_TTL / 3
+        self.is_leader = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.rows_total = 0
+        self.last_rows = 0
+        self.last_duration = 0.0
+        self.last_run_at = None
+        self.lease_lost = 0
+
+    async def _acquire(self) -> bool:
+        async with AsyncSessionLocal() as db:
+            return await async_crud.acquire_job_lease(db, self.name, self.holder, self.LEASE_TTL)
+
+    async def _seconds_until_due(self) -> float:
+        async with AsyncSessionLocal() as db:
+            last_run_at = as_utc(await async_crud.get_job_last_run(db, self.name))
+        if last_run_at is None:
+            return 0.0
+        return self.interval - (datetime.now(timezone.utc) - last_run_at).total_seconds()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                renewed = await self._acquire()
+            except Exception:
+                logger.exception(f"Failed to renew the lease of job {self.name}")
+                continue
+            if not renewed:
+                # worker อื่นรับ lease ไปแล้ว (เช่น DB ช้าจน lease หมดอายุ) รอบนี้ทำต่อจนจบ
+                self.lease_lost += 1
+                self.is_leader = False
+                logger.warning(f"Lost the lease of job {self.name} while running")
+                return
+
+    async def run_once(self) -> None:
+        started = time.monotonic()
+        started_at = datetime.now(timezone.utc)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await self.run(db)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            # บันทึกเมื่อจบรอบ (รวมรอบที่ล้มเหลว) ถ้า leader ตายกลางรอบ leader ใหม่จะทำรอบนั้นทันที
+            async with AsyncSessionLocal() as db:
+                await async_crud.record_job_run(db, self.name, self.holder, started_at)
+        self.last_duration = time.monotonic() - started
+        self.last_rows = rows
+        self.rows_total += rows
+        self.runs += 1
+        self.last_run_at = time.time()
+        logger.info(f"Job {self.name}: {rows} rows in {self.last_duration:.2f}s")
+
+    async def loop(self) -> None:
+        while True:
+            try:
+                self.is_leader = await self._acquire()
+                wait = await self._seconds_until_due() if self.is_leader else 0.0
+            except Exception:
+                self.is_leader = False
+                self.failures += 1
+                logger.exception(f"Failed to acquire the lease of job {self.name}")
+            if not self.is_leader:
+                self.skipped += 1
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if wait <= 0:
+                try:
+                    await self.run_once()
+                except Exception:
+                    self.failures += 1
+                    logger.exception(f"Job {self.name} failed")
+                wait = self.interval
+            # ตื่นมาต่อ lease ก่อนหมดอายุ แม้รอบถัดไปจะอีกนาน
+            await asyncio.sleep(max(min(wait, self.renew_interval), 0))
+
+    async def release(self) -> None:
+        if not self.is_leader:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await async_crud.release_job_lease(db, self.name, self.holder)
+        except Exception:
+            logger.exception(f"Failed to release the lease of job {self.name}")
+        self.is_leader = False
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "is_leader": self.is_leader,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "rows_total": self.rows_total,
+            "last_rows": self.last_rows,
+            "last_duration_seconds": round(self.last_duration, 3),
+            "last_run_at": self.last_run_at,
+            "lease_lost": self.lease_lost,
+        }
+
+
+class JobScheduler:
+    """Runs the registered LeaderJobs as asyncio tasks of this worker."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: dict[str, LeaderJob] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def add(self, name: str, interval: float, run: JobFunc) -> LeaderJob:
+        job = LeaderJob(name, interval, run, self.holder, self.poll_interval)
+        self.jobs[name] = job
+        return job
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(job.loop()) for job in self.jobs.values()]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # ปล่อย lease ให้ worker อื่นรับงานต่อได้ทันที ไม่ต้องรอหมดอายุ
+        for job in self.jobs.values():
+            await job.release()
+
+    def stats(self) -> dict:
+        return {"holder": self.holder, **{name: job.stats() for name, job in self.jobs.items()}}
+
+
+job_scheduler = JobScheduler(poll_interval=get_settings().job_lease_poll_interval)
@@ -1,10 +1,19 @@
 # shortener_app/keygen.py
 
+import asyncio
+import hashlib
 import secrets
 import string
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import crud
+
+from config import get_settings
+
+from . import async_crud, crud
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)  # 62
 
 
 def create_random_key(length: int = 5) -> str:
@@ -18,6 +27,133 @@ def create_unique_random_key(db: Session) -> str:
         key = create_random_key()
     return key
 
+def encode_base62(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class KeyPermutation:
+    """Keyed bijection on [0, 62**length), so consecutive counter values
+    become unrelated-looking keys of the same length.
+
+    The value is split into two base62 halves of ``length // 2`` and
+    ``length - length // 2`` digits, and an alternating Feistel network adds
+    a keyed hash of one half to the other, modulo that half's size. Every
+    round can be undone, so distinct counters always give distinct keys.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, secret: str):
+        self._secret = hashlib.sha256(secret.encode("utf-8")).digest()
+
+    def _round(self, length: int, round_no: int, value: int, modulus: int) -> int:
+        digest = hashlib.blake2b(f"{length}:{round_no}:{value}".encode(), key=self._secret, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % modulus
+
+    def permute(self, value: int, length: int) -> int:
+        left_size = BASE ** (length // 2)
+        right_size = BASE ** (length - length // 2)
+        left, right = divmod(value, right_size)
+        for round_no in range(self.ROUNDS):
+            left = (left + self._round(length, 2 * round_no, right, left_size)) % left_size
+            right = (right + self._round(length, 2 * round_no + 1, left, right_size)) % right_size
+        return left * right_size + right
+
+    def key(self, value: int, length: int) -> str:
+        return encode_base62(self.permute(value, length), length)
+
+
+class KeyAllocator:
+    """Hands out short keys without a lookup per key.
+
+    Each worker reserves a block of counter values from the ``key_allocator``
+    row (one UPDATE ... RETURNING per ``block_size`` keys) and maps them
+    through KeyPermutation. Blocks never overlap across workers or nodes.
+    Once the counter passes ``growth_threshold`` of the 62**length keyspace,
+    the row moves to length + 1 (compare-and-set, so only one worker grows it).
+    Collisions with custom keys or older random keys are possible and are
+    retried by async_crud.create_db_url.
+    """
+
+    NAME = "urls"
+
+    def __init__(self, permutation: KeyPermutation, block_size: int, min_length: int, growth_threshold: float):
+        self.permutation = permutation
+        self.block_size = block_size
+        self.min_length = min_length
+        self.growth_threshold = growth_threshold
+        self._lock = asyncio.Lock()
+        self._length = min_length
+        self._next = 0
+        self._end = 0  # block ว่าง จะจองใหม่ตอนขอ key ครั้งแรก
+        self.blocks_claimed = 0
+        self.keys_issued = 0
+        self.length_growths = 0
+
+    async def next_key(self, db: AsyncSession) -> str:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._claim_block(db)
+            value, length = self._next, self._length
+            self._next += 1
+            self.keys_issued += 1
+        return self.permutation.key(value, length)
+
+    async def next_keys(self, db: AsyncSession, count: int) -> list[str]:
+        """``count`` keys in one pass, claiming as many blocks as needed."""
+        values = []
+        async with self._lock:
+            while len(values) < count:
+                if self._next >= self._end:
+                    # batch ใหญ่จองช่วงเดียวให้พอ แทนการจองทีละ block_size
+                    await self._claim_block(db, max(self.block_size, count - len(values)))
+                take = min(count - len(values), self._end - self._next)
+                values.extend((value, self._length) for value in range(self._next, self._next + take))
+                self._next += take
+            self.keys_issued += count
+        return [self.permutation.key(value, length) for value, length in values]
+
+    async def _claim_block(self, db: AsyncSession, size: int = None) -> None:
+        size = size or self.block_size
+        while True:
+            length, end = await async_crud.claim_key_block(db, self.NAME, size, self.min_length)
+            start = end - size
+            capacity = BASE ** length
+            if start < int(capacity * self.growth_threshold):
+                self._length, self._next, self._end = length, start, min(end, capacity)
+                self.blocks_claimed += 1
+                return
+            if await async_crud.grow_key_length(db, self.NAME, length):
+                self.length_growths += 1
+
+    def stats(self) -> dict:
+        return {
+            "key_length": self._length,
+            "block_size": self.block_size,
+            "block_remaining": max(self._end - self._next, 0),
+            "blocks_claimed": self.blocks_claimed,
+            "keys_issued": self.keys_issued,
+            "length_growths": self.length_growths,
+        }
+
+
+key_allocator = KeyAllocator(
+    KeyPermutation(get_settings().keygen_secret or get_settings().secret_key),
+    block_size=get_settings().keygen_block_size,
+    min_length=get_settings().keygen_min_length,
+    growth_threshold=get_settings().keygen_growth_threshold,
+)
+
+async def create_unique_key_async(db: AsyncSession) -> str:
+    return await key_allocator.next_key(db)
+
+async def create_unique_keys_async(db: AsyncSession, count: int) -> list[str]:
+    return await key_allocator.next_keys(db, count)
+
 def is_valid_custom_key(key: str) -> bool:
     chars = string.ascii_letters + string.digits
-    return all(c in chars for c in key)
\ No newline at end of file
+    return all(c in chars for c in key)
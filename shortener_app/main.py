@@ -1,58 +1,65 @@
 # shortener_app/main.py
 import asyncio
 import base64
-import io
 import json
 import logging
+import math
 import os
 import secrets
 import socket
 import sys
-import time
-from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from functools import partial
-from typing import List, Optional
-from urllib.parse import urljoin, urlparse, unquote, quote
+from typing import AsyncIterator, List, Optional
+from urllib.parse import urlparse, unquote, quote
 
 import aiohttp
 import httpx
 import jwt
 import requests  # Import for checking website existence
 import validators
-from bs4 import BeautifulSoup
 from fastapi import (BackgroundTasks, Body, Depends, FastAPI, Header,
-                     HTTPException, Request, Security, WebSocket,
+                     HTTPException, Query, Request, Security, WebSocket,
                      WebSocketDisconnect, status)
-from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.models import APIKey, APIKeyIn, SecurityScheme
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import (HTMLResponse, JSONResponse, RedirectResponse,
+                               StreamingResponse)
 from fastapi.security import (APIKeyHeader, HTTPAuthorizationCredentials,
                               HTTPBearer)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from PIL import Image
 from qrcodegen import QrCode
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.util import get_remote_address
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from starlette.datastructures import URL
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from browser_pool import get_browser_pool
+from canonical import canonical_hash
 from config import get_settings
-from database import (SessionAPI, SessionBlacklist, SessionLocal, engine,
-                      engine_api, engine_blacklist)
+from database import (AsyncSessionAPI, AsyncSessionBlacklist,
+                      AsyncSessionLocal, SessionAPI, SessionBlacklist,
+                      SessionLocal, async_engine, async_engine_api,
+                      async_engine_blacklist, engine, engine_api,
+                      engine_blacklist)
 from phishing import phishing_data
-from utils import (capture_screenshot, has_trailing_asterisks,
+from screenshot_store import get_screenshot_store
+from utils import (SCREENSHOT_DIR, capture_screenshot, has_trailing_asterisks,
                    remove_trailing_asterisks, validate_and_correct_url)
 
-from . import crud, keygen, models, schemas
+from . import async_crud, crud, keygen, models, qr_render, schemas
+from .blacklist_snapshot import blacklist_snapshot
+from .click_buffer import click_buffer
+from .enrichment import enrichment_worker
+from .job_scheduler import job_scheduler
+from .principal_cache import Principal, principal_cache
+from .rate_limiter import RateLimit, RateLimitResult, rate_limiter, retry_after_seconds
+from .url_cache import CachedURL, as_utc, url_cache
+from .url_events import url_events
 
 
 @asynccontextmanager
@@ -67,21 +74,55 @@ async def lifespan(app: FastAPI):
     # Startup: Fetch phishing URLs
     phishing_data.fetch_phishing_urls()  # เรียกใช้งาน fetch_phishing_urls จากอินสแตนซ์ของ PhishingData
 
-    # Start a background task to periodically deactivate expired URLs
-    cleanup_task = asyncio.create_task(deactivate_expired_urls_periodically())
-    remove_expired_task = asyncio.create_task(remove_expired_urls_periodically())
+    # Startup: โหลด blacklist เข้าหน่วยความจำ (ถ้าไม่สำเร็จจะตรวจจากฐานข้อมูลแทนจนกว่าจะโหลดได้)
+    try:
+        async with AsyncSessionBlacklist() as db:
+            await blacklist_snapshot.refresh(db)
+    except Exception:
+        blacklist_snapshot.failures += 1
+        logging.exception("Failed to load the blacklist snapshot")
+
+    # งานลบ/ปิด URL ที่หมดอายุ ทำเพียง worker เดียวที่ถือ lease (ดู job_scheduler.py)
+    await job_scheduler.start()
+    flush_clicks_task = asyncio.create_task(flush_clicks_periodically())
+    blacklist_task = asyncio.create_task(reload_blacklist_periodically())
+    await url_events.start()
+    await enrichment_worker.start()
 
     yield
     # Shutdown: Any cleanup code would go here (ถ้ามี)
 
-    # You might want to cancel the cleanup_task, remove_expired_task when the application shuts down
-    cleanup_task.cancel()
-    remove_expired_task.cancel()
+    # หยุด task flush จำนวนคลิก แล้วเขียนคลิกที่ค้างอยู่ลงฐานข้อมูลให้หมดก่อนปิด
+    flush_clicks_task.cancel()
+    try:
+        await flush_clicks_task
+    except asyncio.CancelledError:
+        pass
+    try:
+        async with AsyncSessionLocal() as db:
+            await click_buffer.flush(db)
+    except Exception:
+        logging.exception("Failed to flush buffered clicks on shutdown")
+
+    await job_scheduler.stop()
+    blacklist_task.cancel()
     try:
-        await cleanup_task
-        await remove_expired_task
+        await blacklist_task
     except asyncio.CancelledError:
-        print("Cleanup task was cancelled")
+        pass
+
+    # หยุดดึง title/favicon และเขียนผลที่ได้แล้วลงฐานข้อมูลก่อนปิด engine
+    await enrichment_worker.stop()
+
+    for async_db_engine in (async_engine, async_engine_api, async_engine_blacklist):
+        await async_db_engine.dispose()
+
+    await principal_cache.close()
+    await rate_limiter.close()
+    await url_events.stop()
+
+    # ปิด browser ที่ค้างอยู่ใน pool สำหรับ screenshot
+    await get_browser_pool().close()
 
 app = FastAPI(root_path="", lifespan=lifespan)
 app.add_middleware(
@@ -92,12 +133,6 @@ app.add_middleware(
     allow_headers=["*"],  # อนุญาตทุก header
 )
 
-# Initialize Limiter
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
-
 templates = Jinja2Templates(directory="shortener_app/templates")
 
 # Mount the static files directory
@@ -115,6 +150,12 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 SECRET_TOKEN = SECRET_KEY   # for preview url
 
+BATCH_CHUNK_SIZE = 500  # จำนวน URL ที่ตรวจและ insert ต่อ 1 transaction ใน /url/batch
+BATCH_MAX_ITEMS = 10000  # จำนวน URL สูงสุดต่อ 1 request ของ /url/batch
+USER_URLS_MAX_LIMIT = 1000  # จำนวน URL สูงสุดต่อหน้าของ /user/urls
+SCAN_STATUS_MAX_URLS = 1000  # จำนวน URL สูงสุดต่อ request ของ /user/urls/status
+USER_URLS_STREAM_CHUNK = 1000  # จำนวนแถวที่อ่านต่อ query เมื่อ export /user/urls แบบ NDJSON
+URL_UPDATE_TIMEOUT = 10  # /ws/url_update และ /sse/url_update รอ title/favicon นานสุดกี่วินาที
 RESERVED_KEYS = {"apps", "docs", "redoc", "openapi", "about", "api", "url", "user", "admin", "login", "register"}
 
 models.Base.metadata.create_all(bind=engine)
@@ -123,42 +164,62 @@ models.BaseBlacklist.metadata.create_all(bind=engine_blacklist)
 
 logging.basicConfig(level=logging.INFO)
 
-async def deactivate_expired_urls_periodically():
-    """Periodically deactivate expired URLs every 24 hours."""
+async def expire_urls(db: AsyncSession) -> int:
+    # ปิด URL ที่ถึงเวลา expires_at แล้ว
+    return await async_crud.expire_urls(db, get_settings().expiry_chunk_size)
+
+async def deactivate_expired_urls(db: AsyncSession) -> int:
+    # URL ของ guest ที่สร้างก่อนมี expires_at หมดอายุหลังสร้าง 7 วัน
+    return await async_crud.deactivate_expired_urls(
+        db, timedelta(days=get_settings().guest_url_ttl_days), get_settings().expiry_chunk_size,
+    )
+
+async def remove_expired_urls(db: AsyncSession) -> int:
+    # ลบ URL ที่หมดอายุหลังจาก 30 วัน
+    return await async_crud.remove_expired_urls(db, timedelta(days=30), get_settings().expiry_chunk_size)
+
+job_scheduler.add("expire_urls", get_settings().expiry_sweep_interval, expire_urls)
+job_scheduler.add("deactivate_expired_urls", 86400, deactivate_expired_urls)  # ทุก 24 ชั่วโมง
+job_scheduler.add("remove_expired_urls", 86400, remove_expired_urls)  # ทุก 24 ชั่วโมง
+
+async def flush_clicks_periodically():
+    """Periodically write buffered click counts to the database."""
     try:
         while True:
+            await click_buffer.wait_for_flush()
             try:
-                with SessionLocal() as db:
-                    # กำหนดระยะเวลาหมดอายุเป็น 30 นาที
-                    # crud.deactivate_expired_urls(db, timedelta(minutes=30))
-                    # กำหนดระยะเวลาหมดอายุเป็น 7 วัน
-                    crud.deactivate_expired_urls(db, timedelta(days=7))
+                async with AsyncSessionLocal() as db:
+                    await click_buffer.flush(db)
             except Exception:
-                logging.exception("Failed to deactivate expired URLs during periodic cleanup")
-            await asyncio.sleep(86400)  # ทุก 24 ชั่วโมง
+                logging.exception("Failed to flush buffered clicks")
 
     except asyncio.CancelledError:
-        print("Periodic cleanup was cancelled")
+        print("Click flush task was cancelled")
         raise  # Re-raise to allow proper shutdown handling
 
-async def remove_expired_urls_periodically():
-    """Periodically deactivate expired URLs every 24 hours."""
+async def reload_blacklist_periodically():
+    """Periodically apply blacklist changes to the in-memory snapshot."""
     try:
         while True:
+            await asyncio.sleep(blacklist_snapshot.reload_interval)
             try:
-                with SessionLocal() as db:
-                    # ลบ URL ที่หมดอายุหลังจาก 30 นาที
-                    # crud.remove_expired_urls(db, timedelta(minutes=30))
-                    # ลบ URL ที่หมดอายุหลังจาก 30 วัน
-                    crud.remove_expired_urls(db, timedelta(days=30))
+                async with AsyncSessionBlacklist() as db:
+                    await blacklist_snapshot.refresh(db)
             except Exception:
-                logging.exception("Failed to remove expired URLs during periodic cleanup")
-            await asyncio.sleep(86400)  # ทุก 24 ชั่วโมง
+                blacklist_snapshot.failures += 1
+                logging.exception("Failed to reload the blacklist snapshot")
 
     except asyncio.CancelledError:
-        print("Periodic cleanup was cancelled")
+        print("Blacklist reload task was cancelled")
         raise  # Re-raise to allow proper shutdown handling
 
+async def is_url_blacklisted(blacklist_db: AsyncSession, url: str) -> bool:
+    """Check the in-memory snapshot; query the blacklist database only when
+    the snapshot has never been loaded."""
+    if blacklist_snapshot.loaded:
+        return url in blacklist_snapshot
+    return await async_crud.is_url_in_blacklist(blacklist_db, url)
+
 def get_secret_key(authorization: str = Header(...)):
     ''' get secret key for Authorization '''
     if not authorization.startswith("Bearer "):
@@ -178,7 +239,7 @@ async def check_phishing(url: str, background_tasks: BackgroundTasks):
         background_tasks.add_task(phishing_data.update_phishing_urls)
 
     url = normalize_url(url, trailing_slash=False)
-    if url in phishing_data.phishing_urls:
+    if phishing_data.is_phishing(url):
         return JSONResponse(
             status_code=status.HTTP_403_FORBIDDEN,
             content={
@@ -212,7 +273,7 @@ def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
     response = schemas.URLInfo(
         target_url=db_url.target_url,
         is_active=db_url.is_active,
-        clicks=db_url.clicks,
+        clicks=(db_url.clicks or 0) + click_buffer.pending(db_url.key),  # รวมคลิกที่ยังไม่ได้ flush
         url=db_url.url,
         admin_url=db_url.admin_url,  # ส่งค่า admin_url ที่คำนวณไว้
         secret_key=db_url.secret_key,
@@ -220,7 +281,8 @@ def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
         title=db_url.title,
         favicon_url=db_url.favicon_url,
         created_at=db_url.created_at,
-        updated_at=db_url.updated_at 
+        updated_at=db_url.updated_at,
+        expires_at=db_url.expires_at,
     )
     # แปลง Pydantic model เป็น dict ก่อนส่งกลับ
     # ใช้ json.dumps() แปลง model เป็น JSON string
@@ -294,36 +356,6 @@ def normalize_url(url: str, trailing_slash: bool = False) -> str:
     # This preserves URL encoding in the original URL
     return parsed_url._replace(path=path).geturl()
 
-def get_canonical_url(url: str) -> str:
-    """Get canonical form of URL for duplicate detection.
-
-    Unquotes the URL to normalize different encodings of the same URL.
-    Used only for comparison, not for storage or validation.
-
-    Args:
-        url: The URL to canonicalize
-
-    Returns:
-        Canonical form of the URL (decoded and normalized)
-    """
-    # First normalize the URL structure
-    normalized = normalize_url(url, trailing_slash=False)
-
-    # Then unquote for comparison (this might create invalid URLs, but that's OK for comparison)
-    parsed = urlparse(normalized)
-
-    # Unquote path and query separately
-    canonical_path = unquote(parsed.path)
-    canonical_query = unquote(parsed.query) if parsed.query else ""
-
-    # Reconstruct for comparison purposes
-    canonical = parsed._replace(
-        path=canonical_path,
-        query=canonical_query
-    )
-
-    return canonical.geturl().lower()  # Case-insensitive comparison
-
 # ฐานข้อมูลหลัก main database
 def get_db():
     ''' main database '''
@@ -362,6 +394,31 @@ def get_optional_api_db():
 
     yield None
 
+# async sessions สำหรับ route ที่เป็น async def (ไม่ block event loop)
+async def get_async_db():
+    ''' main database (async) '''
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_api_db():
+    ''' api database (async) '''
+    async with AsyncSessionAPI() as db:
+        yield db
+
+async def get_async_blacklist_db():
+    ''' blacklist database (async) '''
+    async with AsyncSessionBlacklist() as db:
+        yield db
+
+async def get_optional_async_api_db():
+    ''' optional api database (async) '''
+    if get_settings().use_api_db:
+        async with AsyncSessionAPI() as db:
+            yield db
+        return
+
+    yield None
+
 def verify_jwt_token(authorization: str = Header(None)):
     ''' verify jwt token. Verify the JWT token and raise appropriate errors.'''
     try:
@@ -404,25 +461,121 @@ def create_access_token():
     
 
 # Updated API key verification function
-async def verify_api_key(
-    request: Request, db: Session = Depends(get_api_db)
-):
-    ''' verify api key '''
+async def get_principal(
+    request: Request, db: AsyncSession = Depends(get_async_api_db)
+) -> Principal:
+    ''' resolve api key -> role (cached) '''
     api_key = request.headers.get("X-API-KEY")  # Get API key from headers
     if not api_key:
         raise_api_key(api_key) 
 
-    db_api_key = crud.get_api_key(db, api_key)
-    if not db_api_key:
+    principal = await principal_cache.resolve(db, api_key)
+    if principal is None:
         raise_api_key(api_key)
-    else:
-        return api_key
+    return principal
+
+async def verify_api_key(principal: Principal = Depends(get_principal)):
+    ''' verify api key '''
+    return principal.api_key
+
+async def verify_event_stream_api_key(
+    request: Request,
+    api_key: Optional[str] = Query(None, description="API key for EventSource, which cannot send the X-API-KEY header"),
+    db: AsyncSession = Depends(get_async_api_db),
+):
+    ''' verify api key ของ SSE: EventSource ใน browser ส่ง header ไม่ได้ จึงรับจาก X-API-KEY, query api_key หรือ cookie api_key '''
+    api_key = request.headers.get("X-API-KEY") or api_key or request.cookies.get("api_key")
+    if not api_key or await principal_cache.resolve(db, api_key) is None:
+        raise_api_key(api_key)
+    return api_key
     
+# จำนวน request ต่อ API key ตาม role (ว่าง = ไม่จำกัด), ดู plan ใน docs/API_PLATFORM_PLAN.md
+RATE_LIMITS_BY_ROLE = {
+    1: RateLimit.parse(get_settings().rate_limit_user),   # User (free)
+    2: RateLimit.parse(get_settings().rate_limit_admin),  # Administrator (enterprise)
+    3: RateLimit.parse(get_settings().rate_limit_vip),    # VIP (pro)
+}
+
+def raise_rate_limited(limit: RateLimit, result: RateLimitResult):
+    ''' raise exception 429 พร้อม Retry-After '''
+    retry_after = retry_after_seconds(result)
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Rate limit exceeded ({limit}). Please retry in {retry_after} seconds.",
+        headers={"Retry-After": str(retry_after), "X-RateLimit-Limit": str(limit)},
+    )
+
+def rate_limit_by_ip(scope: str, value: str):
+    ''' dependency จำกัดจำนวน request ต่อ IP ของ route ที่ไม่ใช้ API key เช่น rate_limit_by_ip("url_guest", "30/minute") '''
+    limit = RateLimit.parse(value)
+
+    async def check_rate_limit(request: Request):
+        if limit is None:
+            return
+        client_ip = request.client.host if request.client else "unknown"
+        result = await rate_limiter.hit(scope, client_ip, limit)
+        if not result.allowed:
+            raise_rate_limited(limit, result)
+
+    return check_rate_limit
+
+async def rate_limit_api_key(principal: Principal = Depends(get_principal)):
+    ''' dependency จำกัดจำนวน request ต่อ API key ตาม role (ทุก route ที่ใช้ dependency นี้นับรวมกัน) '''
+    await charge_api_key(principal)
+
+async def charge_api_key(principal: Principal, cost: int = 1):
+    ''' หัก ``cost`` request จาก rate limit ของ API key (ดู rate_limit_api_key) เช่น /url/batch หักตามจำนวน chunk
+        cost ไม่เกินขนาด bucket เพื่อให้ request ใหญ่สุดยังผ่านได้เมื่อ bucket เต็ม '''
+    limit = RATE_LIMITS_BY_ROLE.get(principal.role_id, RATE_LIMITS_BY_ROLE[1])
+    if limit is None:
+        return
+    result = await rate_limiter.hit("api_key", principal.api_key, limit, cost=min(cost, limit.requests))
+    if not result.allowed:
+        raise_rate_limited(limit, result)
+
+def url_quota(principal: Principal) -> Optional[int]:
+    ''' จำนวน URL ที่ active ได้สูงสุดของ api key ตาม role (None = ไม่จำกัด สำหรับ Administrator, VIP) '''
+    if not get_settings().use_api_db or principal.role_id in (2, 3):
+        return None
+    return get_settings().url_quota_user or None
+
+def raise_quota_exceeded(quota: int):
+    raise_forbidden(message=(
+        f"คุณสร้าง URL ครบ {quota} รายการแล้ว / You have reached the limit of {quota} URLs. "
+        "Please upgrade to VIP Plan for unlimited access."
+    ))
+
+async def _get_owned_url(secret_key: str, api_key: str) -> Optional[models.URL]:
+    async with AsyncSessionLocal() as db:
+        return await async_crud.get_db_url_by_secret_key(db, secret_key, api_key=api_key)
+
+def _is_url_info_updated(db_url: models.URL) -> bool:
+    return db_url.title is not None or db_url.favicon_url is not None
+
+async def wait_for_url_update(db_url: models.URL, secret_key: str, api_key: str) -> Optional[dict]:
+    ''' รอ event "url updated" จาก enrichment worker แทนการ query ฐานข้อมูลซ้ำทุก 5 วินาที
+        return: ข้อมูล URL เมื่อมี title/favicon แล้ว, None ถ้าหมดเวลา
+    '''
+    if not _is_url_info_updated(db_url):
+        async with url_events.listen(db_url.key) as updated:
+            # อ่านซ้ำหลังลงทะเบียนรอแล้ว เผื่อถูกเขียนไปก่อนหน้านี้
+            db_url = await _get_owned_url(secret_key, api_key)
+            if db_url is not None and not _is_url_info_updated(db_url):
+                try:
+                    await asyncio.wait_for(updated.wait(), timeout=URL_UPDATE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return None
+                db_url = await _get_owned_url(secret_key, api_key)
+        if db_url is None:
+            return None
+
+    # Decode the JSONResponse body before accessing elements
+    return json.loads(get_admin_info(db_url).body.decode("utf-8"))
+
 @app.websocket("/ws/url_update/{secret_key}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     secret_key: str, 
-    db: Session = Depends(get_db)
 ):
     ''' provide websocket return url information '''
     await websocket.accept()
@@ -433,28 +586,15 @@ async def websocket_endpoint(
         api_key = auth_data.get("api_key")
 
         # ตรวจสอบว่าผู้ใช้มีสิทธิ์เข้าถึง URL นี้หรือไม่
-        if not crud.is_url_owner(db, secret_key, api_key): 
+        db_url = await _get_owned_url(secret_key, api_key)
+        if db_url is None:
             await websocket.close(code=1008, reason="Unauthorized")  # ปิดการเชื่อมต่อหากไม่ได้รับอนุญาต
             return
 
-        is_updated = False
-        timeout = 10  # กำหนด timeout เป็น 10 วินาที (หรือค่าที่เหมาะสม)
-        start_time = time.time()
-
-        while not is_updated and time.time() - start_time < timeout:
-            is_updated = crud.is_url_info_updated(db, secret_key, api_key)
-
-            if is_updated:
-                db_url = crud.get_db_url_by_secret_key(db, secret_key=secret_key, api_key=api_key)
-                url_info = get_admin_info(db_url)
-
-                # Decode the JSONResponse body before accessing elements
-                url_info_dict = json.loads(url_info.body.decode("utf-8"))
-
-                # ส่งข้อมูลผ่าน WebSocket
-                await websocket.send_json(url_info_dict)  # Send the content of the JSONResponse 
-
-            await asyncio.sleep(5)
+        url_info_dict = await wait_for_url_update(db_url, secret_key, api_key)
+        if url_info_dict is not None:
+            # ส่งข้อมูลผ่าน WebSocket
+            await websocket.send_json(url_info_dict)  # Send the content of the JSONResponse 
 
     except WebSocketDisconnect:
         logging.warning("WebSocket disconnected unexpectedly by the client.")
@@ -467,86 +607,43 @@ async def websocket_endpoint(
             {"message": "An unexpected error occurred. Please try again later."}
         )
     finally:
-        # ถ้าออกจาก loop แสดงว่าไม่มีการอัพเดต หรือมีการอัพเดตแล้ว ให้ปิดการเชื่อมต่อ
+        # ส่งข้อมูลแล้วหรือหมดเวลารอ ให้ปิดการเชื่อมต่อ
         try:
             await websocket.close()
         except RuntimeError as e:
             logging.error("Error closing WebSocket: %s", e)
 
-    
-async def fetch_page_info(url: str):
-    """Fetch title and favicon from the given URL asynchronously."""
-
-    try:
-        async with aiohttp.ClientSession() as session:  # ใช้ aiohttp สำหรับ async request
-            async with session.get(url, timeout=10) as response:
-                response.raise_for_status()
-                content = await response.text()  # รอรับเนื้อหาของหน้าเว็บ
-
-        soup = BeautifulSoup(content, 'html.parser')
-
-        title = soup.find('title')
-        title = title.text.strip() if title else 'No title found'
+@app.get("/sse/url_update/{secret_key}", tags=["url"])
+async def sse_url_update(
+    secret_key: str,
+    request: Request,
+    api_key: str = Depends(verify_event_stream_api_key),
+):
+    ''' server-sent events: ส่งข้อมูล URL หนึ่งครั้งเมื่อ title/favicon ถูกเขียน (event: url_update)
+        หรือ event: timeout ถ้าไม่มีการอัพเดตภายใน URL_UPDATE_TIMEOUT วินาที
+        api key: header X-API-KEY, query ?api_key= หรือ cookie api_key (สำหรับ EventSource)
+    '''
+    db_url = await _get_owned_url(secret_key, api_key)
+    if db_url is None:
+        raise_not_found(request)
 
-        favicon = soup.find('link', rel='icon')
-        if favicon:
-            favicon_url = favicon['href']
-            if not favicon_url.startswith('http'):
-                favicon_url = urljoin(url, favicon_url)
+    async def events() -> AsyncIterator[str]:
+        url_info_dict = await wait_for_url_update(db_url, secret_key, api_key)
+        if url_info_dict is None:
+            yield "event: timeout\ndata: {}\n\n"
         else:
-            favicon_url = None
+            yield f"event: url_update\ndata: {json.dumps(url_info_dict)}\n\n"
 
-        return title, favicon_url
-
-    except aiohttp.ClientError as e:
-        logging.error(f"HTTP request error: {e}")
-        return None, None
-    except Exception as e:
-        logging.error(f"Unexpected error occurred while fetching page info: {e}")
-        return None, None
-    
-# Create a thread pool executor (you can adjust the max_workers if needed)
-executor = ThreadPoolExecutor(max_workers=2)
-
-def fetch_page_info_and_update_sync(db_url: models.URL):
-    """ Fetch page info and update the database synchronously."""
-    with SessionLocal() as db:
-        loop = asyncio.new_event_loop()  # Create a new event loop
-        asyncio.set_event_loop(loop)  # Set the new event loop as the current one
-        title, favicon_url = loop.run_until_complete(fetch_page_info(db_url.target_url))  # Await the coroutine
-        loop.close()  # Close the event loop
-
-        db_url = db.merge(db_url)
-        db_url.title = title
-        db_url.favicon_url = favicon_url
-        db.commit()
-
-async def fetch_page_info_and_update(db_url: models.URL):
-    """Wrapper to run the synchronous function in a separate thread."""
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(
-        executor, partial(fetch_page_info_and_update_sync, db_url)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+    
 def generate_qr_code(data):
     ''' generate qr code '''
-    qr = QrCode.encode_text(data, QrCode.Ecc.MEDIUM)
-    size = qr.get_size()
-    scale = 5
-    img_size = size * scale
-    img = Image.new('1', (img_size, img_size), 'white')
-
-    for y in range(size):
-        for x in range(size):
-            if qr.get_module(x, y):
-                for dy in range(scale):
-                    for dx in range(scale):
-                        img.putpixel((x * scale + dx, y * scale + dy), 0)
-
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
+    return qr_render.qr_code_base64(data, QrCode.Ecc.MEDIUM, scale=5)
 
 @app.get("/")
 def read_root():
@@ -565,23 +662,26 @@ async def shorten_example(request: Request):
 
 
 @app.post("/api/register_api_key", tags=["api key"])
-def register_api_key(
+async def register_api_key(
     api_key: schemas.APIKeyCreate, 
     db: Session = Depends(get_api_db), 
     _: str = Depends(verify_jwt_token)):
 
     ''' register api key '''
-    result = crud.register_api_key(db, api_key.api_key, api_key.role_id)
+    result = await run_in_threadpool(crud.register_api_key, db, api_key.api_key, api_key.role_id)
+    # role อาจเปลี่ยน หรือ key เคยถูก cache ไว้ว่าไม่มีอยู่
+    await principal_cache.invalidate(api_key.api_key)
     return JSONResponse(content={"message": result["message"]}, status_code=result["status_code"])
 
 @app.post("/api/deactivate_api_key", tags=["api key"])
-def deactivate_api_key(
+async def deactivate_api_key(
     api_key: schemas.APIKeyDelete, 
     db: Session = Depends(get_api_db), 
     _: str = Depends(verify_jwt_token)):
 
     ''' deactivate api key '''
-    result = crud.deactivate_api_key(db=db, api_key=api_key.api_key)
+    result = await run_in_threadpool(crud.deactivate_api_key, db=db, api_key=api_key.api_key)
+    await principal_cache.invalidate(api_key.api_key)
     return JSONResponse(content={"message": result["message"]}, status_code=result["status_code"])
 
 
@@ -603,18 +703,36 @@ def refresh_token(refresh_token: str):
             detail="Invalid or expired refresh token",
         )
 
-@app.post("/capture_screen")
+@app.get("/api/metrics", tags=["api key"])
+def get_metrics(_: str = Depends(verify_jwt_token)):
+    ''' internal counters for sizing caches and background jobs '''
+    return {
+        "url_cache": url_cache.stats(),
+        "click_buffer": click_buffer.stats(),
+        "browser_pool": get_browser_pool().stats(),
+        "screenshot_store": get_screenshot_store(SCREENSHOT_DIR).stats(),
+        "blacklist": blacklist_snapshot.stats(),
+        "principal_cache": principal_cache.stats(),
+        "qr_cache": qr_render.qr_cache_stats(),
+        "key_allocator": keygen.key_allocator.stats(),
+        "enrichment": enrichment_worker.stats(),
+        "url_events": url_events.stats(),
+        "jobs": job_scheduler.stats(),
+        "rate_limit": rate_limiter.stats(),
+    }
+
+@app.post("/capture_screen", dependencies=[Depends(rate_limit_api_key)])
 async def capture_screen(
     url_key: str, 
     api_key: str = Depends(verify_api_key), 
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_async_db)):
     ''' capture screen save to file
         args:
             a) url key
     '''
 
     # ค้นหา URL จากฐานข้อมูลโดยใช้ url_key
-    db_url = crud.get_db_url_by_key(db=db, url_key=url_key)
+    db_url = await async_crud.get_db_url_by_key(db=db, url_key=url_key)
     
     if not db_url:
         raise HTTPException(status_code=404, detail="URL not found")
@@ -624,15 +742,19 @@ async def capture_screen(
     #     raise HTTPException(status_code=400, detail="URL is not marked as dangerous or does not exist")
     
     try:
-        # ส่ง target_url ไป capture_screenshot
-        screenshot_file_name = await capture_screenshot(db_url.target_url)
-        screenshot_path = f"/static/screenshots/{screenshot_file_name}"
+        # ส่ง target_url ไป capture_screenshot (ใช้ภาพจาก cache ถ้ายังไม่หมดอายุ)
+        screenshot = await capture_screenshot(db_url.target_url)
+        if screenshot is None:
+            raise HTTPException(status_code=500, detail="Unable to capture screenshot.")
+        screenshot_path = f"/static/screenshots/{screenshot.file_name}"
         
         # Optionally update the database (commented out)
         # db_url.screenshot_path = screenshot_path
         # db_url.updated_at = func.now()
         # db.commit()
         
+    except HTTPException:
+        raise
     except aiohttp.ClientError as e:
         logging.error(f"Network error occurred: {e}")
         raise HTTPException(status_code=502, detail="Failed to fetch the webpage for screenshot.")
@@ -643,7 +765,14 @@ async def capture_screen(
         logging.error(f"Unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail="Unable to capture screenshot.")
     
-    return {"base_url": get_settings().base_url, "screenshot_path": screenshot_path, "url": db_url.target_url}
+    return {
+        "base_url": get_settings().base_url,
+        "screenshot_path": screenshot_path,
+        "thumbnail_path": f"/static/screenshots/{screenshot.thumb_name}",
+        "webp_path": f"/static/screenshots/{screenshot.webp_name}",
+        "cached": screenshot.cached,
+        "url": db_url.target_url,
+    }
 
 @app.get("/preview_url")
 async def preview_url(
@@ -662,8 +791,10 @@ async def preview_url(
         raise HTTPException(status_code=403, detail="Forbidden")
     
     url = validate_and_correct_url(url)
-    screenshot_file_name = await capture_screenshot(url)
-    screenshot_path = f"/static/screenshots/{screenshot_file_name}"
+    screenshot = await capture_screenshot(url)
+    # ถ้า capture ไม่สำเร็จ template จะแสดงข้อความ error จาก onerror ของรูป
+    screenshot_path = f"/static/screenshots/{screenshot.file_name}" if screenshot else ""
+    webp_path = f"/static/screenshots/{screenshot.webp_name}" if screenshot else ""
 
     # กำหนดข้อความ default ถ้าไม่ได้ระบุ heading_text
     heading_text_h1 = heading_text_h1 or "URL Safety Warning"
@@ -673,6 +804,7 @@ async def preview_url(
         "request": request, 
         "url": url, 
         "screenshot_path": screenshot_path, 
+        "webp_path": webp_path,
         "heading_text_h1": heading_text_h1,
         "heading_text_h3": heading_text_h3,
         "app_path": get_settings().safe_host
@@ -715,7 +847,7 @@ async def call_preview_url_async(url: str, token: str, heading_text_h1: str = No
 async def forward_to_target_url(
         url_key: str,
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
     ):
     ''' forward short url to target url
         preview target url
@@ -729,12 +861,11 @@ async def forward_to_target_url(
         has_wildcard = True
         url_key = remove_trailing_asterisks(url_key)
 
-    if db_url := crud.get_db_url_by_key(db=db, url_key=url_key):
+    if db_url := await async_crud.get_cached_url_by_key(db=db, url_key=url_key):
         # ตรวจสอบว่าลิงก์หมดอายุแล้วหรือยัง
-        if crud.is_url_expired(db_url, timedelta(days=7)):
+        if db_url.is_expired():
             raise HTTPException(status_code=410, detail=(
-            "The URL has expired and is no longer available. "
-            "Shortened URLs are only valid for 7 days unless extended."
+            "The URL has expired and is no longer available."
         ),)
         
         if db_url.status is not None and db_url.status.lower() == "danger":
@@ -752,7 +883,7 @@ async def forward_to_target_url(
             html_content = await call_preview_url_async(db_url.target_url, SECRET_TOKEN, heading_text_h1="Link Inspector", heading_text_h3="Inspect a short link to make sure it's safe to click on.")
             return HTMLResponse(content=html_content)
             
-        crud.update_db_clicks(db=db, db_url=db_url) # นับจำนวนการเข้า url
+        click_buffer.add(db_url.key) # นับจำนวนการเข้า url (เขียนลงฐานข้อมูลเป็นรอบ)
         return RedirectResponse(db_url.target_url)  # ไปยัง url ปลายทาง
             
     else:
@@ -762,20 +893,21 @@ async def forward_to_target_url(
     # If db_url is a database entry, then you return your RedirectResponse to target_url. Otherwise, you call raise_not_found()
 
 
-@app.post("/url", response_model=schemas.URLInfo, tags=["url"]) # , dependencies=[Security(verify_api_key)]
+@app.post("/url", response_model=schemas.URLInfo, tags=["url"], dependencies=[Depends(rate_limit_api_key)])
 async def create_url(
     url: schemas.URLBase,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key),
-    api_db: Optional[Session] = Depends(get_optional_api_db),
-    blacklist_db: Session = Depends(get_blacklist_db)
+    db: AsyncSession = Depends(get_async_db),
+    principal: Principal = Depends(get_principal),
+    blacklist_db: AsyncSession = Depends(get_async_blacklist_db)
 ):
     ''' create short url
         args:
             a) target url
             b) custom key (Custom key for shortening the URL. Only available for VIP users.)
     '''
+    api_key = principal.api_key
+
     # Log original URL for debugging
     logging.info(f"[CREATE_URL] Original URL: {url.target_url}")
     logging.info(f"[CREATE_URL] Custom key: {url.custom_key}")
@@ -789,8 +921,13 @@ async def create_url(
         logging.error(f"[CREATE_URL] URL validation failed: {url.target_url}")
         raise_bad_request(message="URL ไม่ถูกต้อง / Invalid URL. กรุณาตรวจสอบว่า URL เริ่มต้นด้วย http:// หรือ https:// / Please ensure the URL starts with http:// or https://")
 
+    # เวลาหมดอายุของลิงก์ (ถ้าไม่ระบุ ลิงก์ของผู้ใช้ที่มี API key ไม่หมดอายุ)
+    expires_at = as_utc(url.expires_at)
+    if expires_at is not None and expires_at <= datetime.now(timezone.utc):
+        raise_bad_request(message="expires_at must be in the future.")
+
     # ตรวจสอบว่า URL อยู่ใน blacklist หรือไม่
-    if crud.is_url_in_blacklist(blacklist_db, url.target_url):
+    if await is_url_blacklisted(blacklist_db, url.target_url):
         logging.warning(f"[CREATE_URL] URL is in blacklist: {url.target_url}")
         raise_forbidden(message=(
             "The provided URL is in the blacklist and cannot be shortened. "
@@ -803,16 +940,14 @@ async def create_url(
         logging.warning(f"[CREATE_URL] URL flagged as phishing: {url.target_url}")
         raise_forbidden(message=phishing_check_response.content["message"])
     
-    # ดึง role_id จาก database ถ้ามีการกำหนดให้ใช้งาน
+    # role_id และ role_name ได้มาพร้อมกับการตรวจ api key (get_principal) ถ้ามีการกำหนดให้ใช้งาน
     role_id = None
-    if api_db:
-        role_id = crud.get_role_id(api_db, api_key)
+    if get_settings().use_api_db:
+        role_id = principal.role_id
         if role_id is None:
             raise HTTPException(status_code=400, detail="Invalid API key")
         
-        # ดึง role_name จากฐานข้อมูล Role
-        role_name = crud.get_role_name(api_db, role_id)
-        if role_name is None:
+        if principal.role_name is None:
             raise HTTPException(status_code=400, detail="Role not found")
         
     
@@ -834,7 +969,7 @@ async def create_url(
             logging.error(f"[CREATE_URL] Custom key too long ({len(url.custom_key)} chars): {url.custom_key}")
             raise_bad_request(message=f"รหัสที่กำหนดเองยาวเกินไป ({len(url.custom_key)} ตัวอักษร) / Custom key is too long ({len(url.custom_key)} characters). กรุณาใช้ไม่เกิน 15 ตัวอักษร / Maximum 15 characters allowed.")
 
-        if crud.get_db_url_by_customkey(db, url.custom_key):
+        if await async_crud.get_db_url_by_customkey(db, url.custom_key):
             logging.warning(f"[CREATE_URL] Custom key already in use: {url.custom_key}")
             raise_already_used(message=(
             f"รหัส '{url.custom_key}' ถูกใช้งานไปแล้ว / The custom key '{url.custom_key}' is already in use. "
@@ -849,14 +984,14 @@ async def create_url(
     # ตรวจสอบว่ามี  URL Target นี้อยู่แล้วหรือไม่สำหรับ API key นี้
     # ต้องทำเพิ่มกรณีที่มีการ custom key shorten url ให้มีการซ้ำได้ แต่ custom key ต้องไม่ซ้ำ
     
-    existing_url = crud.is_url_existing_for_key(db, url.target_url, api_key)
+    existing_url = await async_crud.is_url_existing_for_key(db, url.target_url, api_key)
     if existing_url:
         base_url = get_settings().base_url
         # qr_code_base64 = generate_qr_code(f"{base_url}/{existing_url.key}")
         url_data = {
             "target_url": existing_url.target_url,
             "is_active": existing_url.is_active,
-            "clicks": existing_url.clicks,
+            "clicks": (existing_url.clicks or 0) + click_buffer.pending(existing_url.key),
             "url": f"{base_url}/{existing_url.key}", 
             "admin_url": f"{base_url}/{existing_url.secret_key}",
             # "qr_code": f"data:image/png;base64,{qr_code_base64}",
@@ -867,22 +1002,32 @@ async def create_url(
         }
         return JSONResponse(content=url_data, status_code=409) 
 
-    db_url = crud.create_db_url(db=db, url=url, api_key=api_key)
+    # quota ตรวจและนับใน transaction เดียวกับการสร้าง จึงไม่ต้องเรียก /user/url_count ก่อน
+    try:
+        db_url = await async_crud.create_db_url(
+            db=db, url=url, api_key=api_key, quota=url_quota(principal), expires_at=expires_at,
+        )
+    except async_crud.URLQuotaExceeded as e:
+        logging.warning(f"[CREATE_URL] URL quota reached for API key: {api_key}")
+        raise_quota_exceeded(e.quota)
     logging.info(f"[CREATE_URL] Successfully created URL. Key: {db_url.key}, Target: {db_url.target_url}")
 
-    # เพิ่ม task การดึงข้อมูล title และ favicon ลงใน background
-    background_tasks.add_task(fetch_page_info_and_update, db_url)
+    # ส่ง URL ให้ enrichment worker ดึงข้อมูล title และ favicon ใน background
+    enrichment_worker.enqueue(db_url.key, db_url.target_url)
 
     return get_admin_info(db_url)
 
-@app.post("/url/guest", response_model=schemas.URLInfo, tags=["url"])
-@limiter.limit("30/minute")  # 30 requests per minute per IP
+@app.post(
+    "/url/guest",
+    response_model=schemas.URLInfo,
+    tags=["url"],
+    dependencies=[Depends(rate_limit_by_ip("url_guest", get_settings().rate_limit_guest))],
+)
 async def create_url_guest(
-    request: Request,  # Include the request argument for slowapi to apply rate limiting based on the request's IP address or other properties. 
     url: schemas.GuestURLBase,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    blacklist_db: Session = Depends(get_blacklist_db)
+    db: AsyncSession = Depends(get_async_db),
+    blacklist_db: AsyncSession = Depends(get_async_blacklist_db)
 ):
     ''' create short url for guest (without API key)
         args:
@@ -898,7 +1043,7 @@ async def create_url_guest(
         raise_bad_request(message="Your provided URL is not valid")
 
     # Check if the URL is blacklisted
-    if crud.is_url_in_blacklist(blacklist_db, url.target_url):
+    if await is_url_blacklisted(blacklist_db, url.target_url):
         raise_forbidden(message="The provided URL is blacklisted and cannot be shortened.")
 
     # Check if the URL is a phishing site
@@ -907,19 +1052,191 @@ async def create_url_guest(
         raise_forbidden(message=phishing_check_response.content["message"])
 
     # Create a new URL entry in the database for a guest user (without an API key)
-    db_url = crud.create_db_url(db=db, url=url, api_key=None)
+    expires_at = datetime.now(timezone.utc) + timedelta(days=get_settings().guest_url_ttl_days)
+    db_url = await async_crud.create_db_url(db=db, url=url, api_key=None, expires_at=expires_at)
 
-    # Add a background task to fetch title and favicon
-    background_tasks.add_task(fetch_page_info_and_update, db_url)
+    # Queue the new URL for title and favicon enrichment
+    enrichment_worker.enqueue(db_url.key, db_url.target_url)
 
     # Return the URL info including the admin URL for managing the short URL
     return get_admin_info(db_url)
 
 
-@app.get("/user/url_count", tags=["info"])
+def _batch_target(item) -> Optional[str]:
+    ''' item ของ batch เป็นได้ทั้ง "https://..." หรือ {"target_url": "https://..."} '''
+    if isinstance(item, dict):
+        item = item.get("target_url")
+    return item if isinstance(item, str) else None
+
+def _ndjson_target(line: bytes) -> Optional[str]:
+    try:
+        return _batch_target(json.loads(line))
+    except ValueError:
+        return None
+
+async def _read_ndjson_targets(request: Request, limit: int) -> list[Optional[str]]:
+    ''' อ่าน body NDJSON ให้เสร็จก่อนสร้าง StreamingResponse (ระหว่าง stream response อ่าน request ไม่ได้แล้ว)
+        เก็บไม่เกิน limit รายการ ที่เกินมาหนึ่งรายการใช้บอกว่า batch เกินขนาด '''
+    targets = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        targets.extend(_ndjson_target(line) for line in lines if line.strip())
+        if len(targets) >= limit:
+            return targets[:limit]
+    if buffer.strip():
+        targets.append(_ndjson_target(buffer))
+    return targets[:limit]
+
+async def _iter_list(items) -> AsyncIterator[Optional[str]]:
+    for item in items:
+        yield _batch_target(item)
+
+def _batch_line(index: int, status_code: int, target_url=None, db_url: models.URL = None, message: str = None) -> bytes:
+    result = {"index": index, "status_code": status_code, "target_url": target_url}
+    if db_url is not None:
+        base_url = URL(get_settings().base_url)
+        result.update(
+            url=str(base_url.replace(path=db_url.key)),
+            admin_url=str(base_url.replace(path=app.url_path_for("administration info", secret_key=db_url.secret_key))),
+            secret_key=db_url.secret_key,
+        )
+    if message:
+        result["message"] = message
+    return (json.dumps(result) + "\n").encode()
+
+async def _create_url_chunk(chunk: list, api_key: str, quota: Optional[int], summary: dict) -> list[bytes]:
+    ''' ตรวจและสร้าง short URL ทั้ง chunk: blacklist/ซ้ำ ตรวจครั้งเดียวทั้งชุด, insert ใน transaction เดียว '''
+    results = {}
+    pending: dict[str, list[int]] = {}  # normalized target -> index ของ item ที่ใช้ URL นี้
+    spellings: dict[str, str] = {}  # canonical hash -> normalized target ที่พบก่อน
+    for index, target in chunk:
+        if target is None:
+            results[index] = (400, None, None, "Each item must be a URL string or an object with target_url.")
+            continue
+        target_url = normalize_url(target, trailing_slash=False)
+        if not validators.url(target_url):
+            results[index] = (400, target_url, None, "Invalid URL. Please ensure the URL starts with http:// or https://")
+            continue
+        # ตัวสะกดอื่นของ URL เดียวกัน (เช่น encoding ต่างกัน) ใน batch ใช้รายการแรก
+        target_url = spellings.setdefault(canonical_hash(target_url), target_url)
+        pending.setdefault(target_url, []).append(index)
+
+    targets = list(pending)
+    if blacklist_snapshot.loaded:
+        blacklisted = {target_url for target_url in targets if target_url in blacklist_snapshot}
+    else:
+        async with AsyncSessionBlacklist() as blacklist_db:
+            blacklisted = await async_crud.get_blacklisted_urls(blacklist_db, targets)
+
+    allowed = []
+    for target_url in targets:
+        if target_url in blacklisted:
+            outcome = (403, target_url, None, "The provided URL is in the blacklist and cannot be shortened.")
+        elif phishing_data.is_phishing(target_url):
+            outcome = (403, target_url, None, "The URL is flagged as a phishing site.")
+        else:
+            allowed.append(target_url)
+            continue
+        for index in pending[target_url]:
+            results[index] = outcome
+
+    async with AsyncSessionLocal() as db:
+        existing = await async_crud.get_existing_urls_for_key(db, allowed, api_key)
+        new_targets = [target_url for target_url in allowed if target_url not in existing]
+        created = await async_crud.create_db_urls(db, new_targets, api_key, quota)
+
+    # ที่เหลือจาก quota ไม่ถูกสร้าง
+    for target_url in new_targets[len(created):]:
+        for index in pending[target_url]:
+            results[index] = (403, target_url, None, f"You have reached the limit of {quota} URLs.")
+
+    for db_url in created:
+        enrichment_worker.enqueue(db_url.key, db_url.target_url)
+        first, *duplicates = pending[db_url.target_url]
+        results[first] = (201, db_url.target_url, db_url, None)
+        for index in duplicates:
+            results[index] = (409, db_url.target_url, db_url, "A short link for this website already exists.")
+    for target_url, db_url in existing.items():
+        for index in pending[target_url]:
+            results[index] = (409, target_url, db_url, "A short link for this website already exists.")
+
+    lines = []
+    for index, _ in chunk:
+        status_code, target_url, db_url, message = results[index]
+        summary["created" if status_code == 201 else "existing" if status_code == 409 else "failed"] += 1
+        lines.append(_batch_line(index, status_code, target_url, db_url, message))
+    return lines
+
+async def _create_url_batch(targets: AsyncIterator[Optional[str]], api_key: str, quota: Optional[int]) -> AsyncIterator[bytes]:
+    summary = {"created": 0, "existing": 0, "failed": 0}
+    chunk = []
+    index = 0
+    async for target in targets:
+        if index >= BATCH_MAX_ITEMS:
+            yield _batch_line(index, 413, message=f"Batch limit of {BATCH_MAX_ITEMS} URLs exceeded; remaining items were not processed.")
+            break
+        chunk.append((index, target))
+        index += 1
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            for line in await _create_url_chunk(chunk, api_key, quota, summary):
+                yield line
+            chunk = []
+    if chunk:
+        for line in await _create_url_chunk(chunk, api_key, quota, summary):
+            yield line
+    yield (json.dumps({"summary": summary}) + "\n").encode()
+
+@app.post("/url/batch", tags=["url"])
+async def create_url_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    principal: Principal = Depends(get_principal),
+):
+    ''' create many short urls in one request
+        body:
+            a) JSON array of target urls (or {"target_url": ...} objects), or {"urls": [...]}
+            b) NDJSON (Content-Type: application/x-ndjson), one target per line
+        returns NDJSON: one result per item in input order, then {"summary": ...}
+        custom keys are not supported in batch
+        rate limit: 1 request per BATCH_CHUNK_SIZE urls (at least 1)
+    '''
+    if get_settings().use_api_db and (principal.role_id is None or principal.role_name is None):
+        raise HTTPException(status_code=400, detail="Invalid API key")
+
+    if datetime.now() - phishing_data.last_update_time > timedelta(hours=12):
+        background_tasks.add_task(phishing_data.update_phishing_urls)
+
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = await _read_ndjson_targets(request, BATCH_MAX_ITEMS + 1)
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise_bad_request(message="Request body must be a JSON array of URLs or NDJSON.")
+        items = body.get("urls") if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            raise_bad_request(message="Request body must be a JSON array of URLs or NDJSON.")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_ITEMS} URLs.")
+
+    # หักตามงานจริง: 1 request ต่อ chunk ที่ตรวจและ insert
+    await charge_api_key(principal, max(1, math.ceil(min(len(items), BATCH_MAX_ITEMS) / BATCH_CHUNK_SIZE)))
+    targets = _iter_list(items)
+
+    logging.info(f"[CREATE_URL_BATCH] API key: {principal.api_key}")
+    return StreamingResponse(
+        _create_url_batch(targets, principal.api_key, url_quota(principal)),
+        media_type="application/x-ndjson",
+        background=background_tasks,
+    )
+
+@app.get("/user/url_count", tags=["info"], dependencies=[Depends(rate_limit_api_key)])
 async def get_url_count(
     api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     '''
     Query the count of URLs created with the given API key
@@ -927,44 +1244,94 @@ async def get_url_count(
         a) api key
     '''
     # Query the count of URLs created with the given API key
-    url_count = db.query(models.URL).filter(models.URL.api_key == api_key, models.URL.is_active == True).count()
+    url_count = await async_crud.get_url_count(db, api_key)
 
     # Return the count as a JSON response
     return JSONResponse(content={"url_count": url_count}, status_code=200)
 
-@app.get("/user/urls", tags=["info"])
+def _encode_cursor(row) -> str:
+    return base64.urlsafe_b64encode(str(row.id).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        # cursor รุ่นก่อนเป็น "created_at|id" ใช้เฉพาะ id
+        return int(raw.rsplit("|", 1)[-1])
+    except ValueError:
+        raise_bad_request(message="Invalid cursor")
+
+def _user_url_row(row) -> dict:
+    ''' แปลงแถวจาก get_user_urls_page เป็น dict ตาม schemas.URLUser โดยตรง (ไม่ผ่าน ORM/pydantic) '''
+    return {
+        "key": row.key,
+        "secret_key": row.secret_key,
+        "target_url": row.target_url,
+        "is_active": row.is_active,
+        "clicks": row.clicks,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "is_checked": bool(row.is_checked),
+        "status": row.status or "",
+        "title": row.title,
+        "favicon_url": row.favicon_url,
+        "expires_at": row.expires_at.isoformat() if row.expires_at else None,
+    }
+
+async def _stream_user_urls(api_key: str, after, status_filter, is_checked) -> AsyncIterator[bytes]:
+    ''' export ทั้งหมดทีละ USER_URLS_STREAM_CHUNK แถว หน่วยความจำไม่โตตามจำนวน URL '''
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = await async_crud.get_user_urls_page(
+                db, api_key, after=after, limit=USER_URLS_STREAM_CHUNK,
+                status=status_filter, is_checked=is_checked,
+            )
+        if not rows:
+            return
+        yield "".join(json.dumps(_user_url_row(row)) + "\n" for row in rows).encode()
+        if len(rows) < USER_URLS_STREAM_CHUNK:
+            return
+        after = rows[-1].id
+
+@app.get("/user/urls", tags=["info"], dependencies=[Depends(rate_limit_api_key)])
 async def get_user_url(
+    limit: Optional[int] = Query(None, ge=1, le=USER_URLS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    is_checked: Optional[bool] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     api_key: str = Depends(verify_api_key), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     ''' Query the database to get the URLs
         args:
             a) api key
+            b) limit: จำนวนต่อหน้า [option] ถ้ามีหน้าถัดไปจะส่ง cursor กลับใน header X-Next-Cursor
+            c) cursor: ค่า X-Next-Cursor จากหน้าก่อน [option]
+            d) status, is_checked: filter [option]
+            e) format: json (default) หรือ ndjson สำหรับ export ทั้งหมดแบบ streaming
+        เรียงตาม id (ลำดับที่สร้าง เก่าไปใหม่)
     '''
-    # Query the database to get the URLs
-    user_urls = db.query(models.URL).filter(models.URL.api_key == api_key, models.URL.is_active == True).all()
-    
-    # Convert the results to JSON serializable form
-    user_urls_json = jsonable_encoder(user_urls)
-
-    # Use Pydantic models to filter and return the desired fields
-    ## filtered_urls = [schemas.URLUser(**url).model_dump() for url in user_urls_json]
-
-    # Use Pydantic models to filter and return the desired fields
-    filtered_urls = []
-    for url in user_urls_json:
-        if url.get('status') is None:
-            url['status'] = ''  # or another default value
-        filtered_urls.append(schemas.URLUser(**url).model_dump())
-
- 
-    # ใช้ jsonable_encoder เพื่อแปลง datetime ให้เป็น string
-    json_compatible_data = jsonable_encoder(filtered_urls)
-    
-    return JSONResponse(content=json_compatible_data, status_code=200)
-    # return JSONResponse(content=user_urls_json, status_code=200) # return all value
+    after = _decode_cursor(cursor) if cursor else None
 
-@app.post("/user/url/status", response_model=List[schemas.ScanStatus], tags=["info"])
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_user_urls(api_key, after, status_filter, is_checked),
+            media_type="application/x-ndjson",
+        )
+
+    # ขอเกิน 1 แถวเพื่อรู้ว่ามีหน้าถัดไปหรือไม่
+    rows = await async_crud.get_user_urls_page(
+        db, api_key, after=after, limit=limit + 1 if limit else None,
+        status=status_filter, is_checked=is_checked,
+    )
+    headers = {}
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+
+    return JSONResponse(content=[_user_url_row(row) for row in rows], status_code=200, headers=headers)
+
+@app.post("/user/url/status", response_model=List[schemas.ScanStatus], tags=["info"], dependencies=[Depends(rate_limit_api_key)])
 def get_url_scan_status(
     secret_key: str = Body(...),  # รับค่า secret_key จาก body
     target_url: str = Body(...),  # รับค่า target_url จาก body
@@ -1015,16 +1382,46 @@ def get_url_scan_status(
         for record in scan_records
     ]
 
+@app.post("/user/urls/status", response_model=List[schemas.ScanStatus], tags=["info"], dependencies=[Depends(rate_limit_api_key)])
+async def get_urls_scan_status(
+    batch: schemas.ScanStatusBatch,
+    api_key: str = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_async_db),
+):
+    ''' get the latest scan result of many URLs in one call (for the dashboard list)
+    args:
+        a) urls: target urls of this api key (max SCAN_STATUS_MAX_URLS)
+        b) scan type: name of scan vendor ex. google [option]
+        c) api key
+    URLs without scan records or not owned by the api key are left out.
+    '''
+    if len(batch.urls) > SCAN_STATUS_MAX_URLS:
+        raise_bad_request(message=f"At most {SCAN_STATUS_MAX_URLS} URLs per request.")
+
+    normalized_urls = list({normalize_url(url, trailing_slash=False) for url in batch.urls})
+    scan_records = await async_crud.get_latest_scan_records(db, api_key, normalized_urls, batch.scan_type)
+
+    return [
+        schemas.ScanStatus(
+            url=record.url,
+            status=record.status if record.status is not None else "None",
+            result=record.result,
+            scan_type=record.scan_type,
+            timestamp=record.timestamp
+        )
+        for record in scan_records
+    ]
+
 @app.get(
     "/admin/{secret_key}",
     name="administration info",
     response_model=schemas.URLInfo,
     tags=["admin"],
 )  # Removed Security dependency
-def get_url_info(
+async def get_url_info(
     secret_key: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     api_key: str = Depends(verify_api_key)  # Added api_key dependency
 ):
     '''get url information 
@@ -1032,21 +1429,28 @@ def get_url_info(
             a) secret key of url
             b) api key
     '''
-    if db_url := crud.get_db_url_by_secret_key(db, secret_key=secret_key, api_key=api_key):
+    # secret key ที่อยู่ใน cache แต่เป็นของ API key อื่น ตอบ 404 ได้ทันทีโดยไม่ต้อง query
+    cached_url = url_cache.get_by_secret_key(secret_key)
+    if cached_url is not None and cached_url.api_key != api_key:
+        raise_not_found(request)
+
+    if db_url := await async_crud.get_db_url_by_secret_key(db, secret_key=secret_key, api_key=api_key):
+        if cached_url is None:
+            url_cache.put(CachedURL.from_db_url(db_url))
         return get_admin_info(db_url)
     else:
         raise_not_found(request)
 
 
 @app.delete("/admin/{secret_key}", tags=["admin"])  # Removed Depends dependency
-def delete_url(
+async def delete_url(
     secret_key: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     api_key: str = Depends(verify_api_key)  # Added api_key dependency
 ):
     """delete url in database"""
-    if db_url := crud.deactivate_db_url_by_secret_key(db, secret_key=secret_key, api_key=api_key):
+    if db_url := await async_crud.deactivate_db_url_by_secret_key(db, secret_key=secret_key, api_key=api_key):
         message = f"Successfully deleted shortened URL for '{unquote(db_url.target_url)}'"
         return {"detail": message}
     else:
@@ -2,13 +2,15 @@
 
 from datetime import datetime, timedelta
 
-from sqlalchemy import Boolean, Column, Date, ForeignKey, Integer, String, DateTime, event
+from sqlalchemy import BigInteger, Boolean, Column, Date, ForeignKey, Index, Integer, String, DateTime, event
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import mapper
 
 from database import Base, BaseAPI, BaseBlacklist
 
+from .url_cache import url_cache
+
 class URL(Base):
     __tablename__ = "urls"  # ชื่อ table ใน sqlite
 
@@ -16,6 +18,7 @@ class URL(Base):
     key = Column(String, unique=True, index=True)           # shorten 
     secret_key = Column(String, unique=True, index=True)    # a secret key to the user to manage their shortened URL and see statistics.
     target_url = Column(String, index=True)                 # to store the URL strings for which your app provides shortened URLs.
+    canonical_hash = Column(String(64))                     # sha256 ของ canonical URL (canonical.py) สำหรับตรวจ URL ซ้ำ
     is_active = Column(Boolean, default=True)               # false is delete
     clicks = Column(Integer, default=0)     # this field will increase the integer each time someone clicks the shortened link.
     api_key = Column(String, index=True)  # เพิ่มฟิลด์นี้เพื่อเก็บ API key
@@ -25,8 +28,35 @@ class URL(Base):
     status = Column(String) # เก็บสถานะว่าเป็น url อันตรายหรือไม่ เช่น safe, danger, no info
     title = Column(String(255)) # title page
     favicon_url = Column(String(255)) # favicon url
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)  # เวลาหมดอายุ (guest = สร้าง + 7 วัน, NULL = ไม่หมดอายุ)
     ### expiry_info = relationship("URLExpiry", back_populates="url", uselist=False)
 
+    __table_args__ = (
+        Index("ix_urls_api_key_id", "api_key", "id"),  # สำหรับ /user/urls แบบแบ่งหน้า
+        Index("ix_urls_api_key_canonical_hash", "api_key", "canonical_hash"),  # ตรวจ URL ซ้ำของ api key
+    )
+
+class KeyAllocator(Base):
+    __tablename__ = "key_allocator"  # ตัวนับสำหรับแจก short key เป็นช่วงๆ ให้แต่ละ worker (ดู keygen.py)
+
+    name = Column(String(32), primary_key=True)
+    key_length = Column(Integer, nullable=False)   # ความยาวของ key ที่กำลังแจกอยู่
+    next_value = Column(BigInteger, nullable=False, default=0)  # ค่าถัดไปที่ยังไม่ถูกแจก ในช่วง [0, 62**key_length)
+
+class URLCounter(Base):
+    __tablename__ = "url_counters"  # จำนวน URL ที่ active ของแต่ละ api key (อัปเดตใน transaction เดียวกับการสร้าง/ลบ URL)
+
+    api_key = Column(String, primary_key=True)
+    active_urls = Column(Integer, nullable=False, default=0)
+
+class JobLease(Base):
+    __tablename__ = "job_leases"  # งานตามรอบที่ให้ worker เดียวทำ (ดู job_scheduler.py)
+
+    name = Column(String(64), primary_key=True)
+    holder = Column(String(128), nullable=False)                # worker ที่ถือ lease อยู่ (host:pid:id)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    last_run_at = Column(DateTime(timezone=True), nullable=True)  # เวลาเริ่มรอบล่าสุด ใช้กำหนดรอบถัดไปแม้ leader เปลี่ยน
+
 class URL2Check(Base):
     __tablename__ = "urls_to_check" # สำหรับ โปรแกรม ตรวจสอบดึงข้อมูลไปอ่านเพื่อทำการ scan 
 
@@ -45,6 +75,12 @@ class scan_records(Base):
     scan_id = Column(String)
     sha256 = Column(String)
 
+    __table_args__ = (
+        # /user/url/status และ /user/urls/status: หา scan ล่าสุดของ URL (และ scan_type)
+        Index("ix_scan_records_url_timestamp", "url", "timestamp"),
+        Index("ix_scan_records_url_scan_type_timestamp", "url", "scan_type", "timestamp"),
+    )
+
 class APIKey(BaseAPI):
     __tablename__ = "api_key"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -70,4 +106,10 @@ class Blacklist(BaseBlacklist):
 # ฟังก์ชันนี้จะทำให้แน่ใจว่า updated_at ถูกอัปเดตเมื่อมีการอัปเดตแถว
 @event.listens_for(URL, 'before_update')
 def receive_before_update(mapper, connection, target):
-    target.updated_at = func.now()
\ No newline at end of file
+    target.updated_at = func.now()
+
+# ล้าง cache ของ short URL เมื่อแถวถูกแก้ไขผ่าน ORM (เช่น is_active, status) หรือถูกลบ
+@event.listens_for(URL, 'after_update')
+@event.listens_for(URL, 'after_delete')
+def receive_after_change(mapper, connection, target):
+    url_cache.invalidate(key=target.key, secret_key=target.secret_key)
@@ -1,9 +1,78 @@
+import hashlib
 import requests
 from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from canonical import canonical_digest
+
+
+def _digest(value: str) -> int:
+    """64-bit hash ของสตริง เก็บเป็น int แทนสตริงเต็มเพื่อประหยัดหน่วยความจำ"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _url_digest(url: str) -> int:
+    """64 bit แรกของ canonical hash (canonical.py) ใช้กับ URL เต็มจาก feed"""
+    return int.from_bytes(canonical_digest(url)[:8], "big")
+
+
+class PhishingMatcher:
+    """Read-only index over the phishing feeds.
+
+    * full URLs (OpenPhish) match on their canonical form (canonical.py), so
+      other encodings of a listed URL match too
+    * bare domains (Phishing Army) match the host and every subdomain of it,
+      by walking the host's parent domains (``a.b.evil.com`` -> ``b.evil.com``
+      -> ``evil.com``); the TLD alone is never looked up
+
+    Both sets hold 64-bit hashes rather than strings. A matcher is never
+    modified after it is built; refreshing the feeds builds a new one.
+    """
+
+    __slots__ = ("_urls", "_domains")
+
+    def __init__(self, entries: Iterable[str] = ()):
+        urls, domains = set(), set()
+        for entry in entries:
+            entry = entry.strip()
+            if not entry or entry.startswith("#"):
+                continue
+            if "://" in entry:
+                urls.add(_url_digest(entry))
+            else:
+                domains.add(_digest(entry.rstrip(".").lower()))
+        self._urls = frozenset(urls)
+        self._domains = frozenset(domains)
+
+    def __len__(self) -> int:
+        return len(self._urls) + len(self._domains)
+
+    def match(self, url: str) -> Optional[str]:
+        """Return "url" or "domain" for a flagged URL, otherwise None."""
+        if _url_digest(url) in self._urls:
+            return "url"
+        if not self._domains:
+            return None
+        try:
+            host = urlsplit(url.strip()).hostname
+        except ValueError:
+            return None
+        if not host:
+            return None
+        labels = host.rstrip(".").split(".")
+        for i in range(len(labels) - 1):
+            if _digest(".".join(labels[i:])) in self._domains:
+                return "domain"
+        return None
+
+    def __contains__(self, url: str) -> bool:
+        return self.match(url) is not None
+
 
 class PhishingData:
     def __init__(self):
-        self.phishing_urls = []
+        self.matcher = PhishingMatcher()
         self.last_update_time = datetime.min
     
     def fetch_openphish_urls(self):
@@ -35,11 +104,19 @@ class PhishingData:
         openphish_urls = self.fetch_openphish_urls()
         phishing_army_urls = self.fetch_phishing_army_urls()
 
-        # รวมรายการ URL จากทั้งสองแหล่ง
-        self.phishing_urls = list(set(openphish_urls + phishing_army_urls))
+        # รวมรายการ URL จากทั้งสองแหล่ง แล้วสร้าง index ใหม่ทั้งก้อนก่อนสลับ
+        # (การกำหนดค่า attribute เป็น atomic, ผู้ตรวจจะเห็น index เก่าหรือใหม่เท่านั้น)
+        matcher = PhishingMatcher(openphish_urls + phishing_army_urls)
         self.last_update_time = datetime.now()
+        if len(matcher) == 0 and len(self.matcher) > 0:
+            print("Phishing feeds returned no entries, keeping the previous index.")
+            return
+        self.matcher = matcher
         print("Phishing feeds updated successfully from OpenPhish and Phishing Army.")
     
+    def is_phishing(self, url: str) -> bool:
+        return url in self.matcher
+
     def update_phishing_urls(self):
         if datetime.now() - self.last_update_time > timedelta(hours=12):
             self.fetch_phishing_urls()
@@ -0,0 +1,154 @@
+# shortener_app/principal_cache.py
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+
+from . import async_crud
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis เป็น optional ใช้ cache ในหน่วยความจำแทน
+    aioredis = None
+
+
+class Principal(NamedTuple):
+    """API key ที่ตรวจสอบแล้ว พร้อม role (ไม่ใช่ ORM object)"""
+    api_key: str
+    role_id: Optional[int]
+    role_name: Optional[str]
+
+
+_MISSING = object()
+
+
+class PrincipalCache:
+    """Short-TTL cache of api_key -> Principal, including unknown keys.
+
+    With REDIS_URL set, entries live in Redis so that every uvicorn worker
+    sees an invalidation at once; otherwise a per-process dict is used and
+    other workers catch up within ``ttl`` seconds. Redis errors fall back
+    to the database.
+    """
+
+    KEY_PREFIX = "principal:"
+    MAX_LOCAL_ENTRIES = 10000
+
+    def __init__(self, ttl: float, redis_url: str = ""):
+        self.ttl = ttl
+        self._local: dict[str, tuple[float, Optional[Principal]]] = {}
+        self._lock = threading.Lock()
+        self._redis = aioredis.from_url(redis_url) if redis_url and aioredis else None
+        if redis_url and aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed, using a local principal cache")
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.redis_errors = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "local"
+
+    def _redis_key(self, api_key: str) -> str:
+        # ไม่เก็บ api key ตรงๆ ใน Redis
+        return self.KEY_PREFIX + hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    async def _get(self, api_key: str):
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._redis_key(api_key))
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Principal cache read failed: {e}")
+                return _MISSING
+            if raw is None:
+                return _MISSING
+            data = json.loads(raw)
+            return Principal(**data) if data else None
+
+        with self._lock:
+            item = self._local.get(api_key)
+            if item is None:
+                return _MISSING
+            expires_at, principal = item
+            if expires_at < time.monotonic():
+                del self._local[api_key]
+                return _MISSING
+            return principal
+
+    async def _set(self, api_key: str, principal: Optional[Principal]) -> None:
+        if self._redis is not None:
+            payload = json.dumps(principal._asdict() if principal else None)
+            try:
+                await self._redis.set(self._redis_key(api_key), payload, ex=max(int(self.ttl), 1))
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Principal cache write failed: {e}")
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if len(self._local) >= self.MAX_LOCAL_ENTRIES:
+                # รวม key ที่ไม่ถูกต้องด้วย จึงต้องจำกัดขนาด
+                self._local = {k: v for k, v in self._local.items() if v[0] >= now}
+                if len(self._local) >= self.MAX_LOCAL_ENTRIES:
+                    self._local.clear()
+            self._local[api_key] = (now + self.ttl, principal)
+
+    async def resolve(self, db: AsyncSession, api_key: str) -> Optional[Principal]:
+        """Return the principal for ``api_key``, or None if the key is unknown."""
+        cached = await self._get(api_key)
+        if cached is not _MISSING:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        row = await async_crud.get_principal(db, api_key)
+        principal = Principal(*row) if row else None
+        await self._set(api_key, principal)
+        return principal
+
+    async def invalidate(self, api_key: str) -> None:
+        """Drop a key after it was registered, re-assigned or deleted."""
+        self.invalidations += 1
+        with self._lock:
+            self._local.pop(api_key, None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self._redis_key(api_key))
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Principal cache invalidation failed: {e}")
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "ttl_seconds": self.ttl,
+            "local_size": len(self._local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "redis_errors": self.redis_errors,
+        }
+
+
+principal_cache = PrincipalCache(
+    ttl=get_settings().principal_cache_ttl,
+    redis_url=get_settings().redis_url,
+)
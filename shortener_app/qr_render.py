@@ -0,0 +1,103 @@
+# shortener_app/qr_render.py
+# QR code rendering shared by shortener_app and user_management.
+#
+# The module matrix is read once into a byte buffer and scaled up with a
+# single NEAREST resize instead of putpixel() per pixel; finished PNGs are
+# kept in an LRU cache keyed by (data, ecc, scale, logo). Like browser_pool,
+# this module must only depend on Pillow, qrcodegen and the standard library.
+
+import base64
+import os
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageDraw
+from qrcodegen import QrCode
+
+LOGO_PADDING = 10  # พื้นที่ว่างรอบโลโก้ (pixel)
+
+
+def render_qr_image(data: str, ecc: QrCode.Ecc = QrCode.Ecc.MEDIUM, scale: int = 5) -> Image.Image:
+    """QR code as a 1-bit image, ``scale`` pixels per module, no quiet zone."""
+    qr = QrCode.encode_text(data, ecc)
+    size = qr.get_size()
+    modules = bytes(
+        0 if qr.get_module(x, y) else 255
+        for y in range(size)
+        for x in range(size)
+    )
+    img = Image.frombytes('L', (size, size), modules)
+    img = img.resize((size * scale, size * scale), Image.Resampling.NEAREST)
+    return img.convert('1', dither=Image.Dither.NONE)
+
+
+@lru_cache(maxsize=8)
+def _load_logo(logo_path: str, mtime: float, max_logo_size: int) -> Image.Image:
+    """Logo resized to fit ``max_logo_size``, keeping its aspect ratio.
+    ``mtime`` is part of the key so a replaced logo file is picked up."""
+    with Image.open(logo_path) as logo:
+        logo.load()
+        logo_width, logo_height = logo.size
+        logo_ratio = logo_width / logo_height
+
+        if logo_width > logo_height:
+            new_logo_width = max_logo_size
+            new_logo_height = int(max_logo_size / logo_ratio)
+        else:
+            new_logo_height = max_logo_size
+            new_logo_width = int(max_logo_size * logo_ratio)
+
+        return logo.resize((new_logo_width, new_logo_height))
+
+
+def _add_logo(img: Image.Image, logo: Image.Image) -> Image.Image:
+    img_size = img.size[0]
+    logo_width, logo_height = logo.size
+
+    # ขยายพื้นที่รอบโลโก้ (ขยายพื้นที่ตรงกลางของ QR Code)
+    logo_position = ((img_size - logo_width - LOGO_PADDING) // 2,
+                     (img_size - logo_height - LOGO_PADDING) // 2)
+
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([(logo_position[0] - LOGO_PADDING, logo_position[1] - LOGO_PADDING),
+                    (logo_position[0] + logo_width + LOGO_PADDING,
+                     logo_position[1] + logo_height + LOGO_PADDING)],
+                   fill="white")
+
+    # วางโลโก้ตรงกลาง QR Code
+    img = img.convert("RGB")
+    img.paste(logo, logo_position, mask=logo)
+    return img
+
+
+@lru_cache(maxsize=int(os.getenv("QR_CACHE_SIZE", "1024")))
+def _render_png_base64(data: str, ecc: QrCode.Ecc, scale: int,
+                       logo_path: Optional[str], logo_mtime: Optional[float]) -> str:
+    img = render_qr_image(data, ecc, scale)
+    if logo_path:
+        max_logo_size = img.size[0] // 5  # ขยายพื้นที่ตรงกลางให้ใหญ่ขึ้น
+        img = _add_logo(img, _load_logo(logo_path, logo_mtime, max_logo_size))
+
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+def qr_code_base64(data: str, ecc: QrCode.Ecc = QrCode.Ecc.MEDIUM, scale: int = 5,
+                   logo_path: Optional[str] = None) -> str:
+    """Base64 PNG of a QR code, served from the LRU cache when possible."""
+    logo_mtime = os.path.getmtime(logo_path) if logo_path else None
+    return _render_png_base64(data, ecc, scale, logo_path, logo_mtime)
+
+
+def qr_cache_stats() -> dict:
+    info = _render_png_base64.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0,
+    }
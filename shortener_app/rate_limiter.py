@@ -0,0 +1,190 @@
+# shortener_app/rate_limiter.py
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis เป็น optional ใช้ตัวนับภายใน process แทน
+    aioredis = None
+
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimit(NamedTuple):
+    """``requests`` per ``period`` seconds, e.g. RateLimit.parse("30/minute")."""
+    requests: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["RateLimit"]:
+        """Parse "<count>/<second|minute|hour|day>"; empty or 0 means unlimited (None)."""
+        value = (value or "").strip()
+        if not value:
+            return None
+        count, _, unit = value.partition("/")
+        unit = unit.strip().lower().rstrip("s") or "minute"
+        if unit not in PERIODS:
+            raise ValueError(f"Unknown rate limit period: {value!r}")
+        if int(count) <= 0:
+            return None
+        return cls(int(count), PERIODS[unit])
+
+    @property
+    def refill_rate(self) -> float:
+        return self.requests / self.period
+
+    def __str__(self) -> str:
+        unit = next((name for name, seconds in PERIODS.items() if seconds == self.period), None)
+        return f"{self.requests}/{unit}" if unit else f"{self.requests}/{self.period:g}s"
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float  # วินาทีจนกว่าจะมี token พอ (0 ถ้าผ่าน)
+
+
+# Token bucket ใน Redis: อ่าน เติม และหัก token ใน EVALSHA ครั้งเดียว ใช้เวลาของ Redis
+# เพื่อไม่ให้นาฬิกาที่ต่างกันของแต่ละ node มีผล
+# KEYS[1] = bucket, ARGV = capacity, refill ต่อวินาที, cost
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, math.floor(tokens), tostring(retry_after)}
+"""
+
+
+class LocalTokenBuckets:
+    """Same token bucket as TOKEN_BUCKET_SCRIPT, kept in this process.
+    Used without REDIS_URL (development, tests) and while Redis is down."""
+
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}  # key -> (tokens, เวลาที่คำนวณล่าสุด)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitResult:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (limit.requests, now))
+            tokens = min(limit.requests, tokens + (now - ts) * limit.refill_rate)
+            if tokens >= cost:
+                result = RateLimitResult(True, int(tokens - cost), 0.0)
+                tokens -= cost
+            else:
+                result = RateLimitResult(False, int(tokens), (cost - tokens) / limit.refill_rate)
+            if key not in self._buckets and len(self._buckets) >= self.MAX_KEYS:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+        return result
+
+    def _prune(self, now: float) -> None:
+        # bucket ที่ไม่ได้ใช้นานเกิน 1 วันเต็มแล้วแน่นอน ถ้ายังล้นให้ล้างทั้งหมด
+        stale = [key for key, (_, ts) in self._buckets.items() if now - ts > PERIODS["day"]]
+        for key in stale:
+            del self._buckets[key]
+        if len(self._buckets) >= self.MAX_KEYS:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """Token-bucket rate limiter shared by every uvicorn worker and node.
+
+    With REDIS_URL set each check is one EVALSHA of TOKEN_BUCKET_SCRIPT, so
+    a limit holds across the whole deployment instead of per process.
+    Without Redis, or when a Redis call fails, LocalTokenBuckets stands in
+    (the limit then applies per process). Bucket keys never contain the raw
+    API key.
+    """
+
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, redis_url: str = ""):
+        self._redis = aioredis.from_url(redis_url) if redis_url and aioredis else None
+        if redis_url and aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed, rate limits apply per process")
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT) if self._redis is not None else None
+        self._local = LocalTokenBuckets()
+        self.allowed = 0
+        self.limited = 0
+        self.redis_errors = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "local"
+
+    def bucket_key(self, scope: str, identity: str) -> str:
+        return f"{self.KEY_PREFIX}{scope}:{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]}"
+
+    async def hit(self, scope: str, identity: str, limit: RateLimit, cost: int = 1) -> RateLimitResult:
+        """Take ``cost`` tokens from the bucket of ``identity`` under ``scope``."""
+        key = self.bucket_key(scope, identity)
+        result = None
+        if self._script is not None:
+            try:
+                allowed, remaining, retry_after = await self._script(
+                    keys=[key], args=[limit.requests, limit.refill_rate, cost],
+                )
+                result = RateLimitResult(bool(allowed), int(remaining), float(retry_after))
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"Rate limit check in Redis failed, using the local limiter: {e}")
+        if result is None:
+            result = self._local.hit(key, limit, cost)
+
+        if result.allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return result
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "redis_errors": self.redis_errors,
+            "local_buckets": len(self._local),
+        }
+
+
+def retry_after_seconds(result: RateLimitResult) -> int:
+    return max(1, math.ceil(result.retry_after))
+
+
+rate_limiter = RateLimiter(redis_url=get_settings().redis_url)
@@ -7,6 +7,7 @@ from typing import Optional
 class URLBase(BaseModel):
     target_url: str
     custom_key: str = Field(None, description="Custom key for shortening the URL. Only available for VIP users.")
+    expires_at: Optional[datetime] = Field(None, description="When the short URL stops working (ISO 8601, UTC if no offset). Empty = never.")
     
     class Config:
         json_schema_extra = {
@@ -45,6 +46,7 @@ class URLInfo(URL):
     favicon_url: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None  # ยอมรับ None
+    expires_at: Optional[datetime] = None
     # This enhances URL by requiring two additional strings, url and admin_url. 
     # You could also add the two strings url and admin_url to URL. 
     # But by adding url and admin_url to the URLInfo subclass, 
@@ -80,6 +82,7 @@ class URLUser(BaseModel):
     status: Optional[str] = Field(default="")
     title: Optional[str] = None
     favicon_url: Optional[str] = None  # เปลี่ยนจาก HttpUrl เป็น str
+    expires_at: Optional[datetime] = None
 
     model_config = ConfigDict(
         from_attributes=True
@@ -101,3 +104,16 @@ class ScanStatus(BaseModel):
     timestamp: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+class ScanStatusBatch(BaseModel):
+    """ สำหรับขอผล scan ล่าสุดของหลาย URL ในครั้งเดียว """
+    urls: list[str]
+    scan_type: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "urls": ["https://example.com", "https://example.org/page"],
+                "scan_type": None
+            }
+        }
@@ -0,0 +1,299 @@
+# shortener_app/screenshot_store.py
+# Content-addressed store for page screenshots.
+#
+# Each screenshot is stored under sha256(canonical URL + viewport) together
+# with a thumbnail, a WebP copy and a JSON sidecar (destination URL, status,
+# capture time). A fresh entry is served without touching the browser pool.
+# Like browser_pool, this module is shared with user_management and safe_view
+# and must only depend on Pillow, the standard library and canonical.py.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from PIL import Image
+
+try:
+    from canonical import get_canonical_url
+except ImportError:  # imported as shortener_app.screenshot_store (user_management, safe_view)
+    from shortener_app.canonical import get_canonical_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VIEWPORT = {'width': 1280, 'height': 720}
+
+
+class StoredScreenshot(NamedTuple):
+    key: str
+    file_name: str  # relative to the store root, e.g. "ab/ab12...png"
+    thumb_name: str
+    webp_name: str
+    url: str  # final URL after redirects
+    status: Optional[int]
+    captured_at: float
+    cached: bool  # True when served without rendering
+
+
+class ScreenshotStore:
+    """Screenshots on disk, keyed by hash, with a TTL and a size budget.
+
+    * an entry is fresh for ``ttl`` seconds after it was captured
+    * when the files exceed ``max_bytes`` the least recently served entries
+      are deleted (last access is the sidecar's mtime)
+    * concurrent requests for the same key in one process share one capture
+    """
+
+    THUMB_WIDTH = 320
+    WEBP_QUALITY = 80
+
+    def __init__(self, root: str, ttl: float = 21600, max_bytes: int = 500 * 1024 * 1024):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._inflight: dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._budget_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.captures = 0
+        self.capture_failures = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    # --- paths ---
+
+    @staticmethod
+    def key_for(url: str, viewport: Optional[dict] = None) -> str:
+        viewport = viewport or DEFAULT_VIEWPORT
+        raw = f"{get_canonical_url(url)}\n{viewport['width']}x{viewport['height']}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _names(key: str) -> dict:
+        shard = key[:2]
+        return {
+            "png": f"{shard}/{key}.png",
+            "thumb": f"{shard}/{key}.thumb.webp",
+            "webp": f"{shard}/{key}.webp",
+            "meta": f"{shard}/{key}.json",
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # --- lookup ---
+
+    def lookup(self, url: str, viewport: Optional[dict] = None) -> Optional[StoredScreenshot]:
+        """Return a fresh entry for ``url`` or None (does not render)."""
+        return self._load(self.key_for(url, viewport))
+
+    def _load(self, key: str) -> Optional[StoredScreenshot]:
+        names = self._names(key)
+        meta_path = self._path(names["meta"])
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("captured_at", 0) + self.ttl < time.time():
+            return None
+        if not os.path.exists(self._path(names["png"])):
+            return None
+        try:
+            os.utime(meta_path)  # บันทึกเวลาที่ถูกใช้ล่าสุด สำหรับ LRU
+        except OSError:
+            pass
+        return StoredScreenshot(
+            key=key,
+            file_name=names["png"],
+            thumb_name=names["thumb"] if os.path.exists(self._path(names["thumb"])) else names["png"],
+            webp_name=names["webp"] if os.path.exists(self._path(names["webp"])) else names["png"],
+            url=meta.get("url", ""),
+            status=meta.get("status"),
+            captured_at=meta["captured_at"],
+            cached=True,
+        )
+
+    # --- capture ---
+
+    async def get_or_capture(
+        self,
+        url: str,
+        capture: Callable[[str], Awaitable[tuple[str, Optional[int]]]],
+        viewport: Optional[dict] = None,
+    ) -> StoredScreenshot:
+        """Serve a fresh entry, or call ``capture(output_path)`` to render one.
+
+        ``capture`` must save a PNG to ``output_path`` and return
+        ``(final_url, status)``."""
+        key = self.key_for(url, viewport)
+        stored = self._load(key)
+        if stored is not None:
+            self.hits += 1
+            return stored
+        self.misses += 1
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self.coalesced += 1
+            return await asyncio.wrap_future(future)
+
+        try:
+            stored = await self._capture(key, capture)
+        except BaseException as e:
+            self.capture_failures += 1
+            future.set_exception(e)
+            # ไม่ให้ waiter ที่ไม่มีใครรอเตือน "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(stored)
+            return stored
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    async def _capture(self, key, capture) -> StoredScreenshot:
+        names = self._names(key)
+        png_path = self._path(names["png"])
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+
+        # ต้องลงท้ายด้วย .png เพราะ Playwright เลือกชนิดภาพจากนามสกุลไฟล์
+        tmp_path = f"{png_path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+        try:
+            final_url, status = await capture(tmp_path)
+            captured_at = await asyncio.to_thread(self._write_entry, names, tmp_path, final_url, status)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.captures += 1
+
+        # สร้างผลจากค่าที่เพิ่งเขียน ไม่อ่านกลับด้วย _load ซึ่งคืน None เมื่อ ttl=0
+        # หรือเมื่อ enforce_budget ลบ entry ใหม่ไปแล้ว (ภาพเดียวใหญ่กว่า budget)
+        stored = StoredScreenshot(
+            key=key,
+            file_name=names["png"],
+            thumb_name=names["thumb"],
+            webp_name=names["webp"],
+            url=final_url,
+            status=status,
+            captured_at=captured_at,
+            cached=False,
+        )
+
+        # ตรวจขนาดรวมหลังบันทึกไฟล์ใหม่ ไม่ให้ request ต้องรอ
+        asyncio.get_running_loop().run_in_executor(None, self.enforce_budget)
+        return stored
+
+    def _write_entry(self, names, tmp_path, final_url, status) -> float:
+        with Image.open(tmp_path) as image:
+            image.load()
+            rgb = image.convert("RGB")
+
+        webp_path = self._path(names["webp"])
+        rgb.save(f"{webp_path}.tmp", "WEBP", quality=self.WEBP_QUALITY)
+        os.replace(f"{webp_path}.tmp", webp_path)
+
+        thumb = rgb.copy()
+        thumb.thumbnail((self.THUMB_WIDTH, self.THUMB_WIDTH * rgb.height // max(rgb.width, 1)))
+        thumb_path = self._path(names["thumb"])
+        thumb.save(f"{thumb_path}.tmp", "WEBP", quality=self.WEBP_QUALITY)
+        os.replace(f"{thumb_path}.tmp", thumb_path)
+
+        os.replace(tmp_path, self._path(names["png"]))
+
+        # sidecar เขียนเป็นไฟล์สุดท้าย entry จะถูกใช้ได้ก็ต่อเมื่อมี sidecar แล้ว
+        meta_path = self._path(names["meta"])
+        captured_at = time.time()
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"url": final_url, "status": status, "captured_at": captured_at}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        return captured_at
+
+    # --- disk budget ---
+
+    def enforce_budget(self) -> int:
+        """Delete least recently used entries until the store fits in
+        ``max_bytes``. Returns the number of entries removed."""
+        if not self._budget_lock.acquire(blocking=False):
+            return 0  # มี thread อื่นกำลังลบอยู่แล้ว
+        try:
+            entries: dict[str, list] = {}  # key -> [last_used, size, paths]
+            total = 0
+            for shard in os.scandir(self.root) if os.path.isdir(self.root) else []:
+                if not shard.is_dir():
+                    continue
+                for item in os.scandir(shard.path):
+                    if item.name.endswith((".tmp", ".tmp.png")):
+                        continue
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    key = item.name.split(".", 1)[0]
+                    entry = entries.setdefault(key, [0.0, 0, []])
+                    entry[1] += stat.st_size
+                    entry[2].append(item.path)
+                    if item.name.endswith(".json"):
+                        entry[0] = stat.st_mtime
+                    total += stat.st_size
+
+            removed = 0
+            # entry ที่ไม่มี sidecar (last_used = 0) ถูกลบก่อน
+            for key, (_, size, paths) in sorted(entries.items(), key=lambda kv: kv[1][0]):
+                if total <= self.max_bytes:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                removed += 1
+            self.evictions += removed
+            return removed
+        finally:
+            self._budget_lock.release()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "captures": self.captures,
+            "capture_failures": self.capture_failures,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+_stores: dict[str, ScreenshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_screenshot_store(root: str) -> ScreenshotStore:
+    """Store for the screenshot directory ``root``, configured from
+    SCREENSHOT_CACHE_* environment variables."""
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ScreenshotStore(
+                root,
+                ttl=float(os.getenv("SCREENSHOT_CACHE_TTL", "21600")),
+                max_bytes=int(os.getenv("SCREENSHOT_CACHE_MAX_MB", "500")) * 1024 * 1024,
+            )
+        return _stores[root]
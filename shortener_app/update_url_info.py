@@ -1,4 +1,5 @@
 import asyncio
+import json
 import aiohttp
 from bs4 import BeautifulSoup
 from sqlalchemy.orm import Session
@@ -56,12 +57,21 @@ def update_db_url_page_info(db: Session, db_url: URL, title: str, favicon_url: s
     db.commit()
     db.refresh(db_url)
 
+def publish_url_updates(url_keys: list[str]):
+    """แจ้ง client ที่รอ /ws/url_update ผ่าน Redis (channel เดียวกับ URLEventHub.CHANNEL)"""
+    redis_url = get_settings().redis_url
+    if not redis_url or not url_keys:
+        return
+    import redis
+    redis.Redis.from_url(redis_url).publish("url_updates", json.dumps(url_keys))
+
 async def update_url_info(db: Session):
     """Fetch and update URL info for all URLs in the database."""
     urls = db.query(URL).filter(URL.status == "SAFE").all()
     for db_url in urls:
         title, favicon_url = await fetch_page_info(db_url.target_url)
         update_db_url_page_info(db, db_url, title, favicon_url)
+    publish_url_updates([db_url.key for db_url in urls])
 
 def main():
     db = SessionLocal()
@@ -0,0 +1,179 @@
+# shortener_app/url_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from config import get_settings
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """แปลงเป็นเวลา UTC แบบมี timezone: ค่า naive (SQLite คืนเวลา UTC แบบ naive) ถือเป็น UTC
+    ค่าที่มี offset อื่นแปลงเป็น UTC เพราะ SQLite ทิ้ง offset ตอนเขียน"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class CachedURL(NamedTuple):
+    """ข้อมูลของ short URL ที่จำเป็นสำหรับการ redirect (ไม่ใช่ ORM object)"""
+    key: str
+    secret_key: str
+    target_url: str
+    status: Optional[str]
+    api_key: Optional[str]
+    created_at: Optional[datetime]
+    is_active: bool
+    expires_at: Optional[datetime] = None  # UTC, None = ไม่หมดอายุ
+
+    @classmethod
+    def from_db_url(cls, db_url) -> "CachedURL":
+        expires_at = as_utc(db_url.expires_at)
+        if expires_at is None and db_url.api_key is None and db_url.created_at is not None:
+            # URL ของ guest ที่สร้างก่อนมีคอลัมน์ expires_at
+            expires_at = as_utc(db_url.created_at) + timedelta(days=get_settings().guest_url_ttl_days)
+        return cls(
+            key=db_url.key,
+            secret_key=db_url.secret_key,
+            target_url=db_url.target_url,
+            status=db_url.status,
+            api_key=db_url.api_key,
+            created_at=db_url.created_at,
+            is_active=bool(db_url.is_active),
+            expires_at=expires_at,
+        )
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        return self.expires_at is not None and (now or datetime.now(timezone.utc)) >= self.expires_at
+
+
+class URLCache:
+    """Bounded in-process LRU cache with a TTL for short-key lookups.
+
+    Entries are stored once, keyed by the short key, with a secondary index
+    from secret_key to short key for the /admin/{secret_key} routes. The LRU
+    bound applies to the primary entries; the secondary index follows them.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, CachedURL]]" = OrderedDict()
+        self._secret_index: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _get_locked(self, key: str) -> Optional[CachedURL]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            self._remove_locked(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove_locked(self, key: str) -> Optional[CachedURL]:
+        item = self._entries.pop(key, None)
+        if item is None:
+            return None
+        entry = item[1]
+        if self._secret_index.get(entry.secret_key) == key:
+            del self._secret_index[entry.secret_key]
+        return entry
+
+    def get(self, key: str) -> Optional[CachedURL]:
+        """Return the cached entry for a short key, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._get_locked(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def get_by_secret_key(self, secret_key: str) -> Optional[CachedURL]:
+        """Return the cached entry for a secret key, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            key = self._secret_index.get(secret_key)
+            entry = self._get_locked(key) if key is not None else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, entry: CachedURL) -> CachedURL:
+        """Store an entry, evicting the least recently used ones when full."""
+        if not self.enabled:
+            return entry
+        with self._lock:
+            self._remove_locked(entry.key)
+            self._entries[entry.key] = (time.monotonic() + self.ttl, entry)
+            if entry.secret_key:
+                self._secret_index[entry.secret_key] = entry.key
+            while len(self._entries) > self.maxsize:
+                oldest_key = next(iter(self._entries))
+                self._remove_locked(oldest_key)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, key: Optional[str] = None, secret_key: Optional[str] = None) -> None:
+        """Drop an entry by short key and/or secret key."""
+        with self._lock:
+            if key is None and secret_key is not None:
+                key = self._secret_index.get(secret_key)
+            if key is not None and self._remove_locked(key) is not None:
+                self.invalidations += 1
+
+    def invalidate_many(self, keys) -> None:
+        """Drop several entries by short key (used by the expiry jobs)."""
+        with self._lock:
+            for key in keys:
+                if self._remove_locked(key) is not None:
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._secret_index.clear()
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache (exposed through /api/metrics)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+url_cache = URLCache(
+    maxsize=get_settings().url_cache_size,
+    ttl=get_settings().url_cache_ttl,
+)
@@ -0,0 +1,133 @@
+# shortener_app/url_events.py
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, Optional
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis เป็น optional ใช้ได้เฉพาะภายใน process เดียว
+    aioredis = None
+
+
+class URLEventHub:
+    """URL-updated notifications for clients waiting on /ws/url_update and
+    /sse/url_update.
+
+    Writers call ``publish()`` with the short keys they changed; waiters
+    ``listen()`` on one key and get an asyncio.Event that is set on the next
+    update. Events are delivered in-process at once, and with REDIS_URL set
+    they also go through Redis pub/sub (``CHANNEL``, a JSON list of keys) so
+    clients connected to other uvicorn workers are woken up as well. Writers
+    outside this app can PUBLISH to the same channel.
+    """
+
+    CHANNEL = "url_updates"
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, redis_url: str = ""):
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._redis = aioredis.from_url(redis_url) if redis_url and aioredis else None
+        if redis_url and aioredis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed, URL events stay in this process")
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.redis_errors = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "local"
+
+    # --- lifecycle ---
+
+    async def start(self) -> None:
+        if self._redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    # --- waiters ---
+
+    @asynccontextmanager
+    async def listen(self, url_key: str) -> AsyncIterator[asyncio.Event]:
+        """Register before reading the current state, so an update written
+        in between is not missed."""
+        event = asyncio.Event()
+        self._waiters.setdefault(url_key, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(url_key)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[url_key]
+
+    def _deliver(self, url_keys: Iterable[str]) -> None:
+        for url_key in url_keys:
+            for event in self._waiters.get(url_key, ()):
+                if not event.is_set():
+                    event.set()
+                    self.delivered += 1
+
+    # --- writers ---
+
+    async def publish(self, url_keys: Iterable[str]) -> None:
+        url_keys = list(url_keys)
+        if not url_keys:
+            return
+        self.published += len(url_keys)
+        self._deliver(url_keys)
+        if self._redis is not None:
+            try:
+                await self._redis.publish(self.CHANNEL, json.dumps(url_keys))
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"URL event publish failed: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._deliver(json.loads(message["data"]))
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning(f"URL event subscription lost: {e}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "keys_watched": len(self._waiters),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "redis_errors": self.redis_errors,
+        }
+
+
+url_events = URLEventHub(redis_url=get_settings().redis_url)
@@ -6,10 +6,16 @@ import logging
 
 from ipaddress import ip_network, ip_address, IPv6Address, IPv4Address
 from urllib.parse import urlparse
-from playwright.async_api import async_playwright
 import aiohttp
 from aiohttp.client_exceptions import ClientConnectorError
 
+from browser_pool import get_browser_pool
+from screenshot_store import (DEFAULT_VIEWPORT, StoredScreenshot,
+                              get_screenshot_store)
+
+# Define the correct directory path relative to the project structure
+SCREENSHOT_DIR = os.path.join(os.path.dirname(__file__), "static", "screenshots")
+
 INTERNAL_IP_RANGES = [
     # IPv4 private address ranges
     ip_network("10.0.0.0/8"),
@@ -83,35 +89,20 @@ async def fetch_content_type(url):
         print(f"URL is not an HTML page, content type: {content_type}")
         return None
     '''    
-async def capture_screenshot(url: str):
-    async with async_playwright() as playwright:
-        parsed_url = urlparse(url)
-        file_name = f"{parsed_url.netloc}{parsed_url.path.replace('/', '_')}.png"
-        
-        # Define the correct directory path relative to the project structure
-        base_dir = os.path.dirname(__file__)  # Get the directory of the current script
-        output_dir = os.path.join(base_dir, "static", "screenshots")
-        os.makedirs(output_dir, exist_ok=True)  # Create the directory if it doesn't exist
-
-        # Construct the full path to save the screenshot
-        output_path = os.path.join(output_dir, file_name)
-
-        # Launch the browser and take the screenshot
-        firefox = playwright.firefox
-        browser = await firefox.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        try:
-            await page.goto(url, timeout=30000, wait_until="networkidle")
-        except Exception as e:
-            logging.error(f"Error: {e}")
-            return None
-
-        await page.screenshot(path=output_path, full_page=False)
-        await browser.close()
-
-        return file_name  # Return only the file name, not the full path
+async def capture_screenshot(url: str) -> StoredScreenshot | None:
+    """Return a screenshot of ``url`` from the screenshot store, rendering it
+    with the browser pool only when there is no fresh copy."""
+    async def render(output_path):
+        # ใช้ browser จาก pool ที่เปิดค้างไว้ แทนการเปิด Firefox ใหม่ทุกครั้ง
+        result = await get_browser_pool().screenshot(
+            url, output_path, viewport=DEFAULT_VIEWPORT, wait_until="networkidle", full_page=False)
+        return result.url, result.status
+
+    try:
+        return await get_screenshot_store(SCREENSHOT_DIR).get_or_capture(url, render, viewport=DEFAULT_VIEWPORT)
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        return None
     
 
 def is_host_active(target_url):
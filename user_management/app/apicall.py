@@ -179,6 +179,32 @@ def get_url_scan_status(secret_key: str, api_key: str, target_url: str, scan_typ
         # Return error message and a status code indicating request failure
         return {"error": "Request failed."}, 500
 
+def get_latest_scan_statuses(target_urls: list, api_key: str) -> dict:
+    """
+    ผล scan ล่าสุดของทุก URL ในรายการด้วยการเรียก API ครั้งเดียว
+    คืนค่า dict: target_url -> scan record (URL ที่ยังไม่มีผล scan จะไม่อยู่ใน dict)
+    """
+    if not target_urls:
+        return {}
+    url = current_app.config['SHORTENER_HOST'] + "/user/urls/status"
+    headers = {
+        'accept': 'application/json',
+        'Content-Type': 'application/json',
+        'X-API-KEY': api_key,
+    }
+    latest = {}
+    try:
+        # shortener_app รับได้ไม่เกิน 1000 URL ต่อครั้ง
+        for start in range(0, len(target_urls), 1000):
+            response = requests.post(url, headers=headers, json={"urls": target_urls[start:start + 1000]})
+            if response.status_code != 200:
+                return latest
+            for record in response.json():
+                latest[record['url']] = record
+    except requests.exceptions.RequestException:
+        pass
+    return latest
+
 def _create_jwt_for_script():
     """
     ฟังก์ชัน helper สำหรับสร้าง JWT โดยเฉพาะสำหรับ script
@@ -8,7 +8,7 @@ import asyncio
 from app.models import EditableHTML
 from app.main.forms import URLActionForm
 from app.utils import generate_qr_code, convert_to_localtime, capture_screenshot, validate_and_correct_url, validate_url
-from app.apicall import get_user_urls, get_url_scan_status
+from app.apicall import get_user_urls, get_url_scan_status, get_latest_scan_statuses
 
 main = Blueprint('main', __name__)
 
@@ -115,6 +115,15 @@ def preview_url_():
     # Render HTML template and pass the screenshot path and URL to it
     return render_template("main/preview.html", screenshot=screenshot_path, url=destination_url)'''
 
+def attach_latest_scan_results(user_urls):
+    # ผล scan ล่าสุดของทุก URL ในหน้า ดึงครั้งเดียว (ปุ่ม info ยังดึงประวัติทั้งหมดของ URL นั้นได้)
+    latest = get_latest_scan_statuses([url['target_url'] for url in user_urls], current_user.uid)
+    for url in user_urls:
+        record = latest.get(url['target_url'])
+        if record is not None:
+            record['timestamp'] = convert_to_localtime(record['timestamp'])
+            url['scan_results'] = ([record], 200)
+
 @main.route('/user', methods=['GET', 'POST'])
 @login_required
 def user():
@@ -138,6 +147,8 @@ def user():
         url['created_at'] = convert_to_localtime(url['created_at'])
         url['updated_at'] = convert_to_localtime(url['updated_at'])
 
+    attach_latest_scan_results(user_urls)
+
     # print("Form data:", request.form)  # Debug print
 
     if url_action_form.validate_on_submit() and 'url_secret_key' in request.form:
@@ -167,6 +178,7 @@ def user():
                 matching_url = next((url for url in user_urls if url['secret_key'] == url_secret_key), None)
                 if matching_url:
                     matching_url['scan_results'] = scan_results
+                    matching_url['scan_expanded'] = True
         
         elif 'submit_delete' in request.form:
             headers = {
@@ -210,6 +222,8 @@ def vip():
         url['created_at'] = convert_to_localtime(url['created_at'])
         url['updated_at'] = convert_to_localtime(url['updated_at'])
 
+    attach_latest_scan_results(user_urls)
+
     if url_action_form.validate_on_submit() and 'url_secret_key' in request.form:
         url_secret_key = request.form['url_secret_key']
         api_key = current_user.uid
@@ -240,6 +254,7 @@ def vip():
                 matching_url = next((url for url in user_urls if url['secret_key'] == url_secret_key), None)
                 if matching_url:
                     matching_url['scan_results'] = scan_results
+                    matching_url['scan_expanded'] = True
 
         elif 'submit_delete' in request.form:            
             headers = {
@@ -130,26 +130,7 @@ def shorten_url():
             'X-API-KEY': current_user.uid   # ใส่ API key ของคุณ 
         }
 
-        # Check URL count for the user
-        try:
-            response = requests.get(shortener_host + '/user/url_count', headers=headers)
-            info = response.json()
-            if response.status_code == 200:
-                url_count = info.get('url_count', 0)
-                url_count_message_en = f"You have created a total of {url_count} URLs"
-                if url_count >= 50 and not current_user.is_vip_or_admin():
-                    flash('You have reached the limit of 50 URLs. Please upgrade to VIP Plan for unlimited access.', 'warning')
-                    return render_template('url/shorten.html', form=form, shortener_host=shortener_host, url_data=url_data, qr_code_base64=qr_code_base64, url_count_message=url_count_message_en)
-            else:
-                flash('Failed to retrieve URL count.', 'danger')
-                return render_template('url/shorten.html', form=form, shortener_host=shortener_host, url_data=url_data, qr_code_base64=qr_code_base64, url_count_message=url_count_message_en)
-        except requests.exceptions.ConnectionError:
-            flash('Failed to connect to the server. Please try again later.', 'error')
-            return render_template('url/shorten.html', form=form, shortener_host=shortener_host, url_data=url_data, qr_code_base64=qr_code_base64, url_count_message=url_count_message_en)
-        except requests.exceptions.RequestException as req_err:
-            flash(f'An error occurred: {req_err}', 'error')
-            return render_template('url/shorten.html', form=form, shortener_host=shortener_host, url_data=url_data, qr_code_base64=qr_code_base64, url_count_message=url_count_message_en)
-
+        # จำนวน URL สูงสุดตรวจที่ shortener_app ตอนสร้าง (ตอบ 403 ถ้าเกิน quota)
         data = {
             'target_url': original_url
         }
@@ -1,11 +1,9 @@
 import asyncio
-import base64
 import logging
 import os
 import random
 import sys
 from datetime import datetime
-from io import BytesIO
 from urllib.parse import urlparse
 
 import aiohttp
@@ -13,12 +11,16 @@ import pytz
 from aiohttp.client_exceptions import ClientConnectorError
 from dateutil import parser
 from flask import current_app, url_for
-from PIL import Image, ImageDraw
-from playwright.async_api import async_playwright
 from qrcodegen import QrCode
 from wtforms.fields import Field
 from wtforms.widgets import HiddenInput
 
+# browser pool อยู่ใน shortener_app (repo เดียวกัน) ใช้ร่วมกันทั้งสามแอป
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from shortener_app.browser_pool import get_browser_pool
+from shortener_app.qr_render import qr_code_base64
+from shortener_app.screenshot_store import DEFAULT_VIEWPORT, get_screenshot_store
+
 # from wtforms.compat import text_type
 if sys.version_info[0] >= 3:
     text_type = str
@@ -76,79 +78,14 @@ def generate_otp():
 
 
 def generate_qr_code(data):
-    qr = QrCode.encode_text(data, QrCode.Ecc.QUARTILE)
-    size = qr.get_size()
-    scale = 8
-    img_size = size * scale
-    img = Image.new('1', (img_size, img_size), 'white')
-
-    # วาด QR Code ลงในภาพ
-    for y in range(size):
-        for x in range(size):
-            if qr.get_module(x, y):
-                for dy in range(scale):
-                    for dx in range(scale):
-                        img.putpixel((x * scale + dx, y * scale + dy), 0)
-
     # ระบุ path ของโลโก้ใน Flask app
     logo_path = os.path.join(current_app.root_path, 'static', '01_NT-Logo.png')
-    logo = Image.open(logo_path)
-
-    # รักษาอัตราส่วนของโลโก้
-    logo_width, logo_height = logo.size
-    logo_ratio = logo_width / logo_height
-    max_logo_size = img_size // 5  # ขยายพื้นที่ตรงกลางให้ใหญ่ขึ้น
-
-    if logo_width > logo_height:
-        new_logo_width = max_logo_size
-        new_logo_height = int(max_logo_size / logo_ratio)
-    else:
-        new_logo_height = max_logo_size
-        new_logo_width = int(max_logo_size * logo_ratio)
-
-    logo = logo.resize((new_logo_width, new_logo_height))
-
-    # ขยายพื้นที่รอบโลโก้ (ขยายพื้นที่ตรงกลางของ QR Code)
-    padding = 10  # ขยายขนาด padding รอบโลโก้
-    logo_position = ((img_size - new_logo_width - padding) // 2,
-                     (img_size - new_logo_height - padding) // 2)
-
-    draw = ImageDraw.Draw(img)
-    draw.rectangle([(logo_position[0] - padding, logo_position[1] - padding),
-                    (logo_position[0] + new_logo_width + padding,
-                     logo_position[1] + new_logo_height + padding)],
-                   fill="white")
-
-    # วางโลโก้ตรงกลาง QR Code
-    img = img.convert("RGB")
-    img.paste(logo, logo_position, mask=logo)
-
-    # แปลงภาพเป็น Base64
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-
-    return img_str
+    # วาด QR Code พร้อมโลโก้ตรงกลาง (ใช้ผลจาก cache ถ้าเคยสร้างแล้ว)
+    return qr_code_base64(data, QrCode.Ecc.QUARTILE, scale=8, logo_path=logo_path)
 
 
 def generate_qr_code_(data):
-    qr = QrCode.encode_text(data, QrCode.Ecc.MEDIUM)
-    size = qr.get_size()
-    scale = 5
-    img_size = size * scale
-    img = Image.new('1', (img_size, img_size), 'white')
-
-    for y in range(size):
-        for x in range(size):
-            if qr.get_module(x, y):
-                for dy in range(scale):
-                    for dx in range(scale):
-                        img.putpixel((x * scale + dx, y * scale + dy), 0)
-
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
+    return qr_code_base64(data, QrCode.Ecc.MEDIUM, scale=5)
 
 
 def convert_to_localtime(utc_timestamp):
@@ -205,46 +142,25 @@ async def capture_screenshot(url: str):
         print(f"URL is not an HTML page, content type: {content_type}")
         return None
     '''
-    async with async_playwright() as playwright:
-        parsed_url = urlparse(url)
-        # Replace '/' with '_' to create a valid file name
-        file_name = f"{parsed_url.netloc}{parsed_url.path.replace('/', '_')}.png"
-        # Save the screenshot in the 'static' folder
-        # output_path = f"user_management/app/static/screenshots/{file_name}"
-        output_path = os.path.join(current_app.root_path, "static",
-                                   "screenshots", file_name)
-        output_dir = os.path.join(current_app.root_path, "static", "screenshots")
-        os.makedirs(output_dir, exist_ok=True)  # Create the directory if it doesn't exist
-
-        # chromium = playwright.chromium
-        # browser = await chromium.launch(headless=True)
-        firefox = playwright.firefox
-        browser = await firefox.launch(headless=True)
-
-        # page = await browser.new_page(viewport={'width': 1280, 'height': 720})
-
-        # สร้าง context ใหม่พร้อมกำหนด User-Agent
-        context = await browser.new_context(
+    output_dir = os.path.join(current_app.root_path, "static", "screenshots")
+
+    async def render(output_path):
+        # ใช้ browser pool ร่วมกับ shortener_app แทนการเปิด Firefox ใหม่ทุก request
+        result = await get_browser_pool().screenshot(
+            url,
+            output_path,
             user_agent=
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4472.124 Safari/537.36",
-            viewport={
-                'width': 1280,
-                'height': 720
-            })
-        page = await context.new_page()
-
-        try:
-            response = await page.goto(
-                url, timeout=30000, wait_until="networkidle"
-            )  # , wait_until="domcontentloaded" "networkidle"
-            status = response.status
-            destination_url = response.url
-        except Exception as e:
-            print("The page took too long to load or cannot be accessed.")
-            logging.error(f"Error: {e}")
-            return None
-
-        await page.screenshot(path=output_path, full_page=False)
-        await browser.close()
-
-        return file_name, destination_url, status  # Return just the file name, not the full path
+            viewport=DEFAULT_VIEWPORT,
+            wait_until="networkidle")
+        return result.url, result.status
+
+    # ถ้ามีภาพของ URL นี้ใน cache ที่ยังไม่หมดอายุ จะไม่เปิด browser เลย
+    try:
+        screenshot = await get_screenshot_store(output_dir).get_or_capture(url, render, viewport=DEFAULT_VIEWPORT)
+    except Exception as e:
+        print("The page took too long to load or cannot be accessed.")
+        logging.error(f"Error: {e}")
+        return None
+
+    return screenshot.file_name, screenshot.url, screenshot.status  # Return just the file name, not the full path